@@ -0,0 +1,77 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Query
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from app.services import vector_db
+from app.services.executor import run_io
+from app.services.ingest_queue import ingest_queue
+from app.services.reindex import reindexer
+
+router = APIRouter(prefix="/admin")
+
+
+def _ann_store():
+    store = vector_db.get_store()
+    if not hasattr(store, "recall_report"):
+        return None
+    return store
+
+@router.get("/vector/recall")
+async def vector_recall(sample: int = Query(100, ge=1, le=10000), k: int = Query(10, ge=1, le=1000)):
+    """Recall@k und Latenz des ANN-Index gegenüber exakter Suche, je nprobe-Stufe."""
+    store = await run_io(_ann_store)
+    if store is None:
+        return JSONResponse(status_code=400, content={"error": "Nur für VECTOR_BACKEND=numpy verfügbar"})
+    return await run_io(store.recall_report, sample, k)
+
+@router.post("/vector/rebuild")
+async def vector_rebuild():
+    """Startet ein Neutraining des ANN-Index im Hintergrund."""
+    store = await run_io(_ann_store)
+    if store is None:
+        return JSONResponse(status_code=400, content={"error": "Nur für VECTOR_BACKEND=numpy verfügbar"})
+    started = await run_io(store.rebuild)
+    return {"started": started}
+
+class ReindexRequest(BaseModel):
+    model: Optional[str] = None
+    restart: bool = False
+
+@router.post("/reindex")
+async def start_reindex(request: Optional[ReindexRequest] = None):
+    """
+    Startet den Re-Index in eine neue Collection (oder setzt einen unterbrochenen fort).
+    Läuft bereits einer, wird nur dessen Status geliefert.
+    """
+    request = request or ReindexRequest()
+    return await run_io(reindexer.start, request.model, request.restart)
+
+@router.get("/reindex")
+async def reindex_status():
+    """Fortschritt des letzten Re-Index: Phase, verarbeitet/gesamt, docs/s, geschätzte Restzeit."""
+    status = await run_io(reindexer.status)
+    if status is None:
+        return JSONResponse(status_code=404, content={"error": "Noch kein Re-Index gestartet"})
+    return status
+
+@router.post("/reindex/cancel")
+async def cancel_reindex():
+    """Hält den laufenden Re-Index nach dem aktuellen Chunk an; POST /admin/reindex setzt ihn fort."""
+    reindexer.cancel()
+    return {"cancelled": reindexer.running}
+
+@router.get("/ingest/dead-letters")
+async def dead_letters(limit: int = Query(100, ge=1, le=10000)):
+    """Datensätze der Write-Behind-Queue, die nach INGEST_MAX_ATTEMPTS Versuchen aufgegeben wurden."""
+    return await ingest_queue.dead_letters(limit)
+
+class ReplayRequest(BaseModel):
+    chat_ids: Optional[List[str]] = None
+
+@router.post("/ingest/dead-letters/replay")
+async def replay_dead_letters(request: Optional[ReplayRequest] = None):
+    """Stellt Dead Letters (alle oder `chat_ids`) mit zurückgesetzten Versuchen wieder in die Queue."""
+    request = request or ReplayRequest()
+    return {"replayed": await ingest_queue.replay_dead_letters(request.chat_ids)}
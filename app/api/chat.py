@@ -1,40 +1,130 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from app.models.chat import ChatRequest, ChatResponse
-from app.services.llm_client import query_ollama
+from app.services.llm_client import query_ollama, stream_ollama, GenerationQueueFull
 from app.services.embedding import embedding_service
 from app.services.vector_db import add_to_vector_db
-from app.services.db import SessionLocal, ChatHistory
-from app.core.utils import generate_id, current_timestamp
+from app.services.db import ChatHistory
+from app.services.executor import run_io, run_db
+from app.services.response_cache import response_cache, CHAT_CACHE_ENABLED
+from app.services.ingest_queue import ingest_queue, INGEST_WRITE_BEHIND
+from app.services.context_builder import context_builder
+from app.core.utils import generate_id, current_timestamp, to_epoch
+from typing import Optional
+import hashlib
 import json
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+SYSTEM_PROMPT = (
+    "Antworte immer in der Sprache, in der die Frage gestellt wurde. "
+    "Wenn du dir unsicher bist, sage: 'Ich bin mir nicht sicher.' "
+    "Antworte niemals mit erfundenen Fakten oder Halluzinationen. "
+    "Gib keine Übersetzungen, sondern antworte direkt in der Eingabesprache."
+)
+# Teil des Cache-Schlüssels: eine Änderung am Systemprompt macht alte Cache-Einträge unerreichbar
+SYSTEM_PROMPT_VERSION = hashlib.sha256(SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
 
-@router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest, db: Session = Depends(get_db)):
-    system_prompt = (
-        "Antworte immer in der Sprache, in der die Frage gestellt wurde. "
-        "Wenn du dir unsicher bist, sage: 'Ich bin mir nicht sicher.' "
-        "Antworte niemals mit erfundenen Fakten oder Halluzinationen. "
-        "Gib keine Übersetzungen, sondern antworte direkt in der Eingabesprache."
-    )
-    full_prompt = f"{system_prompt}\n\nUser: {request.prompt}"
-    response = await query_ollama(full_prompt, model=request.model)
-    embedding = embedding_service.embed(request.prompt)
+def _save_chat_entry(db: Session, chat_entry: ChatHistory):
+    db.add(chat_entry)
+    db.commit()
+
+async def persist_chat(prompt: str, response: str, embedding: Optional[list] = None) -> str:
+    """
+    Speichert einen abgeschlossenen Chat in SQLite und ChromaDB und gibt die Chat-ID zurück.
+    Mit INGEST_WRITE_BEHIND (Standard) landet der Chat nur in der dauerhaften Write-Behind-Queue;
+    Embedding, Chroma und Commit erledigt der Ingest-Worker gebündelt. Sonst laufen Encoding,
+    Chroma-Schreibzugriff und Commit hier in den Executor-Pools.
+    """
     chat_id = generate_id()
     timestamp = current_timestamp()
+    if INGEST_WRITE_BEHIND:
+        await ingest_queue.enqueue(chat_id, prompt, response, timestamp, embedding)
+        return chat_id
+    if embedding is None:
+        embedding = await embedding_service.aembed(prompt)
     # Metadaten für beide Systeme vorbereiten
     metadata = {"id": chat_id, "timestamp": timestamp}
-    chroma_metadata = {"id": chat_id, "timestamp": timestamp.isoformat()}
-    add_to_vector_db(request.prompt, embedding, chroma_metadata)
-    chat_entry = ChatHistory(id=chat_id, prompt=request.prompt, response=response, timestamp=timestamp, chat_metadata=json.dumps(metadata, default=str))
-    db.add(chat_entry)
-    db.commit()
+    chroma_metadata = {"id": chat_id, "timestamp": timestamp.isoformat(), "ts": to_epoch(timestamp)}
+    await run_io(add_to_vector_db, prompt, embedding, chroma_metadata)
+    chat_entry = ChatHistory(id=chat_id, prompt=prompt, response=response, timestamp=timestamp, chat_metadata=json.dumps(metadata, default=str))
+    await run_db(_save_chat_entry, chat_entry)
+    return chat_id
+
+def _cache_namespace() -> str:
+    # Embeddings verschiedener Modelle sind nicht vergleichbar (Modellwechsel per Re-Index)
+    return f"{SYSTEM_PROMPT_VERSION}:{embedding_service.model_name}"
+
+async def _cache_lookup(request: ChatRequest):
+    """(Embedding, gecachte Antwort) – beides None, wenn der Cache aus ist."""
+    if not CHAT_CACHE_ENABLED:
+        return None, None
+    embedding = await embedding_service.aembed(request.prompt)
+    # Session-Chats hängen vom Verlauf ab: eine Antwort auf denselben Prompt passt nicht zwingend
+    if request.cache is False or request.session_id:
+        response_cache.record_bypass()
+        return embedding, None
+    hit = response_cache.lookup(request.model, _cache_namespace(), embedding)
+    return embedding, hit[0] if hit else None
+
+def _cache_store(request: ChatRequest, embedding: Optional[list], response: str):
+    if embedding is not None and not request.session_id:
+        response_cache.store(request.model, _cache_namespace(), embedding, response)
+
+async def _stream_chat(request: ChatRequest, generation, embedding: Optional[list]):
+    """
+    NDJSON-Stream: eine Zeile pro Token-Chunk, zum Schluss eine Zeile mit done=true.
+    Gespeichert wird nur einmal nach vollständigem Stream. Trennt der Client die
+    Verbindung, bricht Starlette diesen Generator ab; die Ollama-Anfrage wird dann
+    geschlossen (sofern kein anderer Request dieselbe Generierung liest) und nichts persistiert.
+    """
+    parts = []
+    try:
+        async for chunk in generation:
+            parts.append(chunk)
+            yield json.dumps({"response": chunk}) + "\n"
+    finally:
+        await generation.aclose()
+    response = "".join(parts)
+    _cache_store(request, embedding, response)
+    chat_id = await persist_chat(request.prompt, response, embedding)
+    yield json.dumps({"done": True, "id": chat_id}) + "\n"
+
+async def _stream_cached(request: ChatRequest, response: str, embedding: list):
+    # Cache-Treffer: ganze Antwort als ein Chunk
+    yield json.dumps({"response": response}) + "\n"
+    chat_id = await persist_chat(request.prompt, response, embedding)
+    yield json.dumps({"done": True, "id": chat_id, "cached": True}) + "\n"
+
+def _too_busy(e: GenerationQueueFull) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+@router.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest):
+    embedding, cached = await _cache_lookup(request)
+    if request.session_id and cached is None:
+        # Verlauf, relevante frühere Nachrichten und Zusammenfassung unter Token-Budget
+        context = await context_builder.build(SYSTEM_PROMPT, request.session_id, request.prompt, request.model, embedding)
+        full_prompt = context.prompt
+    else:
+        full_prompt = f"{SYSTEM_PROMPT}\n\nUser: {request.prompt}"
+    if request.stream:
+        if cached is not None:
+            return StreamingResponse(_stream_cached(request, cached, embedding), media_type="application/x-ndjson")
+        # Vor dem Start der Response anmelden, damit eine volle Queue noch als 429 ankommt
+        try:
+            generation = stream_ollama(full_prompt, model=request.model)
+        except GenerationQueueFull as e:
+            raise _too_busy(e)
+        return StreamingResponse(_stream_chat(request, generation, embedding), media_type="application/x-ndjson")
+    if cached is not None:
+        await persist_chat(request.prompt, cached, embedding)
+        return ChatResponse(response=cached, cached=True)
+    try:
+        response = await query_ollama(full_prompt, model=request.model)
+    except GenerationQueueFull as e:
+        raise _too_busy(e)
+    _cache_store(request, embedding, response)
+    await persist_chat(request.prompt, response, embedding)
     return ChatResponse(response=response)
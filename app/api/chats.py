@@ -1,12 +1,21 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
 from app.services.db import SessionLocal, ChatHistory
 from app.models.query import ChatHistoryItem
-from typing import List
+from typing import List, Optional, Tuple
+from datetime import datetime
+import base64
 import json
+import os
 
 router = APIRouter()
 
+CHATS_PAGE_SIZE = int(os.getenv("CHATS_PAGE_SIZE", "100"))
+CHATS_MAX_PAGE_SIZE = int(os.getenv("CHATS_MAX_PAGE_SIZE", "1000"))
+# Zeilen pro Fetch beim NDJSON-Export (serverseitiger Cursor)
+CHATS_STREAM_CHUNK = 500
 
 def get_db():
     db = SessionLocal()
@@ -15,18 +24,71 @@ def get_db():
     finally:
         db.close()
 
+def _encode_cursor(chat: ChatHistory) -> str:
+    raw = f"{chat.timestamp.isoformat()}|{chat.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        ts, chat_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(ts), chat_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Ungültiger Cursor")
+
+def _chats_query(db: Session, cursor: Optional[str]):
+    # Keyset-Pagination über (timestamp, id), absteigend; nutzt den Index auf chat_history.timestamp
+    q = db.query(ChatHistory)
+    if cursor:
+        ts, chat_id = _decode_cursor(cursor)
+        q = q.filter(or_(
+            ChatHistory.timestamp < ts,
+            and_(ChatHistory.timestamp == ts, ChatHistory.id < chat_id),
+        ))
+    return q.order_by(ChatHistory.timestamp.desc(), ChatHistory.id.desc())
+
+def _to_item(chat: ChatHistory) -> ChatHistoryItem:
+    return ChatHistoryItem(
+        id=chat.id,
+        prompt=chat.prompt,
+        response=chat.response,
+        timestamp=chat.timestamp.isoformat() if chat.timestamp else None,
+        metadata=json.loads(chat.chat_metadata) if chat.chat_metadata else {}
+    )
+
+def _stream_chats(cursor: Optional[str]):
+    # Eigene Session: der Export läuft noch, nachdem die Request-Dependency beendet ist
+    db = SessionLocal()
+    try:
+        rows = _chats_query(db, cursor).execution_options(stream_results=True).yield_per(CHATS_STREAM_CHUNK)
+        for chat in rows:
+            yield _to_item(chat).model_dump_json() + "\n"
+    finally:
+        db.close()
+
 @router.get("/chats", response_model=List[ChatHistoryItem])
-def get_all_chats(db: Session = Depends(get_db)):
-    chats = db.query(ChatHistory).order_by(ChatHistory.timestamp.desc()).all()
-    return [
-        ChatHistoryItem(
-            id=chat.id,
-            prompt=chat.prompt,
-            response=chat.response,
-            timestamp=chat.timestamp.isoformat() if chat.timestamp else None,
-            metadata=json.loads(chat.chat_metadata) if chat.chat_metadata else {}
-        ) for chat in chats
-    ]
+def get_all_chats(
+    response: Response,
+    limit: int = Query(CHATS_PAGE_SIZE, ge=1),
+    cursor: Optional[str] = Query(None),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    db: Session = Depends(get_db),
+):
+    """
+    Seitenweise Liste, neueste zuerst. Ist eine weitere Seite vorhanden, steht der Cursor
+    im Header `X-Next-Cursor`. Mit `format=ndjson` werden alle Chats (ab `cursor`) als
+    NDJSON-Stream exportiert, ohne die Liste im Speicher aufzubauen.
+    """
+    if format == "ndjson":
+        if cursor:
+            # Cursor vorab prüfen, damit ein Fehler als 400 statt als abgebrochener Stream ankommt
+            _decode_cursor(cursor)
+        return StreamingResponse(_stream_chats(cursor), media_type="application/x-ndjson")
+    limit = min(limit, CHATS_MAX_PAGE_SIZE)
+    chats = _chats_query(db, cursor).limit(limit + 1).all()
+    if len(chats) > limit:
+        chats = chats[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(chats[-1])
+    return [_to_item(chat) for chat in chats]
 
 from app.services.vector_db import remove_from_vector_db
 
@@ -41,23 +103,28 @@ def delete_chat(chat_id: str, db: Session = Depends(get_db)):
     return {"success": True}
 
 from fastapi import Body
-from datetime import datetime
 
 from app.services.embedding import embedding_service
 from app.services.vector_db import add_to_vector_db
+from app.services.executor import run_db, run_io
+from app.core.utils import to_epoch
+
+def _insert_chat(db: Session, chat_entry: ChatHistory) -> bool:
+    # Prüfen, ob Chat mit ID schon existiert
+    if db.query(ChatHistory).filter_by(id=chat_entry.id).first():
+        return False
+    db.add(chat_entry)
+    db.commit()
+    return True
 
 @router.post("/chats/restore")
-def restore_chat(
+async def restore_chat(
     id: str = Body(...),
     prompt: str = Body(...),
     response: str = Body(...),
     timestamp: str = Body(...),
     metadata: dict = Body({}),
-    db: Session = Depends(get_db)
 ):
-    # Prüfen, ob Chat mit ID schon existiert
-    if db.query(ChatHistory).filter_by(id=id).first():
-        return {"success": False, "error": "Chat mit dieser ID existiert bereits."}
     # Timestamp als datetime
     ts = datetime.fromisoformat(timestamp) if isinstance(timestamp, str) else timestamp
     chat_entry = ChatHistory(
@@ -67,9 +134,9 @@ def restore_chat(
         timestamp=ts,
         chat_metadata=json.dumps(metadata, default=str)
     )
-    db.add(chat_entry)
-    db.commit()
-    # Embedding für den Prompt erzeugen und in ChromaDB speichern
-    embedding = embedding_service.embed(prompt)
-    add_to_vector_db(prompt, embedding, {"id": id, "timestamp": timestamp})
+    if not await run_db(_insert_chat, chat_entry):
+        return {"success": False, "error": "Chat mit dieser ID existiert bereits."}
+    # Embedding für den Prompt erzeugen (Micro-Batcher) und in ChromaDB speichern
+    embedding = await embedding_service.aembed(prompt)
+    await run_io(add_to_vector_db, prompt, embedding, {"id": id, "timestamp": timestamp, "ts": to_epoch(ts)})
     return {"success": True}
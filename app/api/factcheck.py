@@ -1,11 +1,15 @@
 from fastapi import APIRouter, Body
 from pydantic import BaseModel
 from typing import List, Optional
-import httpx
-import asyncio
+import os
+import re
+
+from app.services.fact_checker import fact_checker
 
 router = APIRouter()
 
+FACTCHECK_MAX_STATEMENTS = int(os.getenv("FACTCHECK_MAX_STATEMENTS", "5"))
+
 class FactCheckRequest(BaseModel):
     text: str
     language: Optional[str] = "de"
@@ -20,37 +24,14 @@ class FactCheckResponse(BaseModel):
     results: List[FactCheckResult]
 
 
-async def search_wikipedia_async(statement: str, language: str = "de"):
-    url = f"https://{language}.wikipedia.org/w/api.php"
-    params = {
-        "action": "query",
-        "list": "search",
-        "srsearch": statement,
-        "format": "json",
-        "utf8": 1,
-    }
-    timeout = httpx.Timeout(3.0)
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        try:
-            resp = await client.get(url, params=params)
-            if resp.status_code == 200:
-                results = resp.json().get("query", {}).get("search", [])
-                if results:
-                    page = results[0]
-                    page_url = f"https://{language}.wikipedia.org/wiki/{page['title'].replace(' ', '_')}"
-                    return True, page.get("snippet"), page_url
-        except Exception as e:
-            return False, f"Fehler: {str(e)}", None
-    return False, None, None
-
 @router.post("/factcheck", response_model=FactCheckResponse)
 async def factcheck(req: FactCheckRequest):
     # Satztrennung und Limitierung
-    statements = [s.strip() for s in req.text.split('.') if s.strip()][:5]  # max 5 Sätze
-    tasks = [search_wikipedia_async(stmt, req.language) for stmt in statements]
+    statements = [s.strip() for s in re.split(r"[.!?]+", req.text) if s.strip()][:FACTCHECK_MAX_STATEMENTS]
     results = []
     try:
-        responses = await asyncio.gather(*tasks)
+        # Cache, Rate-Limit und Backend-Auswahl in app/services/fact_checker.py
+        responses = await fact_checker.check_many(statements, req.language)
         for stmt, (found, summary, url) in zip(statements, responses):
             results.append(FactCheckResult(
                 statement=stmt,
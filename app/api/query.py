@@ -1,47 +1,169 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, HTTPException
 from sqlalchemy.orm import Session
-from app.models.query import QueryRequest, QueryResult, ChatHistoryItem
-from typing import Optional
+from app.models.query import QueryRequest, QueryResult, ChatHistoryItem, SearchOptions, BatchQueryRequest, BatchQueryResult
 from app.services.embedding import embedding_service
-from app.services.vector_db import query_vector_db
-from app.services.db import SessionLocal, ChatHistory, ChatSession
+from app.services.vector_db import search_vector_db, build_where
+from app.services.db import ChatHistory
+from app.services.session_cache import session_exists_cache
+from app.services.executor import run_db, run_embed
+from app.services import lexical
+from app.core import metrics
+from typing import Awaitable, Callable, Dict, List
+import asyncio
+import logging
+import os
+import time
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+hydration_time = metrics.histogram("db_hydration_seconds", "Laden der Antworten zu Vektor-Treffern aus der DB")
 
-@router.post("/query", response_model=QueryResult)
-def query(request: QueryRequest, db: Session = Depends(get_db)):
-    import traceback
-    try:
-        embedding = embedding_service.embed(request.query)
-        score_threshold = getattr(request, 'score_threshold', 0.5) if hasattr(request, 'score_threshold') else 0.5
-        results = query_vector_db(embedding, n_results=request.n_results, score_threshold=score_threshold)
-        items = []
-        # Alle existierenden Session-IDs holen
-        session_ids = set(row[0] for row in db.query(ChatSession.id).all())
-        for doc, meta, score in zip(results.get('documents', [[]])[0], results.get('metadatas', [[]])[0], results.get('scores', [[]])[0]):
-            chat_db = db.query(ChatHistory).filter_by(id=meta.get('id')).first()
-            # Session-Filter: Nur anzeigen, wenn Session existiert
-            session_id = meta.get('session_id') or (chat_db.session_id if chat_db and hasattr(chat_db, 'session_id') else None)
-            if session_id and session_id not in session_ids:
-                continue  # Session existiert nicht mehr
-            items.append(ChatHistoryItem(
+# Über-Abruf: so viele Treffer mehr holen, dass nach dem Session-Filter meist n_results übrig bleiben
+QUERY_OVERFETCH = float(os.getenv("QUERY_OVERFETCH", "2"))
+QUERY_MAX_FETCH = int(os.getenv("QUERY_MAX_FETCH", "1000"))
+# Suchmodus, wenn der Request keinen angibt: vector, lexical oder hybrid
+QUERY_DEFAULT_MODE = os.getenv("QUERY_DEFAULT_MODE", "vector")
+# Kandidaten pro Suchweg im Modus hybrid (mindestens n_results) und Konstante k der Reciprocal Rank Fusion
+QUERY_HYBRID_CANDIDATES = int(os.getenv("QUERY_HYBRID_CANDIDATES", "50"))
+QUERY_RRF_K = int(os.getenv("QUERY_RRF_K", "60"))
+
+def _drop_orphans(db: Session, hits_per_query: List[list]) -> List[list]:
+    # Session-Filter: nur die in den Treffern referenzierten Sessions prüfen
+    referenced = {meta.get('session_id') for hits in hits_per_query for _, meta, _ in hits if meta.get('session_id')}
+    existing = session_exists_cache.existing(db, referenced) if referenced else set()
+    return [
+        [hit for hit in hits if not hit[1].get('session_id') or hit[1]['session_id'] in existing]
+        for hits in hits_per_query
+    ]
+
+def _vector_hits(db: Session, embeddings: List[list], options: SearchOptions, n: int) -> List[list]:
+    """
+    Eine Multi-Vektor-Suche für alle Queries; Filter und Score-Schwelle laufen im Backend.
+    Fehlen nach dem Entfernen verwaister Sessions Treffer, wird für die betroffenen
+    Queries mit größerem Abruf nachgelegt (bis QUERY_MAX_FETCH).
+    """
+    where = build_where(options.session_id, options.sender, options.since, options.until)
+    search_params = {"nprobe": options.nprobe} if options.nprobe else None
+    fetch = min(max(n, int(n * QUERY_OVERFETCH)), max(n, QUERY_MAX_FETCH))
+    pending = list(range(len(embeddings)))
+    final: List[list] = [[] for _ in embeddings]
+    while pending:
+        raw = search_vector_db([embeddings[i] for i in pending], fetch, options.score_threshold, where, search_params)
+        kept = _drop_orphans(db, raw)
+        retry = []
+        for i, raw_hits, hits in zip(pending, raw, kept):
+            final[i] = hits[:n]
+            # Nur nachlegen, wenn das Backend den Abruf voll ausgeschöpft hat (es gibt also mehr)
+            if len(hits) < n and len(raw_hits) >= fetch and fetch < QUERY_MAX_FETCH:
+                retry.append(i)
+        pending = retry
+        fetch = min(fetch * 2, QUERY_MAX_FETCH)
+    return final
+
+def _lexical_hits(db: Session, queries: List[str], options: SearchOptions, n: int) -> List[list]:
+    hits = [
+        lexical.search(db, q, n, options.session_id, options.sender, options.since, options.until)
+        for q in queries
+    ]
+    return _drop_orphans(db, hits)
+
+def _fuse(rankings: List[list], n: int) -> list:
+    """
+    Reciprocal Rank Fusion: Score = Summe 1 / (k + Rang) über die Suchwege. Braucht keine
+    vergleichbaren Scores (Kosinus-Ähnlichkeit vs. BM25), nur die Reihenfolge.
+    """
+    fused: Dict[str, list] = {}
+    for leg, hits in zip(("vector", "lexical"), rankings):
+        for rank, (doc, meta, score) in enumerate(hits, 1):
+            key = meta.get('id') or doc
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = [doc, dict(meta, ranks={}), 0.0]
+            entry[1]["ranks"][leg] = rank
+            entry[2] += 1.0 / (QUERY_RRF_K + rank)
+    return sorted((tuple(entry) for entry in fused.values()), key=lambda hit: hit[2], reverse=True)[:n]
+
+def _hydrate(db: Session, hits_per_query: List[list]) -> List[QueryResult]:
+    # Antworten mit einer einzigen IN (...)-Abfrage statt einer Abfrage pro Treffer laden
+    hit_ids = list({meta.get('id') for hits in hits_per_query for _, meta, _ in hits if meta.get('id')})
+    responses = {}
+    with metrics.timed(hydration_time, "db_hydrate"):
+        for i in range(0, len(hit_ids), 500):
+            rows = db.query(ChatHistory.id, ChatHistory.response).filter(ChatHistory.id.in_(hit_ids[i:i + 500]))
+            responses.update({row.id: row.response for row in rows})
+    return [
+        QueryResult(results=[
+            ChatHistoryItem(
                 id=meta.get('id'),
                 prompt=doc,
-                response=chat_db.response if chat_db else '',
+                response=responses.get(meta.get('id')) or '',
                 timestamp=meta.get('timestamp'),
                 metadata=meta,
                 score=score
-            ))
-        return QueryResult(results=items)
+            )
+            for doc, meta, score in hits
+        ])
+        for hits in hits_per_query
+    ]
+
+async def _search(queries: List[str], options: SearchOptions,
+                  embed: Callable[[], Awaitable[List[list]]]) -> List[QueryResult]:
+    """
+    Führt die Suchwege des Modus nebenläufig aus (Vektor: Encoding + Suche, lexikalisch: BM25)
+    und liefert ihre Latenz in `timings`. Ohne FTS5-Index fällt hybrid auf vector zurück.
+    """
+    n = options.n_results or 5
+    mode = options.mode or QUERY_DEFAULT_MODE
+    if mode != "vector" and not lexical.is_available():
+        if mode == "lexical":
+            raise HTTPException(status_code=400, detail="Lexikalische Suche nicht verfügbar (nur SQLite mit FTS5)")
+        mode = "vector"
+    depth = max(n, QUERY_HYBRID_CANDIDATES) if mode == "hybrid" else n
+    timings: Dict[str, float] = {}
+
+    async def vector_leg():
+        started = time.perf_counter()
+        embeddings = await embed()
+        timings["embed"] = (time.perf_counter() - started) * 1000
+        hits = await run_db(_vector_hits, embeddings, options, depth)
+        timings["vector"] = (time.perf_counter() - started) * 1000
+        return hits
+
+    async def lexical_leg():
+        started = time.perf_counter()
+        hits = await run_db(_lexical_hits, queries, options, depth)
+        timings["lexical"] = (time.perf_counter() - started) * 1000
+        return hits
+
+    if mode == "hybrid":
+        vector_hits, lexical_hits = await asyncio.gather(vector_leg(), lexical_leg())
+        final = [_fuse([v, l], n) for v, l in zip(vector_hits, lexical_hits)]
+    else:
+        final = await (lexical_leg() if mode == "lexical" else vector_leg())
+    results = await run_db(_hydrate, final)
+    timings = {leg: round(ms, 2) for leg, ms in timings.items()}
+    for result in results:
+        result.timings = timings
+    return results
+
+@router.post("/query", response_model=QueryResult)
+async def query(request: QueryRequest):
+    import traceback
+    try:
+        # Encoding über den Micro-Batcher, Vektor-Suche und DB-Zugriffe im IO-Pool
+        async def embed():
+            return [await embedding_service.aembed(request.query)]
+        return (await _search([request.query], request, embed))[0]
+    except HTTPException:
+        raise
     except Exception as e:
-        print("[Query-ERROR] Exception:", e)
-        print(traceback.format_exc())
+        logger.exception("Query fehlgeschlagen")
         return {"success": False, "error": str(e), "trace": traceback.format_exc()}
 
+@router.post("/query/batch", response_model=BatchQueryResult)
+async def query_batch(request: BatchQueryRequest):
+    """Viele Queries mit gemeinsamen Filtern: ein encode()-Durchlauf und eine Multi-Vektor-Suche."""
+    async def embed():
+        return await run_embed(embedding_service.embed_many, request.queries)
+    return BatchQueryResult(results=await _search(request.queries, request, embed))
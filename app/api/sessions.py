@@ -1,11 +1,18 @@
-from fastapi import APIRouter, Depends, Body, Query
+from fastapi import APIRouter, Depends, Body, Query, BackgroundTasks, Request
 from sqlalchemy.orm import Session
 from uuid import uuid4
 from datetime import datetime
 
 from app.services.db import SessionLocal, ChatSession, ChatMessage
+from app.services.session_cache import session_exists_cache, session_list_version
+from app.services.context_builder import context_builder
+from app.services.executor import run_db, run_io
+from app.core.utils import to_epoch
+from typing import Optional
+import logging
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 def get_db():
     db = SessionLocal()
@@ -14,23 +21,65 @@ def get_db():
     finally:
         db.close()
 
-from sqlalchemy import func
+from fastapi import HTTPException, Response
+from sqlalchemy import and_, or_
+from typing import Tuple
+import base64
+import os
+
+SESSIONS_PAGE_SIZE = int(os.getenv("SESSIONS_PAGE_SIZE", "200"))
+SESSIONS_MAX_PAGE_SIZE = int(os.getenv("SESSIONS_MAX_PAGE_SIZE", "1000"))
+
+def _encode_cursor(created_at: datetime, session_id: str) -> str:
+    raw = f"{created_at.isoformat()}|{session_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        ts, session_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(ts), session_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Ungültiger Cursor")
 
 @router.get("/sessions")
-def list_sessions(db: Session = Depends(get_db)):
-    session_data = db.query(
-        ChatSession.id,
-        ChatSession.title,
-        ChatSession.created_at,
-        func.count(ChatMessage.id).label("message_count")
-    ).outerjoin(ChatMessage, ChatSession.id == ChatMessage.session_id
-    ).group_by(ChatSession.id).order_by(ChatSession.created_at.desc()).all()
+def list_sessions(
+    request: Request,
+    response: Response,
+    limit: int = Query(SESSIONS_PAGE_SIZE, ge=1),
+    cursor: Optional[str] = Query(None),
+    db: Session = Depends(get_db),
+):
+    """
+    Sessions, neueste zuerst, seitenweise (Cursor der nächsten Seite im Header `X-Next-Cursor`).
+    Anzahl und Zeitpunkt der letzten Nachricht stehen denormalisiert in `chat_sessions`.
+    Passt `If-None-Match` zum aktuellen ETag, kommt ein 304, innerhalb von SESSIONS_ETAG_TTL
+    ohne DB-Zugriff (siehe SessionListVersion).
+    """
+    etag = session_list_version.etag(db)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    limit = min(limit, SESSIONS_MAX_PAGE_SIZE)
+    q = db.query(ChatSession.id, ChatSession.title, ChatSession.created_at,
+                 ChatSession.message_count, ChatSession.last_message_at)
+    if cursor:
+        created_at, session_id = _decode_cursor(cursor)
+        q = q.filter(or_(
+            ChatSession.created_at < created_at,
+            and_(ChatSession.created_at == created_at, ChatSession.id < session_id),
+        ))
+    session_data = q.order_by(ChatSession.created_at.desc(), ChatSession.id.desc()).limit(limit + 1).all()
+    if len(session_data) > limit:
+        session_data = session_data[:limit]
+        headers["X-Next-Cursor"] = _encode_cursor(session_data[-1].created_at, session_data[-1].id)
+    response.headers.update(headers)
     return [
         {
             "id": s.id,
             "title": s.title,
             "created_at": s.created_at.isoformat() if s.created_at else None,
-            "message_count": s.message_count
+            "message_count": s.message_count,
+            "last_message_at": s.last_message_at.isoformat() if s.last_message_at else None,
         }
         for s in session_data
     ]
@@ -46,6 +95,8 @@ def create_session(req: SessionCreateRequest, db: Session = Depends(get_db)):
     session = ChatSession(id=session_id, title=req.title, created_at=datetime.utcnow())
     db.add(session)
     db.commit()
+    session_list_version.invalidate()
+    session_exists_cache.invalidate(session_id)
     return {"id": session_id, "title": req.title, "created_at": session.created_at.isoformat()}
 
 @router.get("/sessions/{session_id}/messages")
@@ -76,8 +127,21 @@ class MessageCreateRequest(BaseModel):
     sender: str
     text: str
 
+async def _index_message(msg_id: str, session_id: str, sender: str, text: str, timestamp: datetime):
+    # Für die relevanten Treffer im Session-Kontext von /chat (nach der Response, über Micro-Batcher und IO-Pool)
+    from app.services.embedding import embedding_service
+    try:
+        embedding = await embedding_service.aembed(text)
+        await run_io(vector_db.add_many, [text], [embedding],
+                     [{"id": msg_id, "session_id": session_id, "sender": sender, "ts": to_epoch(timestamp)}])
+    except Exception:
+        logger.exception("Fehler beim Indizieren der Nachricht %s", msg_id)
+
 @router.post("/sessions/{session_id}/message")
-def add_message(session_id: str, req: MessageCreateRequest, db: Session = Depends(get_db)):
+def add_message(session_id: str, req: MessageCreateRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    session = db.query(ChatSession).filter_by(id=session_id).first()
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
     msg_id = str(uuid4())
     msg = ChatMessage(
         id=msg_id,
@@ -88,14 +152,18 @@ def add_message(session_id: str, req: MessageCreateRequest, db: Session = Depend
     )
     db.add(msg)
     # Titel der Session auf ersten User-Input setzen
-    session = db.query(ChatSession).filter_by(id=session_id).first()
     if req.sender == "user" and (session.title is None or session.title.strip() == ""):
         session.title = req.text[:60]
+    # Zähler als SQL-Ausdruck: parallele Nachrichten derselben Session gehen nicht verloren
+    session.message_count = ChatSession.message_count + 1
+    session.last_message_at = msg.timestamp
     db.commit()
+    session_list_version.invalidate()
+    background_tasks.add_task(_index_message, msg_id, session_id, req.sender, req.text, msg.timestamp)
     return {"id": msg_id, "sender": req.sender, "text": req.text, "timestamp": msg.timestamp.isoformat()}
 
 from fastapi import Query
-from app.services.vector_db import remove_from_vector_db, add_to_vector_db
+from app.services import vector_db
 from pydantic import BaseModel
 from typing import List, Optional
 
@@ -104,17 +172,24 @@ def delete_session(session_id: str, remove_vectors: bool = Query(True), db: Sess
     session = db.query(ChatSession).filter_by(id=session_id).first()
     if not session:
         return {"success": False, "error": "Session not found"}
-    # Optional: Embeddings aus ChromaDB entfernen
+    # Optional: Embeddings aus ChromaDB entfernen (ein delete pro Chunk statt pro Nachricht)
     if remove_vectors:
-        for msg in session.messages:
-            remove_from_vector_db(msg.id)
+        message_ids = [row[0] for row in db.query(ChatMessage.id).filter_by(session_id=session_id)]
+        try:
+            vector_db.delete_many(message_ids)
+        except Exception as e:
+            logger.warning("Fehler beim Entfernen der Embeddings für Session %s: %s", session_id, e)
     db.delete(session)
     db.commit()
+    session_list_version.invalidate()
+    session_exists_cache.invalidate(session_id)
+    context_builder.invalidate(session_id)
     return {"success": True}
 
 # ----- Undo/Restore Endpoint -----
 
 from fastapi.responses import JSONResponse
+from app.services import session_transfer
 
 @router.get("/sessions/export/{session_id}")
 def export_session_json(session_id: str, db: Session = Depends(get_db)):
@@ -145,63 +220,76 @@ class RestoreSessionRequest(BaseModel):
     messages: List[dict]
     restore_vectors: Optional[bool] = True
 
+def _session_exists(db: Session, session_id: str) -> bool:
+    return db.query(ChatSession.id).filter_by(id=session_id).first() is not None
+
 @router.post("/sessions/restore")
-def restore_session(req: RestoreSessionRequest, db: Session = Depends(get_db)):
+async def restore_session(req: RestoreSessionRequest):
+    """
+    Stellt eine Session aus /sessions/export/{id} wieder her – über denselben Weg wie /sessions/import:
+    ein Insert pro Chunk, Zeitstempel als naive UTC, fehlende Embeddings (auch Null-Vektoren) werden
+    mit `restore_vectors` per Micro-Batch berechnet statt Platzhalter zu speichern.
+    """
     import traceback
-    from uuid import uuid4
-    import datetime
+    session_id = req.session.get('id')
     try:
-        print("[Restore-DEBUG] Request-Body:", req)
-        session_data = req.session
         # Prüfe, ob Session schon existiert
-        if db.query(ChatSession).filter_by(id=session_data['id']).first():
+        if await run_db(_session_exists, session_id):
             return {"success": False, "error": "Session ID already exists"}
-        # created_at korrekt parsen
-        created_at = session_data.get('created_at')
-        if isinstance(created_at, str):
-            try:
-                created_at = datetime.datetime.fromisoformat(created_at)
-            except Exception:
-                created_at = datetime.datetime.utcnow()
-        elif not created_at:
-            created_at = datetime.datetime.utcnow()
-        session_obj = ChatSession(
-            id=session_data['id'],
-            title=session_data.get('title'),
-            created_at=created_at
-        )
-        db.add(session_obj)
-        # Nachrichten wiederherstellen
+        importer = session_transfer.SessionImporter(embed_missing=bool(req.restore_vectors))
+        await importer.add_session(session_id, req.session.get('title'), req.session.get('created_at'))
         for msg in req.messages:
-            print(f"[Restore-DEBUG] Restoring message: {msg}")
-            # timestamp korrekt parsen
-            ts = msg.get('timestamp')
-            if isinstance(ts, str):
-                try:
-                    ts = datetime.datetime.fromisoformat(ts)
-                except Exception:
-                    ts = datetime.datetime.utcnow()
-            elif not ts:
-                ts = datetime.datetime.utcnow()
-            msg_obj = ChatMessage(
-                id=msg['id'],
-                session_id=session_obj.id,
-                sender=msg['sender'],
-                text=msg['text'],
-                timestamp=ts
-            )
-            db.add(msg_obj)
-            # Embedding ggf. wiederherstellen
-            if req.restore_vectors:
-                try:
-                    embedding = msg.get('embedding') or [0.0]*384
-                    add_to_vector_db(msg['text'], embedding, {"id": msg['id'], "session_id": session_obj.id})
-                except Exception as e:
-                    print(f"[Restore-DEBUG] Fehler beim Restore Embedding: {e}")
-        db.commit()
-        print("[Restore-DEBUG] Restore erfolgreich!")
-        return {"success": True, "restored_session_id": session_obj.id}
+            await importer.add_message(msg['id'], session_id, msg['sender'], msg['text'], msg.get('timestamp'),
+                                       msg.get('embedding') if req.restore_vectors else None)
+        await importer.flush()
+        session_exists_cache.invalidate(session_id)
+        context_builder.invalidate(session_id)
+        logger.debug("Restore von Session %s mit %d Nachrichten erfolgreich", session_id, len(req.messages))
+        return {"success": True, "restored_session_id": session_id}
     except Exception as e:
-        print("[Restore-ERROR] Exception:", e)
-        print(traceback.format_exc())
+        logger.exception("Restore von Session %s fehlgeschlagen", session_id)
         return {"success": False, "error": str(e), "trace": traceback.format_exc()}
+
+# ----- Bulk-Export/-Import (Streaming) -----
+
+from fastapi.responses import StreamingResponse
+
+@router.get("/sessions/export")
+def export_sessions(format: str = Query("ndjson"), session_id: Optional[str] = Query(None),
+                    embeddings: bool = Query(True), db: Session = Depends(get_db)):
+    """Alle Sessions (oder eine) als Stream; Embeddings als gepacktes float32."""
+    if format not in session_transfer.MEDIA_TYPES:
+        return JSONResponse(status_code=400, content={"error": f"Unbekanntes Format: {format}"})
+    if session_id is not None and not db.query(ChatSession.id).filter_by(id=session_id).first():
+        return JSONResponse(status_code=404, content={"error": "Session not found"})
+    suffix = "ndjson" if format == "ndjson" else "lvcol"
+    filename = f"session_{session_id}.{suffix}" if session_id else f"sessions.{suffix}"
+    return StreamingResponse(
+        session_transfer.iter_export(session_id, format, embeddings),
+        media_type=session_transfer.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+@router.post("/sessions/import")
+async def import_sessions(request: Request, format: str = Query("ndjson"), embed: bool = Query(True)):
+    """
+    Import eines Exports aus /sessions/export, chunkweise aus dem Request-Body gelesen.
+    Vorhandene Sessions werden übersprungen; fehlende Embeddings nur mit `embed=true` berechnet.
+    """
+    if format not in session_transfer.MEDIA_TYPES:
+        return JSONResponse(status_code=400, content={"error": f"Unbekanntes Format: {format}"})
+    importer = session_transfer.SessionImporter(embed_missing=embed)
+    reader = session_transfer.import_ndjson if format == "ndjson" else session_transfer.import_columnar
+    try:
+        await reader(request.stream(), importer)
+        error = None
+    except (ValueError, KeyError, TypeError) as e:
+        # Bis zum Fehler geschriebene Chunks bleiben erhalten; die Antwort nennt den Stand
+        logger.warning("Session-Import abgebrochen: %s", e)
+        error = str(e) or type(e).__name__
+    for session_id in importer.touched_sessions:
+        session_exists_cache.invalidate(session_id)
+        context_builder.invalidate(session_id)
+    if error is not None:
+        return JSONResponse(status_code=400, content={"success": False, "error": error, **importer.stats})
+    return {"success": True, **importer.stats}
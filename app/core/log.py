@@ -0,0 +1,105 @@
+"""
+Strukturiertes, asynchrones Logging.
+
+Log-Aufrufe legen den Datensatz nur in eine Queue (`QueueHandler`); Formatieren und Schreiben
+nach stderr übernimmt ein eigener Thread (`QueueListener`). Request-Pfade blockieren damit nicht
+auf stdout/stderr. Mit LOG_FORMAT=json ist jede Zeile ein JSON-Objekt inkl. Request-ID.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# json oder text
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+
+# Wird von der Middleware pro Request gesetzt (Header X-Request-ID oder neu erzeugt)
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional[logging.Handler] = None
+
+# Standard-Attribute eines LogRecord; alles andere kommt über `extra=` und wird mit ausgegeben
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+
+class _RequestIdFilter(logging.Filter):
+    """Läuft im aufrufenden Thread, also dort, wo der Request-Kontext noch gilt."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Nachricht und Traceback hier auflösen (Argumente sind evtl. nicht threadsicher),
+        # die Formatierung zur Zeile übernimmt der Listener
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """Hängt den Queue-Handler an den Root-Logger; mehrfacher Aufruf ist harmlos."""
+    global _listener, _handler
+    if _listener is not None:
+        return
+    target = logging.StreamHandler(sys.stderr)
+    if fmt == "json":
+        target.setFormatter(JsonFormatter())
+    else:
+        target.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    _handler = _QueueHandler(records)
+    _handler.addFilter(_RequestIdFilter())
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel(level)
+    # httpx loggt jeden Upstream-Request auf INFO
+    logging.getLogger("httpx").setLevel(max(root.level, logging.WARNING))
+    _listener = logging.handlers.QueueListener(records, target, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Schreibt noch wartende Einträge und beendet den Listener-Thread."""
+    global _listener, _handler
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+        _handler = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
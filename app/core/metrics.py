@@ -0,0 +1,178 @@
+"""
+Kleines In-Process-Metrik-Register (Counter, Gauges, Histogramme).
+
+Die Werte werden unter `/metrics` im Prometheus-Textformat ausgegeben. Mit `timed`
+gemessene Abschnitte landen zusätzlich in den Timings des laufenden Requests
+(Server-Timing-Header, siehe `app/core/middleware.py`).
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Standard-Buckets in Sekunden (Latenzen von 5 ms bis 60 s)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[dict]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    inner = ",".join(f'{k}="{v}"' for k, v in items)
+    return "{" + inner + "}"
+
+
+class Counter:
+    """Monoton steigender Zähler, optional mit Labels."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, help_text: str = ""):
+        self.name = name
+        self.help = help_text
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, labels: Optional[dict] = None):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, labels: Optional[dict] = None) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(k)} {v}" for k, v in self._values.items()]
+
+
+class Gauge(Counter):
+    """Momentaufnahme eines Werts (z.B. Queue-Tiefe)."""
+
+    type_name = "gauge"
+
+    def set(self, value: float, labels: Optional[dict] = None):
+        with self._lock:
+            self._values[_label_key(labels)] = float(value)
+
+    def dec(self, amount: float = 1.0, labels: Optional[dict] = None):
+        self.inc(-amount, labels)
+
+
+class Histogram:
+    """Kumulatives Histogramm mit festen Bucket-Grenzen."""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelKey, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: Optional[dict] = None):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [bucket_counts..., +Inf], sum, count
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, labels: Optional[dict] = None) -> int:
+        series = self._series.get(_label_key(labels))
+        return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, total, n) in self._series.items():
+                cumulative = 0
+                for bound, c in zip(self.buckets, counts):
+                    cumulative += c
+                    lines.append(f"{self.name}_bucket{_format_labels(key, ('le', repr(bound)))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {n}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {n}")
+        return lines
+
+
+_registry: Dict[str, object] = {}
+_registry_lock = threading.Lock()
+
+
+def _get_or_create(cls, name: str, help_text: str, **kwargs):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, help_text, **kwargs)
+        return metric
+
+
+def counter(name: str, help_text: str = "") -> Counter:
+    return _get_or_create(Counter, name, help_text)
+
+
+def gauge(name: str, help_text: str = "") -> Gauge:
+    return _get_or_create(Gauge, name, help_text)
+
+
+def histogram(name: str, help_text: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return _get_or_create(Histogram, name, help_text, buckets=buckets)
+
+
+# (Abschnitt, Sekunden) des laufenden Requests; None außerhalb eines Requests
+_timings: ContextVar[Optional[list]] = ContextVar("request_timings", default=None)
+
+
+def start_timings():
+    """Beginnt die Abschnitts-Timings für den aktuellen Kontext; liefert (Token, Liste)."""
+    timings: list = []
+    return _timings.set(timings), timings
+
+
+def reset_timings(token):
+    _timings.reset(token)
+
+
+def record_timing(stage: str, seconds: float):
+    """Hängt einen Abschnitt an die Timings des laufenden Requests (falls es einen gibt)."""
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def timed(histogram: Histogram, stage: str, labels: Optional[dict] = None):
+    """Misst den Block: Histogramm plus Timing des laufenden Requests."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        histogram.observe(elapsed, labels)
+        record_timing(stage, elapsed)
+
+
+def render_prometheus() -> str:
+    """Alle registrierten Metriken im Prometheus-Textformat."""
+    lines = []
+    with _registry_lock:
+        metrics = list(_registry.values())
+    for metric in metrics:
+        if metric.help:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type_name}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,75 @@
+"""
+ASGI-Middleware für Request-Metriken.
+
+- `http_requests_total` und `http_request_duration_seconds` pro Methode und Route-Template
+  (nicht pro Pfad, damit IDs die Label-Anzahl nicht sprengen); Dauer inkl. gestreamtem Body
+- `Server-Timing`-Header mit den per `metrics.timed` gemessenen Abschnitten (embed,
+  vector_query, db_hydrate, ollama_ttft, ...), soweit sie vor dem Antwort-Header fertig sind
+- Request-ID aus `X-Request-ID` (oder neu) für Logs und Antwort-Header
+- optional der Sampling-Profiler (siehe `app/core/profiling.py`)
+
+Reine ASGI-Middleware statt BaseHTTPMiddleware: kein Puffern von Streaming-Antworten.
+"""
+import asyncio
+import time
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.core import log, metrics, profiling
+from app.core.utils import generate_id
+
+http_requests = metrics.counter("http_requests_total", "HTTP-Requests nach Methode, Route und Status")
+http_duration = metrics.histogram("http_request_duration_seconds", "Dauer eines HTTP-Requests inkl. Body")
+http_in_flight = metrics.gauge("http_requests_in_flight", "Gerade bearbeitete HTTP-Requests")
+
+
+def _server_timing(timings: list, total: float) -> str:
+    # Gleiche Abschnitte (z.B. mehrere Vektor-Suchen) zusammenzählen, Reihenfolge beibehalten
+    merged = {}
+    for stage, seconds in timings:
+        merged[stage] = merged.get(stage, 0.0) + seconds
+    merged["total"] = total
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in merged.items())
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        headers = Headers(scope=scope)
+        request_id = headers.get("x-request-id") or generate_id()
+        id_token = log.request_id.set(request_id)
+        timings_token, timings = metrics.start_timings()
+        profiler = profiling.maybe_start(headers)
+        status = 500
+
+        async def send_with_headers(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_headers = MutableHeaders(scope=message)
+                response_headers.append("X-Request-ID", request_id)
+                response_headers.append("Server-Timing", _server_timing(timings, time.perf_counter() - started))
+                if profiler is not None:
+                    response_headers.append("X-Profile-Id", profiler.id)
+            await send(message)
+
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            http_in_flight.dec()
+            route = scope.get("route")
+            labels = {"method": scope["method"], "route": getattr(route, "path", "unmatched")}
+            http_duration.observe(time.perf_counter() - started, labels)
+            http_requests.inc(labels={**labels, "status": str(status)})
+            metrics.reset_timings(timings_token)
+            log.request_id.reset(id_token)
+            if profiler is not None:
+                # Thread-Join und Dateischreiben nicht im Event-Loop
+                await asyncio.get_running_loop().run_in_executor(None, profiling.finish, profiler)
@@ -0,0 +1,109 @@
+"""
+Sampling-Profiler für einzelne Requests (opt-in).
+
+Mit PROFILE_ENABLED=1 profiliert ein Request, der den Header PROFILE_HEADER (Standard `X-Profile`)
+mitschickt. Ein eigener Thread liest alle PROFILE_INTERVAL_MS die Stacks aller Threads
+(Event-Loop und Pools) und zählt sie; am Ende des Requests landet das Ergebnis im "folded"-Format
+(`Thread;modul:funktion;... Anzahl`, direkt nutzbar mit flamegraph.pl oder speedscope) unter
+PROFILE_DIR/<id>.folded. Die ID steht im Antwort-Header `X-Profile-Id`.
+
+Der Event-Loop wird von allen Requests geteilt: gleichzeitig laufende Requests tauchen im Profil mit auf.
+"""
+import logging
+import os
+import sys
+import threading
+from collections import Counter
+from typing import Optional
+
+from app.core.utils import generate_id
+
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "0") == "1"
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "X-Profile").lower()
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+# Höchstens so viele gleichzeitig profilierte Requests; weitere laufen ohne Profiler
+PROFILE_MAX_CONCURRENT = int(os.getenv("PROFILE_MAX_CONCURRENT", "2"))
+PROFILE_MAX_DEPTH = 64
+
+logger = logging.getLogger(__name__)
+
+# Wartende Threads (Pool-Worker ohne Auftrag, Selector des Event-Loops) nicht mitzählen
+_IDLE_LEAVES = {("threading.py", "wait"), ("selectors.py", "select"), ("queue.py", "get"),
+                ("thread.py", "_worker"), ("handlers.py", "dequeue")}
+
+_active = 0
+_active_lock = threading.Lock()
+
+
+def _collapse(frame, thread_name: str) -> Optional[str]:
+    leaf = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+    if leaf in _IDLE_LEAVES:
+        return None
+    names = []
+    while frame is not None and len(names) < PROFILE_MAX_DEPTH:
+        module = frame.f_globals.get("__name__", "?")
+        names.append(f"{module}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    names.append(thread_name)
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS, directory: str = PROFILE_DIR):
+        self.id = generate_id()
+        self.interval = max(0.001, interval_ms / 1000.0)
+        self.directory = directory
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{self.id[:8]}", daemon=True)
+
+    def start(self) -> "SamplingProfiler":
+        self._thread.start()
+        return self
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = _collapse(frame, names.get(ident, str(ident)))
+                if stack:
+                    self.samples[stack] += 1
+
+    def stop(self) -> Optional[str]:
+        """Beendet das Abtasten und schreibt das Profil; liefert den Dateipfad."""
+        self._stop.set()
+        self._thread.join()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{self.id}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+def maybe_start(headers) -> Optional[SamplingProfiler]:
+    """Startet einen Profiler, wenn aktiviert, der Header gesetzt ist und ein Platz frei ist."""
+    global _active
+    if not PROFILE_ENABLED or headers.get(PROFILE_HEADER) in (None, "", "0"):
+        return None
+    with _active_lock:
+        if _active >= PROFILE_MAX_CONCURRENT:
+            return None
+        _active += 1
+    return SamplingProfiler().start()
+
+
+def finish(profiler: SamplingProfiler):
+    global _active
+    try:
+        path = profiler.stop()
+        logger.info("Profil %s: %d Samples in %s", profiler.id, sum(profiler.samples.values()), path)
+    except Exception:
+        logger.exception("Profil %s konnte nicht geschrieben werden", profiler.id)
+    finally:
+        with _active_lock:
+            _active -= 1
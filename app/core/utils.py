@@ -1,8 +1,20 @@
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 
 def generate_id() -> str:
     return str(uuid.uuid4())
 
 def current_timestamp() -> datetime:
     return datetime.utcnow()
+
+def to_naive_utc(dt: datetime) -> datetime:
+    """In der DB stehen naive UTC-Zeitstempel; zeitzonenbehaftete Eingaben werden dorthin umgerechnet."""
+    if dt is not None and dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+def to_epoch(dt: datetime) -> float:
+    """Unix-Zeitstempel; naive datetimes werden wie im restlichen Code als UTC behandelt."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
@@ -1,7 +1,74 @@
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.api import chat, query, chats, sessions, factcheck
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.api import admin, chat, query, chats, sessions, factcheck
+from app.core import log, metrics
+from app.core.middleware import RequestMetricsMiddleware
+from app.services import http_clients, sidecar, vector_db
+from app.services.fact_checker import fact_checker
+from app.services.ingest_queue import ingest_queue
+from app.services.reindex import reindexer
+from app.services.db import DB_AUTO_MIGRATE, init_db
+from app.services.embedding import embedding_service
+from app.services.executor import run_embed, run_io, shutdown_executors
 
-app = FastAPI()
+# Modell und Vektor-DB nach dem Start im Hintergrund laden; der Server nimmt sofort Verbindungen an
+PREWARM_ON_STARTUP = os.getenv("PREWARM_ON_STARTUP", "1") == "1"
+# Modell schon beim Import laden, z.B. für `gunicorn --preload`: die Worker erben es per fork
+PRELOAD_MODEL = os.getenv("PRELOAD_MODEL", "0") == "1"
+
+# Logging über Queue und Listener-Thread, strukturiert (LOG_FORMAT, LOG_LEVEL)
+log.setup_logging()
+
+if sidecar.SIDECAR_MODE == "client":
+    # Modell und Vektor-Backends liegen im Sidecar-Prozess (siehe app/services/sidecar.py)
+    sidecar.enable_client()
+elif PRELOAD_MODEL:
+    embedding_service.load()
+
+
+async def _prewarm():
+    try:
+        if sidecar.client() is not None:
+            await run_io(sidecar.wait_ready)
+        await asyncio.gather(run_embed(embedding_service.load), run_io(vector_db.get_store))
+    except Exception:
+        # Kein Abbruch: der nächste Request versucht das Laden erneut, /ready bleibt 503
+        logging.getLogger(__name__).exception("Pre-Warm fehlgeschlagen")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if DB_AUTO_MIGRATE:
+        init_db()
+    # Gepoolte HTTP-Clients (Keep-Alive) für Ollama und Wikipedia
+    await http_clients.start_clients()
+    # Write-Behind-Worker für /chat; verarbeitet auch Einträge, die vom letzten Lauf übrig sind
+    ingest_queue.start()
+    prewarm = asyncio.create_task(_prewarm()) if PREWARM_ON_STARTUP else None
+    try:
+        yield
+    finally:
+        if prewarm is not None and not prewarm.done():
+            prewarm.cancel()
+        await http_clients.close_clients()
+        # Vor dem Schließen der Pools und der Vektor-DB: Queue so weit wie möglich leeren
+        await ingest_queue.stop()
+        # Laufender Re-Index hält am nächsten Checkpoint an und lässt sich später fortsetzen
+        reindexer.cancel(wait=5)
+        shutdown_executors()
+        vector_db.close()
+        fact_checker.close()
+        if sidecar.client() is not None:
+            sidecar.client().close()
+
+
+app = FastAPI(lifespan=lifespan)
+# Request-Metriken, Server-Timing, Request-ID und (opt-in) Sampling-Profiler
+app.add_middleware(RequestMetricsMiddleware)
 
 app.include_router(chat.router)
 app.include_router(query.router)
@@ -9,7 +76,67 @@ app.include_router(chats.router)
 app.include_router(sessions.router)
 app.include_router(factcheck.router)
 app.include_router(factcheck.router)
+app.include_router(admin.router)
 
 @app.get("/")
 def read_root():
     return {"message": "LLM Chat Vector App läuft!"}
+
+@app.get("/health")
+def health():
+    """Liveness: der Prozess läuft und beantwortet Requests."""
+    return {"status": "ok"}
+
+@app.get("/ready")
+def ready():
+    """Readiness: 200 erst, wenn Embedding-Modell und Vektor-DB geladen sind."""
+    status = {
+        "embedding_model": embedding_service.is_loaded,
+        "vector_db": vector_db.is_ready(),
+    }
+    if sidecar.client() is not None:
+        try:
+            sidecar.client().ping()
+            status["sidecar"] = True
+        except Exception:
+            status["sidecar"] = False
+    ok = all(status.values())
+    return JSONResponse(status_code=200 if ok else 503, content={"ready": ok, **status})
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus-Textformat aller In-Process-Metriken."""
+    return metrics.render_prometheus()
+
+
+if __name__ == "__main__":
+    # python -m app.main --workers 4 --sidecar: erst den Sidecar starten, dann die Worker als dessen Clients
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="API-Server mit optionalem Embedding-/Vektor-Sidecar")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--sidecar", action="store_true", help="Modell und Vektor-DB in einem gemeinsamen Sidecar-Prozess")
+    args = parser.parse_args()
+    if DB_AUTO_MIGRATE and args.workers > 1:
+        # Einmal hier statt parallel in jedem Worker
+        init_db()
+        os.environ["DB_AUTO_MIGRATE"] = "0"
+    process = None
+    if args.sidecar:
+        process = sidecar.spawn()
+        # Wird von den Worker-Prozessen geerbt
+        os.environ["SIDECAR_MODE"] = "client"
+        # Mit einem Worker importiert uvicorn app.main in diesem Prozess; app.services.sidecar ist
+        # dann schon mit SIDECAR_MODE=off geladen, also hier direkt auf den Sidecar umschalten
+        sidecar.enable_client()
+    try:
+        uvicorn.run("app.main:app", host=args.host, port=args.port, workers=args.workers)
+    finally:
+        if sidecar.client() is not None:
+            sidecar.client().close()
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
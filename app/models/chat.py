@@ -4,6 +4,14 @@ from typing import Optional
 class ChatRequest(BaseModel):
     prompt: str
     model: Optional[str] = "llama2"
+    # true: Antwort wird als NDJSON-Stream (ein JSON-Objekt pro Zeile) ausgeliefert
+    stream: Optional[bool] = False
+    # false: semantischen Antwort-Cache für diese Anfrage umgehen (nur relevant mit CHAT_CACHE_ENABLED=1)
+    cache: Optional[bool] = True
+    # Gesetzt: Verlauf dieser Session fließt (unter Token-Budget) in den Prompt ein
+    session_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     response: str
+    # true: Antwort stammt aus dem semantischen Antwort-Cache
+    cached: Optional[bool] = False
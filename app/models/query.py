@@ -1,5 +1,6 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, Field
+from typing import Literal, Optional, List
+from datetime import datetime
 
 class ChatHistoryItem(BaseModel):
     id: Optional[str]
@@ -9,10 +10,29 @@ class ChatHistoryItem(BaseModel):
     metadata: Optional[dict] = None
     score: Optional[float] = None
 
-class QueryRequest(BaseModel):
-    query: str
+class SearchOptions(BaseModel):
     n_results: Optional[int] = 5
     score_threshold: Optional[float] = 0.5
+    # Nur bei VECTOR_INDEX_MODE=ivf: Anzahl durchsuchter Listen (höher = genauer, langsamer)
+    nprobe: Optional[int] = None
+    # Filter, die bereits in der Vektor-Suche angewendet werden
+    session_id: Optional[str] = None
+    sender: Optional[str] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    # vector (Embedding), lexical (BM25/FTS5) oder hybrid (beide, per Reciprocal Rank Fusion); Standard: QUERY_DEFAULT_MODE
+    mode: Optional[Literal["vector", "lexical", "hybrid"]] = None
+
+class QueryRequest(SearchOptions):
+    query: str
+
+class BatchQueryRequest(SearchOptions):
+    queries: List[str] = Field(..., min_length=1, max_length=1000)
 
 class QueryResult(BaseModel):
     results: List[ChatHistoryItem]
+    # Latenz der Suchwege in ms (z.B. {"vector": 12.3, "lexical": 1.4}); bei /query/batch für alle Queries zusammen
+    timings: Optional[dict] = None
+
+class BatchQueryResult(BaseModel):
+    results: List[QueryResult]
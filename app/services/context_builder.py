@@ -0,0 +1,286 @@
+"""
+Prompt-Aufbau für /chat mit `session_id`.
+
+Der Prompt besteht aus Systemprompt, einer gecachten Zusammenfassung älterer Nachrichten,
+den semantisch relevantesten früheren Nachrichten der Session (Vektor-Suche), den letzten
+Nachrichten und dem aktuellen Prompt – zusammen höchstens CONTEXT_MAX_TOKENS Tokens
+(geschätzt über CONTEXT_CHARS_PER_TOKEN). Reicht das Budget nicht, haben die letzten
+Nachrichten Vorrang vor der Zusammenfassung und diese vor den relevanten Treffern.
+
+Zusammenfassungen werden rollierend fortgeschrieben: Sobald mindestens
+CONTEXT_SUMMARY_MIN_NEW Nachrichten aus dem Fenster der letzten Nachrichten herausgefallen sind,
+fasst Ollama im Hintergrund die bisherige Zusammenfassung plus die neuen Nachrichten zusammen.
+Bis dahin wird die vorhandene Zusammenfassung weiterverwendet. Zusammenfassungen laufen mit
+niedriger Priorität außerhalb der Queue der Anfragen (kein 429 für Nutzer); schlägt eine fehl,
+wird es für die Session erst nach CONTEXT_SUMMARY_RETRY_AFTER Sekunden erneut versucht.
+"""
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core import metrics
+from app.services.db import ChatMessage
+from app.services.embedding import embedding_service
+from app.services.executor import run_db, run_io
+from app.services.vector_db import build_where, search_vector_db
+
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "2048"))
+CONTEXT_CHARS_PER_TOKEN = float(os.getenv("CONTEXT_CHARS_PER_TOKEN", "4"))
+CONTEXT_RECENT_MESSAGES = int(os.getenv("CONTEXT_RECENT_MESSAGES", "8"))
+CONTEXT_RELEVANT_K = int(os.getenv("CONTEXT_RELEVANT_K", "4"))
+CONTEXT_MIN_SCORE = float(os.getenv("CONTEXT_MIN_SCORE", "0.3"))
+CONTEXT_SUMMARY_ENABLED = os.getenv("CONTEXT_SUMMARY_ENABLED", "1") == "1"
+CONTEXT_SUMMARY_MIN_NEW = int(os.getenv("CONTEXT_SUMMARY_MIN_NEW", "4"))
+# Max. Nachrichten, die in einen Zusammenfassungs-Schritt eingehen
+CONTEXT_SUMMARY_MAX_BATCH = int(os.getenv("CONTEXT_SUMMARY_MAX_BATCH", "50"))
+CONTEXT_SUMMARY_CACHE_SIZE = int(os.getenv("CONTEXT_SUMMARY_CACHE_SIZE", "1000"))
+# Wartezeit in Sekunden nach einer fehlgeschlagenen Zusammenfassung, bevor die Session erneut drankommt
+CONTEXT_SUMMARY_RETRY_AFTER = float(os.getenv("CONTEXT_SUMMARY_RETRY_AFTER", "60"))
+
+logger = logging.getLogger(__name__)
+
+build_time = metrics.histogram("context_build_seconds", "Dauer des Prompt-Aufbaus für Session-Chats")
+prompt_tokens = metrics.histogram(
+    "context_prompt_tokens",
+    "Geschätzte Tokens des an Ollama gesendeten Prompts",
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384),
+)
+section_tokens = metrics.counter("context_section_tokens_total", "Geschätzte Prompt-Tokens nach Abschnitt")
+summary_requests = metrics.counter("context_summary_requests_total", "Zusammenfassungs-Cache nach Ergebnis (hit, stale, miss)")
+summary_failures = metrics.counter("context_summary_failures_total", "Fehlgeschlagene Zusammenfassungen")
+
+SUMMARY_PROMPT = (
+    "Fasse das folgende Gespräch in wenigen Sätzen zusammen. Behalte Namen, Fakten, Entscheidungen "
+    "und offene Fragen bei. Antworte nur mit der Zusammenfassung, in der Sprache des Gesprächs."
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, math.ceil(len(text) / CONTEXT_CHARS_PER_TOKEN)) if text else 0
+
+
+def _format_message(sender: str, text: str) -> str:
+    return f"{'Assistant' if sender == 'assistant' else 'User'}: {text}"
+
+
+class BuiltContext(NamedTuple):
+    prompt: str
+    tokens: int
+    recent: int
+    relevant: int
+    summary: bool
+
+
+class _Summary(NamedTuple):
+    covered: int  # Anzahl der ältesten Nachrichten, die die Zusammenfassung abdeckt
+    text: str
+
+
+class SummaryCache:
+    """LRU der rollierenden Zusammenfassungen pro Session."""
+
+    def __init__(self, max_size: int = CONTEXT_SUMMARY_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, _Summary]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[_Summary]:
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                self._entries.move_to_end(session_id)
+            return entry
+
+    def put(self, session_id: str, summary: _Summary):
+        with self._lock:
+            self._entries[session_id] = summary
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, session_id: str = None):
+        """Nach Löschen/Restore einer Session aufrufen."""
+        with self._lock:
+            if session_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(session_id, None)
+
+
+def _load_recent(db: Session, session_id: str, limit: int, prompt: str) -> Tuple[List[tuple], int, Optional[str]]:
+    """
+    Letzte `limit` Nachrichten (chronologisch) und Gesamtzahl, ohne den aktuellen Prompt;
+    dazu die ID der Nachricht mit dem aktuellen Prompt, falls schon gespeichert.
+    """
+    rows = (
+        db.query(ChatMessage.id, ChatMessage.sender, ChatMessage.text)
+        .filter(ChatMessage.session_id == session_id)
+        .order_by(ChatMessage.timestamp.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    total = db.query(func.count(ChatMessage.id)).filter(ChatMessage.session_id == session_id).scalar() or 0
+    # Das Frontend speichert die User-Nachricht vor dem /chat-Aufruf: nicht doppelt in den Prompt
+    current_id = None
+    if rows and rows[0].sender == "user" and rows[0].text.strip() == prompt.strip():
+        current_id = rows[0].id
+        rows, total = rows[1:], total - 1
+    rows = rows[:limit]
+    return [(r.id, r.sender, r.text) for r in reversed(rows)], total, current_id
+
+
+def _load_range(db: Session, session_id: str, offset: int, limit: int) -> List[tuple]:
+    rows = (
+        db.query(ChatMessage.sender, ChatMessage.text)
+        .filter(ChatMessage.session_id == session_id)
+        .order_by(ChatMessage.timestamp.asc())
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
+    return [(r.sender, r.text) for r in rows]
+
+
+class ContextBuilder:
+    def __init__(self, max_tokens: int = CONTEXT_MAX_TOKENS, recent_messages: int = CONTEXT_RECENT_MESSAGES,
+                 relevant_k: int = CONTEXT_RELEVANT_K, summaries: Optional[SummaryCache] = None):
+        self.max_tokens = max_tokens
+        self.recent_messages = max(0, recent_messages)
+        self.relevant_k = max(0, relevant_k)
+        self.summaries = summaries if summaries is not None else SummaryCache()
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        # Session -> Zeitpunkt (monotonic) der letzten fehlgeschlagenen Zusammenfassung
+        self._failed: "OrderedDict[str, float]" = OrderedDict()
+
+    async def build(self, system_prompt: str, session_id: str, prompt: str, model: str,
+                    embedding: Optional[list] = None) -> BuiltContext:
+        started = time.perf_counter()
+        recent, total, current_id = await run_db(_load_recent, session_id, self.recent_messages, prompt)
+        older = total - len(recent)
+        relevant = []
+        if self.relevant_k and older > 0:
+            relevant = await self._relevant(session_id, prompt, embedding, {m[0] for m in recent} | {current_id})
+        summary = self._summary(session_id, older, model)
+
+        head = f"{system_prompt}\n\n"
+        tail = f"User: {prompt}"
+        budget = self.max_tokens - estimate_tokens(head) - estimate_tokens(tail)
+        # Vorrang: letzte Nachrichten (neueste zuerst), dann Zusammenfassung, dann relevante Treffer
+        recent_lines = []
+        for _, sender, text in reversed(recent):
+            line = _format_message(sender, text)
+            cost = estimate_tokens(line)
+            if cost > budget:
+                break
+            recent_lines.insert(0, line)
+            budget -= cost
+        summary_block = ""
+        if summary:
+            block = f"Zusammenfassung des bisherigen Gesprächs:\n{summary}\n\n"
+            if estimate_tokens(block) <= budget:
+                summary_block = block
+                budget -= estimate_tokens(block)
+        relevant_lines = []
+        for text, sender in relevant:
+            line = f"- {_format_message(sender, text)}"
+            cost = estimate_tokens(line)
+            if cost > budget:
+                continue
+            relevant_lines.append(line)
+            budget -= cost
+
+        parts = [head, summary_block]
+        if relevant_lines:
+            parts.append("Relevante frühere Nachrichten:\n" + "\n".join(relevant_lines) + "\n\n")
+        if recent_lines:
+            parts.append("Bisheriger Verlauf:\n" + "\n".join(recent_lines) + "\n\n")
+        parts.append(tail)
+        full_prompt = "".join(parts)
+
+        tokens = estimate_tokens(full_prompt)
+        build_time.observe(time.perf_counter() - started)
+        prompt_tokens.observe(tokens)
+        section_tokens.inc(estimate_tokens(head) + estimate_tokens(tail), {"section": "prompt"})
+        section_tokens.inc(estimate_tokens(summary_block), {"section": "summary"})
+        section_tokens.inc(sum(estimate_tokens(l) for l in relevant_lines), {"section": "relevant"})
+        section_tokens.inc(sum(estimate_tokens(l) for l in recent_lines), {"section": "recent"})
+        return BuiltContext(full_prompt, tokens, len(recent_lines), len(relevant_lines), bool(summary_block))
+
+    async def _relevant(self, session_id: str, prompt: str, embedding: Optional[list], exclude: set) -> List[tuple]:
+        if embedding is None:
+            embedding = await embedding_service.aembed(prompt)
+        try:
+            hits = (await run_io(search_vector_db, [embedding], self.relevant_k + len(exclude),
+                                 CONTEXT_MIN_SCORE, build_where(session_id=session_id)))[0]
+        except Exception as e:
+            # Ohne Vektor-DB trotzdem antworten, nur ohne relevante Treffer
+            logger.warning("Kontext: Vektor-Suche für Session %s fehlgeschlagen: %s", session_id, e)
+            return []
+        hits = [(doc, meta.get("sender", "user")) for doc, meta, _ in hits if meta.get("id") not in exclude]
+        return hits[:self.relevant_k]
+
+    def _summary(self, session_id: str, older: int, model: str) -> Optional[str]:
+        if not CONTEXT_SUMMARY_ENABLED or older <= 0:
+            return None
+        entry = self.summaries.get(session_id)
+        covered = entry.covered if entry else 0
+        if entry is None:
+            summary_requests.inc(labels={"result": "miss"})
+        elif older - covered >= CONTEXT_SUMMARY_MIN_NEW:
+            summary_requests.inc(labels={"result": "stale"})
+        else:
+            summary_requests.inc(labels={"result": "hit"})
+        running = self._refreshing.get(session_id)
+        failed = self._failed.get(session_id)
+        backing_off = failed is not None and time.monotonic() - failed < CONTEXT_SUMMARY_RETRY_AFTER
+        if older - covered >= CONTEXT_SUMMARY_MIN_NEW and (running is None or running.done()) and not backing_off:
+            # Referenz halten, damit der Task nicht vom GC eingesammelt wird; höchstens einer pro Session
+            self._refreshing[session_id] = asyncio.get_running_loop().create_task(
+                self._refresh(session_id, entry, older, model))
+        return entry.text if entry else None
+
+    async def _refresh(self, session_id: str, entry: Optional[_Summary], older: int, model: str):
+        from app.services.llm_client import query_ollama
+
+        covered = entry.covered if entry else 0
+        count = min(older - covered, CONTEXT_SUMMARY_MAX_BATCH)
+        try:
+            messages = await run_db(_load_range, session_id, covered, count)
+            if not messages:
+                return
+            previous = f"Bisherige Zusammenfassung:\n{entry.text}\n\n" if entry else ""
+            lines = "\n".join(_format_message(sender, text) for sender, text in messages)
+            text = await query_ollama(f"{SUMMARY_PROMPT}\n\n{previous}Neue Nachrichten:\n{lines}", model=model,
+                                      background=True)
+        except Exception as e:
+            # Auch bei voller Hintergrund-Queue: nicht bei jeder Anfrage erneut versuchen
+            logger.warning("Kontext: Zusammenfassung für Session %s fehlgeschlagen: %s", session_id, e)
+            summary_failures.inc()
+            self._failed[session_id] = time.monotonic()
+            self._failed.move_to_end(session_id)
+            while len(self._failed) > self.summaries.max_size:
+                self._failed.popitem(last=False)
+            return
+        finally:
+            self._refreshing.pop(session_id, None)
+        self._failed.pop(session_id, None)
+        if text.strip():
+            self.summaries.put(session_id, _Summary(covered + len(messages), text.strip()))
+
+    def invalidate(self, session_id: str = None):
+        self.summaries.invalidate(session_id)
+        if session_id is None:
+            self._failed.clear()
+        else:
+            self._failed.pop(session_id, None)
+
+
+context_builder = ContextBuilder()
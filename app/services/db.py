@@ -1,24 +1,78 @@
-from sqlalchemy import create_engine, Column, String, Text, DateTime, ForeignKey
+from sqlalchemy import create_engine, event, Column, String, Text, DateTime, ForeignKey, Index, Integer, Boolean
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 import os
 from datetime import datetime
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./app.db")
+# Verbindungs-Pool (gilt für Postgres und dateibasiertes SQLite)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Wartezeit in Sekunden, wenn SQLite gerade von einem anderen Schreiber gesperrt ist
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "30"))
+# Migrationen beim App-Start ausführen (bei mehreren Instanzen ggf. nur in einer aktivieren)
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "1") == "1"
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+
+def _normalize_url(url: str) -> str:
+    # "postgres://" (z.B. von Heroku/Docker-Setups) kennt SQLAlchemy nicht mehr
+    if url.startswith("postgres://"):
+        return "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+def _build_engine(url: str):
+    url = make_url(_normalize_url(url))
+    if url.get_backend_name() == "sqlite":
+        kwargs = {"connect_args": {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT}}
+        if url.database and url.database != ":memory:":
+            kwargs.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+        engine = create_engine(url, **kwargs)
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+        return engine
+    return create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL: Leser blockieren Schreiber nicht mehr; NORMAL reicht mit WAL für Crash-Sicherheit
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    # Damit INSERT OR REPLACE die Delete-Trigger des FTS-Index auslöst (app/services/lexical.py)
+    cursor.execute("PRAGMA recursive_triggers=ON")
+    cursor.close()
+
+
+engine = _build_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
+    # Keyset-Pagination in /sessions (neueste zuerst)
+    __table_args__ = (Index("ix_chat_sessions_created_at_id", "created_at", "id"),)
     id = Column(String, primary_key=True)
     title = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Denormalisiert für /sessions; gepflegt von allen Schreibpfaden für Nachrichten (siehe app/api/sessions.py)
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_message_at = Column(DateTime, nullable=True)
     messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan")
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    # Für den Count-Join in /sessions und die Pagination in /sessions/{id}/messages
+    __table_args__ = (Index("ix_chat_messages_session_id_timestamp", "session_id", "timestamp"),)
     id = Column(String, primary_key=True)
     session_id = Column(String, ForeignKey("chat_sessions.id"), nullable=False)
     sender = Column(String, nullable=False)  # 'user' oder 'assistant'
@@ -31,7 +85,58 @@ class ChatHistory(Base):
     id = Column(String, primary_key=True, index=True)
     prompt = Column(Text)
     response = Column(Text)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     chat_metadata = Column(Text, nullable=True)
 
-Base.metadata.create_all(bind=engine)
+class VectorCollection(Base):
+    """Versionierte Vektor-Collections pro Backend; genau eine ist aktiv (siehe app/services/reindex.py)."""
+    __tablename__ = "vector_collections"
+    backend = Column(String, primary_key=True)
+    name = Column(String, primary_key=True)
+    model_name = Column(String, nullable=False)
+    active = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    activated_at = Column(DateTime, nullable=True)
+
+class ReindexJob(Base):
+    """Fortschritt eines Re-Index-Laufs; `cursor` ist die letzte verarbeitete ID der aktuellen Phase."""
+    __tablename__ = "reindex_jobs"
+    id = Column(String, primary_key=True)
+    backend = Column(String, nullable=False)
+    collection = Column(String, nullable=False)
+    model_name = Column(String, nullable=False)
+    status = Column(String, nullable=False)  # running, paused, failed, done
+    phase = Column(String, nullable=False)  # history, messages, catchup, done
+    cursor = Column(String, nullable=True)
+    processed = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, nullable=False, default=0)
+    docs_per_sec = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+class ListVersion(Base):
+    """Token einer Liste (z.B. "sessions" für das ETag von /sessions); `version` wird nicht mehr erhöht."""
+    __tablename__ = "list_versions"
+    name = Column(String, primary_key=True)
+    # Neu bei jeder frisch angelegten DB: alte ETags passen dann nicht zufällig
+    token = Column(String, nullable=False)
+    version = Column(Integer, nullable=False, default=0)
+
+class ReindexChange(Base):
+    """Schreibzugriff auf die Vektor-DB während eines Re-Index; der Job spielt ihn in `collection` nach."""
+    __tablename__ = "reindex_changes"
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    collection = Column(String, nullable=False, index=True)
+    doc_id = Column(String, nullable=False)
+    op = Column(String, nullable=False)  # add, delete
+    document = Column(Text, nullable=True)
+    doc_metadata = Column(Text, nullable=True)  # JSON
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+def init_db():
+    """Bringt das Schema per Migrationen auf den aktuellen Stand (siehe app/services/migrations.py)."""
+    from app.services.migrations import run_migrations
+    return run_migrations(engine)
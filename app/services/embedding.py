@@ -1,14 +1,164 @@
-from sentence_transformers import SentenceTransformer
+import asyncio
+import os
+import threading
 import numpy as np
+from typing import List, Optional, Sequence
+
+from app.core import metrics
+from app.services.embedding_cache import EmbeddingCache, cache_key
+from app.services.executor import run_embed
 
 MODEL_NAME = "all-MiniLM-L6-v2"
 
+# Micro-Batching: gleichzeitige aembed()-Aufrufe werden bis zu EMBED_BATCH_MAX_WAIT_MS
+# gesammelt (oder bis EMBED_BATCH_MAX_SIZE Texte anstehen) und in einem encode() verarbeitet.
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))
+
+embed_batch_size = metrics.histogram(
+    "embedding_batch_size",
+    "Anzahl Texte pro encode()-Aufruf",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+embed_encode_time = metrics.histogram("embedding_encode_seconds", "Dauer eines encode()-Aufrufs des Embedding-Modells")
+
+# Sidecar-Client (SIDECAR_MODE=client): encode() läuft dann im Sidecar-Prozess, siehe app/services/sidecar.py
+_remote = None
+
+
+def set_remote(client):
+    global _remote
+    _remote = client
+
+
+class MicroBatcher:
+    """
+    Sammelt Einzel-Anfragen und ruft `encode_many` einmal pro Batch im Embedding-Pool auf.
+    Jeder Aufrufer erhält die zu seinem Text gehörende Zeile.
+    """
+
+    def __init__(self, encode_many, max_size: int = EMBED_BATCH_MAX_SIZE, max_wait_ms: float = EMBED_BATCH_MAX_WAIT_MS):
+        self.encode_many = encode_many
+        self.max_size = max(1, max_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._pending: list = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: set = set()
+
+    async def submit(self, text: str) -> list:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Neuer Event-Loop (z.B. Neustart im selben Prozess): alten Zustand verwerfen
+            self._loop, self._pending, self._timer = loop, [], None
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch, self._pending = self._pending[:self.max_size], self._pending[self.max_size:]
+            task = self._loop.create_task(self._run(batch))
+            # Referenz halten, damit laufende Batches nicht vom GC eingesammelt werden
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list):
+        texts = [text for text, _ in batch]
+        try:
+            vectors = await run_embed(self.encode_many, texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+
 class EmbeddingService:
-    def __init__(self, model_name: str = MODEL_NAME):
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name: str = MODEL_NAME, cache: Optional[EmbeddingCache] = None):
+        self.model_name = model_name
+        self._model = None
+        self._load_lock = threading.Lock()
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self.batcher = MicroBatcher(self.embed_many)
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._model is not None or _remote is not None
+
+    @property
+    def model(self):
+        """Das Modell wird erst beim ersten Zugriff (oder per load()) geladen."""
+        if self._model is None:
+            self.load()
+        return self._model
+
+    def load(self):
+        if _remote is not None:
+            # Das Modell lebt im Sidecar
+            return None
+        with self._load_lock:
+            if self._model is None:
+                # Import erst hier: sentence_transformers zieht PyTorch nach
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def use_model(self, model_name: str, model=None):
+        """
+        Wechselt das Modell, z.B. nach einem Re-Index in eine Collection mit anderem Modell.
+        Ein bereits geladenes Modell kann übergeben werden, sonst wird beim nächsten Zugriff geladen.
+        Cache-Schlüssel enthalten den Modellnamen, alte Einträge bleiben also unberührt.
+        """
+        with self._load_lock:
+            self.model_name = model_name
+            self._model = model
 
     def embed(self, text: str) -> list:
-        embedding = self.model.encode([text])[0]
-        return embedding.tolist() if isinstance(embedding, np.ndarray) else embedding
+        return self.embed_many([text])[0]
+
+    def embed_many(self, texts: Sequence[str]) -> List[list]:
+        """
+        Ein einziger encode()-Aufruf für alle Texte, die nicht im Cache liegen.
+        Cache-Treffer überspringen das Modell komplett.
+        """
+        keys = [cache_key(self.model_name, text) for text in texts]
+        cached = self.cache.get_many(keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        if missing:
+            embed_batch_size.observe(len(missing))
+            with metrics.timed(embed_encode_time, "embed"):
+                if _remote is not None:
+                    embeddings = _remote.embed(self.model_name, list(missing.values()))
+                else:
+                    embeddings = self.model.encode(list(missing.values()))
+            computed = {
+                key: e.tolist() if isinstance(e, np.ndarray) else e
+                for key, e in zip(missing.keys(), embeddings)
+            }
+            self.cache.put_many(computed)
+            cached.update(computed)
+        return [cached[key] for key in keys]
+
+    async def aembed(self, text: str) -> list:
+        """Wie `embed`, aber gebündelt über den Micro-Batcher im Embedding-Pool."""
+        # Speicher-Treffer direkt beantworten, ohne Batcher und Thread-Pool
+        cached = self.cache.get_memory(cache_key(self.model_name, text))
+        if cached is not None:
+            return cached
+        return await self.batcher.submit(text)
 
 embedding_service = EmbeddingService()
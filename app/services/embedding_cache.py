@@ -0,0 +1,129 @@
+"""
+Zweistufiger Embedding-Cache, Schlüssel = sha256(Modellname + normalisierter Text).
+
+- Speicher: begrenzter LRU (EMBEDDING_CACHE_SIZE Einträge)
+- Platte (optional): SQLite-Datei mit float32-Blobs (EMBEDDING_CACHE_PATH)
+
+Treffer und Fehlschläge pro Stufe werden als Metrik `embedding_cache_requests_total` gezählt.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from app.core import metrics
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+# Leer = nur Speicher-Cache; z.B. "./embedding_cache.db" neben app.db für die Platten-Stufe
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")
+
+cache_requests = metrics.counter("embedding_cache_requests_total", "Embedding-Cache-Abfragen nach Stufe und Ergebnis")
+
+
+def normalize_text(text: str) -> str:
+    """Whitespace vereinheitlichen, damit gleiche Prompts denselben Schlüssel bekommen."""
+    return " ".join(text.split())
+
+
+def cache_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class _DiskTier:
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            self._conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            # SQLite erlaubt nur eine begrenzte Anzahl Parameter pro Statement
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk)
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, vector.astype(np.float32).tobytes()) for key, vector in items.items()],
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class EmbeddingCache:
+    def __init__(self, max_size: int = EMBEDDING_CACHE_SIZE, path: str = EMBEDDING_CACHE_PATH):
+        self.max_size = max_size
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk: Optional[_DiskTier] = _DiskTier(path) if path else None
+
+    def get_memory(self, key: str) -> Optional[list]:
+        """
+        Nur die Speicher-Stufe abfragen (billig genug für den Event-Loop).
+        Fehlschläge werden hier nicht gezählt, sondern beim folgenden get_many().
+        """
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is None:
+                return None
+            self._memory.move_to_end(key)
+        cache_requests.inc(labels={"tier": "memory", "result": "hit"})
+        return vector.tolist()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, list]:
+        """Speicher-, dann Platten-Stufe. Platten-Treffer werden in den LRU übernommen."""
+        keys = list(keys)
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+        memory_hits = len(found)
+        cache_requests.inc(memory_hits, {"tier": "memory", "result": "hit"})
+        cache_requests.inc(len(keys) - memory_hits, {"tier": "memory", "result": "miss"})
+        missing = [key for key in keys if key not in found]
+        if self._disk is not None and missing:
+            from_disk = self._disk.get_many(missing)
+            cache_requests.inc(len(from_disk), {"tier": "disk", "result": "hit"})
+            cache_requests.inc(len(missing) - len(from_disk), {"tier": "disk", "result": "miss"})
+            self._put_memory(from_disk)
+            found.update(from_disk)
+        return {key: vector.tolist() for key, vector in found.items()}
+
+    def put_many(self, items: Dict[str, list]):
+        vectors = {key: np.asarray(vector, dtype=np.float32) for key, vector in items.items()}
+        self._put_memory(vectors)
+        if self._disk is not None and vectors:
+            self._disk.put_many(vectors)
+
+    def _put_memory(self, vectors: Dict[str, np.ndarray]):
+        with self._lock:
+            for key, vector in vectors.items():
+                self._memory[key] = vector
+                self._memory.move_to_end(key)
+            while len(self._memory) > self.max_size:
+                self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
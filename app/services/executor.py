@@ -0,0 +1,110 @@
+"""
+Dedizierte Thread-Pools für blockierende Arbeit außerhalb des Event-Loops.
+
+- `io_executor`: SQLite/SQLAlchemy-Commits und ChromaDB-Zugriffe
+- `embed_executor`: SentenceTransformer-Encoding (PyTorch gibt während des
+  Forward-Pass den GIL frei, daher reicht ein Thread-Pool)
+
+Jeder Pool begrenzt die Zahl ausstehender Aufträge und meldet Queue-Tiefe,
+aktive Worker und Wartezeit als Metriken (Label `pool`).
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from app.core import metrics
+
+IO_POOL_SIZE = int(os.getenv("IO_POOL_SIZE", "8"))
+IO_POOL_MAX_PENDING = int(os.getenv("IO_POOL_MAX_PENDING", "256"))
+EMBED_POOL_SIZE = int(os.getenv("EMBED_POOL_SIZE", "1"))
+EMBED_POOL_MAX_PENDING = int(os.getenv("EMBED_POOL_MAX_PENDING", "256"))
+
+queue_depth = metrics.gauge("executor_queue_depth", "Aufträge, die auf einen freien Worker warten")
+active_workers = metrics.gauge("executor_active_workers", "Gerade laufende Aufträge")
+wait_time = metrics.histogram("executor_wait_seconds", "Wartezeit eines Auftrags bis zum Start")
+run_time = metrics.histogram("executor_run_seconds", "Laufzeit eines Auftrags im Pool")
+
+
+class BoundedExecutor:
+    """ThreadPoolExecutor mit begrenzter Warteschlange und Metriken."""
+
+    def __init__(self, name: str, max_workers: int, max_pending: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._labels = {"pool": name}
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+        return self._pool
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Führt `fn(*args, **kwargs)` im Pool aus und wartet asynchron auf das Ergebnis."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        loop = asyncio.get_running_loop()
+        submitted = time.perf_counter()
+        # Kontext mitnehmen (Request-Timings, Request-ID fürs Logging); run_in_executor tut das nicht
+        call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+
+        def task():
+            started = time.perf_counter()
+            queue_depth.dec(1, self._labels)
+            active_workers.inc(1, self._labels)
+            wait_time.observe(started - submitted, self._labels)
+            try:
+                return call()
+            finally:
+                active_workers.dec(1, self._labels)
+                run_time.observe(time.perf_counter() - started, self._labels)
+
+        async with self._slots:
+            queue_depth.inc(1, self._labels)
+            return await loop.run_in_executor(self._get_pool(), task)
+
+    def shutdown(self, wait: bool = True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+        self._slots = None
+
+
+io_executor = BoundedExecutor("io", IO_POOL_SIZE, IO_POOL_MAX_PENDING)
+embed_executor = BoundedExecutor("embed", EMBED_POOL_SIZE, EMBED_POOL_MAX_PENDING)
+
+
+async def run_io(fn: Callable, *args, **kwargs):
+    return await io_executor.run(fn, *args, **kwargs)
+
+
+async def run_embed(fn: Callable, *args, **kwargs):
+    return await embed_executor.run(fn, *args, **kwargs)
+
+
+async def run_db(fn: Callable, *args, **kwargs):
+    """
+    Führt `fn(db, *args, **kwargs)` mit einer eigenen SQLAlchemy-Session im IO-Pool aus.
+    Die Session wird im Worker-Thread geöffnet und wieder geschlossen.
+    """
+    from app.services.db import SessionLocal
+
+    def call():
+        db = SessionLocal()
+        try:
+            return fn(db, *args, **kwargs)
+        finally:
+            db.close()
+
+    return await io_executor.run(call)
+
+
+def shutdown_executors():
+    io_executor.shutdown()
+    embed_executor.shutdown()
@@ -0,0 +1,215 @@
+"""
+Faktencheck-Engine hinter `/factcheck`.
+
+- Ergebnis-Cache, Schlüssel = sha256(Backend + Sprache + normalisierte Aussage), mit TTL:
+  Speicher-LRU (FACTCHECK_CACHE_SIZE) und optional eine SQLite-Datei (FACTCHECK_CACHE_PATH).
+  "Nicht gefunden" verfällt nach FACTCHECK_NEGATIVE_TTL, technische Fehler werden nicht gecacht.
+- Globaler Token-Bucket für entfernte Backends: FACTCHECK_RATE Abfragen/s, Burst FACTCHECK_BURST.
+  Wer länger als FACTCHECK_MAX_WAIT Sekunden warten müsste, bekommt sofort "nicht geprüft".
+- Die Quelle ist austauschbar (siehe `app/services/factcheck`).
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.core import metrics
+from app.services.executor import run_io
+from app.services.factcheck import FactCheckBackend, LookupResult, create_backend, normalize_statement
+
+FACTCHECK_CACHE_SIZE = int(os.getenv("FACTCHECK_CACHE_SIZE", "10000"))
+# Leer = nur Speicher-Cache
+FACTCHECK_CACHE_PATH = os.getenv("FACTCHECK_CACHE_PATH", "")
+FACTCHECK_CACHE_TTL = float(os.getenv("FACTCHECK_CACHE_TTL", "86400"))
+FACTCHECK_NEGATIVE_TTL = float(os.getenv("FACTCHECK_NEGATIVE_TTL", "3600"))
+FACTCHECK_RATE = float(os.getenv("FACTCHECK_RATE", "5"))
+FACTCHECK_BURST = float(os.getenv("FACTCHECK_BURST", "10"))
+FACTCHECK_MAX_WAIT = float(os.getenv("FACTCHECK_MAX_WAIT", "2"))
+
+logger = logging.getLogger(__name__)
+
+cache_requests = metrics.counter("factcheck_cache_requests_total", "Faktencheck-Cache-Abfragen nach Stufe und Ergebnis")
+lookups = metrics.counter(
+    "factcheck_lookups_total",
+    "Abfragen an das Faktencheck-Backend nach Ergebnis (found, not_found, error, rate_limited)",
+)
+lookup_time = metrics.histogram("factcheck_lookup_seconds", "Dauer einer Backend-Abfrage")
+
+RATE_LIMITED = LookupResult(False, "Nicht geprüft: Abfragelimit erreicht", None)
+
+
+def cache_key(backend: str, language: str, statement: str) -> str:
+    return hashlib.sha256(f"{backend}\0{language}\0{normalize_statement(statement)}".encode("utf-8")).hexdigest()
+
+
+class TokenBucket:
+    """
+    Token-Bucket für den Event-Loop. Ein Token wird beim Aufruf reserviert (der Stand darf
+    negativ werden); der Aufrufer schläft dann, bis sein Token nachgefüllt ist.
+    """
+
+    def __init__(self, rate: float = FACTCHECK_RATE, burst: float = FACTCHECK_BURST):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+
+    async def acquire(self, max_wait: float = FACTCHECK_MAX_WAIT) -> bool:
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        wait = (1 - self._tokens) / self.rate if self._tokens < 1 else 0.0
+        if wait > max_wait:
+            return False
+        self._tokens -= 1
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return True
+
+
+class _DiskTier:
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS factcheck_results "
+                "(key TEXT PRIMARY KEY, found INTEGER NOT NULL, summary TEXT, url TEXT, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("DELETE FROM factcheck_results WHERE expires_at < ?", (time.time(),))
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[LookupResult, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT found, summary, url, expires_at FROM factcheck_results WHERE key = ? AND expires_at >= ?",
+                (key, time.time()),
+            ).fetchone()
+        if row is None:
+            return None
+        return LookupResult(bool(row[0]), row[1], row[2]), row[3]
+
+    def put(self, key: str, result: LookupResult, expires_at: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO factcheck_results (key, found, summary, url, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (key, int(result.found), result.summary, result.url, expires_at),
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class FactCheckCache:
+    def __init__(self, max_size: int = FACTCHECK_CACHE_SIZE, path: str = FACTCHECK_CACHE_PATH):
+        self.max_size = max_size
+        self._memory: "OrderedDict[str, Tuple[LookupResult, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk: Optional[_DiskTier] = _DiskTier(path) if path else None
+
+    def get_memory(self, key: str) -> Optional[LookupResult]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[1] < time.time():
+                del self._memory[key]
+                entry = None
+            if entry is not None:
+                self._memory.move_to_end(key)
+        cache_requests.inc(labels={"tier": "memory", "result": "hit" if entry else "miss"})
+        return entry[0] if entry else None
+
+    async def get(self, key: str) -> Optional[LookupResult]:
+        """Speicher-, dann Platten-Stufe (im IO-Pool). Platten-Treffer werden in den LRU übernommen."""
+        result = self.get_memory(key)
+        if result is not None or self._disk is None:
+            return result
+        entry = await run_io(self._disk.get, key)
+        cache_requests.inc(labels={"tier": "disk", "result": "hit" if entry else "miss"})
+        if entry is None:
+            return None
+        self._put_memory(key, *entry)
+        return entry[0]
+
+    async def put(self, key: str, result: LookupResult, ttl: float):
+        expires_at = time.time() + ttl
+        self._put_memory(key, result, expires_at)
+        if self._disk is not None:
+            await run_io(self._disk.put, key, result, expires_at)
+
+    def _put_memory(self, key: str, result: LookupResult, expires_at: float):
+        with self._lock:
+            self._memory[key] = (result, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_size:
+                self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+
+class FactChecker:
+    def __init__(self, backend: Optional[FactCheckBackend] = None, cache: Optional[FactCheckCache] = None,
+                 bucket: Optional[TokenBucket] = None):
+        self._backend = backend
+        self.cache = cache if cache is not None else FactCheckCache()
+        self.bucket = bucket if bucket is not None else TokenBucket()
+
+    @property
+    def backend(self) -> FactCheckBackend:
+        if self._backend is None:
+            self._backend = create_backend()
+        return self._backend
+
+    async def check(self, statement: str, language: str) -> LookupResult:
+        backend = self.backend
+        key = cache_key(backend.name, language, statement)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return cached
+        labels = {"backend": backend.name}
+        if backend.remote and not await self.bucket.acquire():
+            lookups.inc(labels={**labels, "result": "rate_limited"})
+            return RATE_LIMITED
+        started = time.perf_counter()
+        try:
+            result = await backend.lookup(statement, language)
+        except Exception as e:
+            lookups.inc(labels={**labels, "result": "error"})
+            logger.warning("Faktencheck-Abfrage fehlgeschlagen (%s): %s", backend.name, e)
+            return LookupResult(False, f"Fehler: {e}", None)
+        finally:
+            elapsed = time.perf_counter() - started
+            lookup_time.observe(elapsed, labels)
+            metrics.record_timing("factcheck", elapsed)
+        lookups.inc(labels={**labels, "result": "found" if result.found else "not_found"})
+        await self.cache.put(key, result, FACTCHECK_CACHE_TTL if result.found else FACTCHECK_NEGATIVE_TTL)
+        return result
+
+    async def check_many(self, statements: List[str], language: str) -> List[LookupResult]:
+        """Prüft mehrere Aussagen parallel; gleiche Aussagen (nach Normalisierung) nur einmal."""
+        unique: Dict[str, str] = {}
+        for statement in statements:
+            unique.setdefault(normalize_statement(statement), statement)
+        results = await asyncio.gather(*(self.check(s, language) for s in unique.values()))
+        by_key = dict(zip(unique, results))
+        return [by_key[normalize_statement(s)] for s in statements]
+
+    def close(self):
+        if self._backend is not None:
+            self._backend.close()
+            self._backend = None
+
+
+fact_checker = FactChecker()
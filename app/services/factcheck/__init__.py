@@ -0,0 +1,29 @@
+"""
+Austauschbare Quellen für `/factcheck`. Auswahl per `FACTCHECK_BACKEND`:
+
+- `wikipedia` (Standard): Wikipedia-Suche über HTTP (WIKIPEDIA_API_URL)
+- `fts`: lokaler SQLite-FTS5-Volltextindex unter FACTCHECK_FTS_PATH (offline, Millisekunden)
+- `stub`: feste Antworten ohne Netzwerk, für Tests und Benchmarks
+"""
+import os
+
+from app.services.factcheck.base import FactCheckBackend, LookupResult, normalize_statement
+
+FACTCHECK_BACKEND = os.getenv("FACTCHECK_BACKEND", "wikipedia")
+FACTCHECK_FTS_PATH = os.getenv("FACTCHECK_FTS_PATH", "./factcheck_corpus.db")
+
+
+def create_backend(backend: str = FACTCHECK_BACKEND) -> FactCheckBackend:
+    if backend == "wikipedia":
+        from app.services.factcheck.wikipedia_backend import WikipediaBackend
+        return WikipediaBackend()
+    if backend == "fts":
+        from app.services.factcheck.fts_backend import FTSBackend
+        return FTSBackend(FACTCHECK_FTS_PATH)
+    if backend == "stub":
+        from app.services.factcheck.stub_backend import StubBackend
+        return StubBackend()
+    raise ValueError(f"Unbekanntes Faktencheck-Backend: {backend}")
+
+
+__all__ = ["FactCheckBackend", "LookupResult", "normalize_statement", "create_backend", "FACTCHECK_BACKEND"]
@@ -0,0 +1,35 @@
+import unicodedata
+from abc import ABC, abstractmethod
+from typing import NamedTuple, Optional
+
+
+class LookupResult(NamedTuple):
+    found: bool
+    summary: Optional[str] = None
+    url: Optional[str] = None
+
+
+def normalize_statement(statement: str) -> str:
+    """Unicode, Groß-/Kleinschreibung, Whitespace und Satzzeichen am Rand vereinheitlichen."""
+    text = unicodedata.normalize("NFKC", statement).casefold()
+    return " ".join(text.split()).strip(" .,;:!?\"'")
+
+
+class FactCheckBackend(ABC):
+    """
+    Gemeinsame Schnittstelle der Faktencheck-Quellen hinter `app.services.fact_checker`.
+
+    `lookup` sucht eine Aussage und liefert den besten Treffer. Technische Fehler
+    (Timeout, HTTP-Status) werden als Exception gemeldet, damit sie nicht gecacht werden.
+    `remote = True` markiert Backends, deren Abfragen über den globalen Token-Bucket laufen.
+    """
+
+    name = "base"
+    remote = False
+
+    @abstractmethod
+    async def lookup(self, statement: str, language: str) -> LookupResult:
+        ...
+
+    def close(self):
+        pass
@@ -0,0 +1,105 @@
+"""
+Lokaler Volltextindex (SQLite FTS5) als Faktencheck-Quelle, z.B. über einen
+Wikipedia-Dump oder eigene Dokumente. Import aus JSON Lines
+(ein Objekt pro Zeile mit `title`, `text`, optional `url` und `language`):
+
+    python -m app.services.factcheck.fts_backend import corpus.jsonl [--language de]
+"""
+import argparse
+import json
+import re
+import sqlite3
+import threading
+from typing import Iterable, Optional
+
+from app.services.executor import run_io
+from app.services.factcheck.base import FactCheckBackend, LookupResult
+
+_TOKEN = re.compile(r"\w{3,}")
+_MAX_TERMS = 16
+_IMPORT_BATCH = 1000
+
+
+class FTSBackend(FactCheckBackend):
+    name = "fts"
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS documents USING fts5("
+                "title, body, url UNINDEXED, language UNINDEXED, tokenize='unicode61 remove_diacritics 2')"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def _match_query(statement: str) -> Optional[str]:
+        # Alle Begriffe müssen vorkommen (wie die Wikipedia-Suche); Anführungszeichen verhindern FTS-Syntax im Text
+        terms = list(dict.fromkeys(t.lower() for t in _TOKEN.findall(statement)))[:_MAX_TERMS]
+        return " AND ".join(f'"{t}"' for t in terms) if terms else None
+
+    def search(self, statement: str, language: str) -> LookupResult:
+        match = self._match_query(statement)
+        if match is None:
+            return LookupResult(False)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT title, snippet(documents, 1, '<span class=\"searchmatch\">', '</span>', '…', 24), url "
+                "FROM documents WHERE documents MATCH ? AND (language = ? OR language = '') "
+                "ORDER BY bm25(documents, 5.0, 1.0) LIMIT 1",
+                (match, language),
+            ).fetchone()
+        if row is None:
+            return LookupResult(False)
+        _, snippet, url = row
+        return LookupResult(True, snippet, url or None)
+
+    async def lookup(self, statement: str, language: str) -> LookupResult:
+        return await run_io(self.search, statement, language)
+
+    def add_documents(self, documents: Iterable[dict], language: str = "") -> int:
+        """Importiert Dokumente in Batches; liefert die Anzahl."""
+        count = 0
+        batch = []
+        for doc in documents:
+            batch.append((doc["title"], doc.get("text", ""), doc.get("url") or "", doc.get("language", language)))
+            if len(batch) >= _IMPORT_BATCH:
+                count += self._insert(batch)
+                batch = []
+        if batch:
+            count += self._insert(batch)
+        return count
+
+    def _insert(self, batch: list) -> int:
+        with self._lock:
+            self._conn.executemany("INSERT INTO documents (title, body, url, language) VALUES (?, ?, ?, ?)", batch)
+            self._conn.commit()
+        return len(batch)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _read_jsonl(path: str):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+if __name__ == "__main__":
+    from app.services.factcheck import FACTCHECK_FTS_PATH
+
+    parser = argparse.ArgumentParser(description="Faktencheck-Korpus (SQLite FTS5) befüllen")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="JSON-Lines-Datei importieren")
+    imp.add_argument("file")
+    imp.add_argument("--language", default="", help="Sprache für Dokumente ohne `language`-Feld")
+    imp.add_argument("--path", default=FACTCHECK_FTS_PATH)
+    args = parser.parse_args()
+    backend = FTSBackend(args.path)
+    print(f"{backend.add_documents(_read_jsonl(args.file), args.language)} Dokumente importiert")
+    backend.close()
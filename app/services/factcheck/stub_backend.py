@@ -0,0 +1,38 @@
+import asyncio
+import json
+import os
+
+from app.services.factcheck.base import FactCheckBackend, LookupResult, normalize_statement
+
+# JSON-Objekt {"<Aussage>": {"summary": ..., "url": ...}}; Schlüssel werden wie im Cache normalisiert
+FACTCHECK_STUB_PATH = os.getenv("FACTCHECK_STUB_PATH", "")
+# Simulierte Antwortzeit eines HTTP-Backends
+FACTCHECK_STUB_LATENCY_MS = float(os.getenv("FACTCHECK_STUB_LATENCY_MS", "0"))
+
+
+class StubBackend(FactCheckBackend):
+    """
+    Ersetzt die Wikipedia-Suche ohne Netzwerkzugriff: bekannte Aussagen aus einer
+    Fixture-Datei gelten als gefunden, alle anderen nicht. Läuft wie ein entferntes
+    Backend über den Token-Bucket, damit Limitierung und Cache realistisch getestet werden.
+    """
+
+    name = "stub"
+    remote = True
+
+    def __init__(self, path: str = FACTCHECK_STUB_PATH, latency_ms: float = FACTCHECK_STUB_LATENCY_MS):
+        self.latency = max(0.0, latency_ms) / 1000.0
+        self.fixtures = {}
+        if path:
+            with open(path, encoding="utf-8") as f:
+                self.fixtures = {normalize_statement(k): v for k, v in json.load(f).items()}
+        self.calls = 0
+
+    async def lookup(self, statement: str, language: str) -> LookupResult:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        entry = self.fixtures.get(normalize_statement(statement))
+        if entry is None:
+            return LookupResult(False)
+        return LookupResult(True, entry.get("summary"), entry.get("url"))
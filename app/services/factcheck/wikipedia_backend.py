@@ -0,0 +1,38 @@
+import os
+
+from app.services.factcheck.base import FactCheckBackend, LookupResult
+from app.services.http_clients import get_client
+
+# Platzhalter {language}; für Tests auf einen lokalen Stub-Server umbiegbar
+WIKIPEDIA_API_URL = os.getenv("WIKIPEDIA_API_URL", "https://{language}.wikipedia.org/w/api.php")
+WIKIPEDIA_PAGE_URL = os.getenv("WIKIPEDIA_PAGE_URL", "https://{language}.wikipedia.org/wiki/{title}")
+
+
+class WikipediaBackend(FactCheckBackend):
+    """Wikipedia-Volltextsuche (`list=search`), erster Treffer gewinnt."""
+
+    name = "wikipedia"
+    remote = True
+
+    def __init__(self, api_url: str = WIKIPEDIA_API_URL, page_url: str = WIKIPEDIA_PAGE_URL):
+        self.api_url = api_url
+        self.page_url = page_url
+
+    async def lookup(self, statement: str, language: str) -> LookupResult:
+        params = {
+            "action": "query",
+            "list": "search",
+            "srsearch": statement,
+            "srlimit": 1,
+            "format": "json",
+            "utf8": 1,
+        }
+        client = get_client("wikipedia")
+        resp = await client.get(self.api_url.format(language=language), params=params)
+        resp.raise_for_status()
+        results = resp.json().get("query", {}).get("search", [])
+        if not results:
+            return LookupResult(False)
+        page = results[0]
+        title = page["title"].replace(" ", "_")
+        return LookupResult(True, page.get("snippet"), self.page_url.format(language=language, title=title))
@@ -0,0 +1,69 @@
+"""
+Geteilte, gepoolte httpx.AsyncClients pro Upstream (Ollama, Wikipedia).
+
+Die Clients werden im Lifespan von `app.main` gestartet und beim Shutdown
+geschlossen. Außerhalb des Lifespans (Skripte, Tests) werden sie bei Bedarf
+einmalig angelegt.
+"""
+import os
+from typing import Dict, Optional
+
+import httpx
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+# HTTP/2 benötigt das optionale Paket `h2` (pip install httpx[http2])
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "0") == "1"
+
+# Lese-Timeouts pro Upstream: Ollama generiert lange, Wikipedia soll schnell antworten
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "60"))
+WIKIPEDIA_TIMEOUT = float(os.getenv("WIKIPEDIA_TIMEOUT", "3"))
+
+UPSTREAM_TIMEOUTS = {
+    "ollama": OLLAMA_TIMEOUT,
+    "wikipedia": WIKIPEDIA_TIMEOUT,
+}
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def _http2_available() -> bool:
+    if not HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _build_client(upstream: str) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(UPSTREAM_TIMEOUTS.get(upstream, 10.0), connect=HTTP_CONNECT_TIMEOUT)
+    return httpx.AsyncClient(limits=limits, timeout=timeout, http2=_http2_available())
+
+
+def get_client(upstream: str) -> httpx.AsyncClient:
+    """Gibt den geteilten Client für einen Upstream zurück."""
+    client: Optional[httpx.AsyncClient] = _clients.get(upstream)
+    if client is None or client.is_closed:
+        client = _clients[upstream] = _build_client(upstream)
+    return client
+
+
+async def start_clients():
+    for upstream in UPSTREAM_TIMEOUTS:
+        get_client(upstream)
+
+
+async def close_clients():
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
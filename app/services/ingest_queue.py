@@ -0,0 +1,423 @@
+"""
+Write-Behind-Queue für die Persistenz von /chat.
+
+`/chat` antwortet direkt nach der Generierung; der Datensatz (Prompt, Antwort, Zeitstempel,
+ggf. schon berechnetes Embedding) landet in einer SQLite-Datei (INGEST_QUEUE_PATH, synchronous=FULL).
+Ein Hintergrund-Worker leert sie in Batches: ein encode() für alle fehlenden Embeddings,
+ein `add_many` in die Vektor-DB und eine DB-Transaktion. Erst danach werden die Einträge aus der
+Queue gelöscht.
+
+Fehler:
+- Scheitern ein Batch und beide Hälften, gilt das als Ausfall (Vektor-DB, Datenbank oder Modell):
+  die ganze Queue pausiert mit exponentiellem Backoff, Versuche einzelner Datensätze zählen nicht.
+- Gelingt eine Hälfte und die andere nicht, wird die fehlerhafte weiter halbiert, bis der Datensatz
+  isoliert ist. Nur er wird mit Backoff wiederholt und nach INGEST_MAX_ATTEMPTS Versuchen in die
+  Tabelle `dead_letter` derselben Datei verschoben; `replay_dead_letters` (POST
+  /admin/ingest/dead-letters/replay oder `python -m app.services.ingest_queue --replay`) reiht ihn wieder ein.
+
+Mehrere Worker teilen sich die Datei: ein Batch wird vor der Verarbeitung per Lease
+(`claimed_by`, `claimed_until`) beansprucht; stirbt ein Worker, läuft die Lease nach
+INGEST_LEASE_SECONDS ab und ein anderer übernimmt.
+Beim Shutdown wird bis INGEST_DRAIN_TIMEOUT weiter abgearbeitet; der Rest bleibt in der Datei
+und wird beim nächsten Start verarbeitet.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from app.core import metrics
+from app.core.utils import to_epoch
+from app.services import vector_db
+from app.services.db import ChatHistory
+from app.services.embedding import embedding_service
+from app.services.executor import run_db, run_embed, run_io
+
+# 0 = wie bisher synchron im Request speichern
+INGEST_WRITE_BEHIND = os.getenv("INGEST_WRITE_BEHIND", "1") == "1"
+INGEST_QUEUE_PATH = os.getenv("INGEST_QUEUE_PATH", "./ingest_queue.db")
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+# Höchstens so lange wartet der Worker, bevor er die Queue erneut prüft
+INGEST_POLL_INTERVAL = float(os.getenv("INGEST_POLL_INTERVAL", "1"))
+INGEST_MAX_BACKOFF = float(os.getenv("INGEST_MAX_BACKOFF", "60"))
+# Danach landet ein Datensatz in `dead_letter` statt erneut versucht zu werden
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "8"))
+INGEST_DRAIN_TIMEOUT = float(os.getenv("INGEST_DRAIN_TIMEOUT", "10"))
+# So lange gehört ein beanspruchter Batch einem Worker; danach darf ihn ein anderer übernehmen
+INGEST_LEASE_SECONDS = float(os.getenv("INGEST_LEASE_SECONDS", "300"))
+
+logger = logging.getLogger(__name__)
+
+backlog = metrics.gauge("ingest_queue_backlog", "Datensätze in der Write-Behind-Queue")
+lag = metrics.gauge("ingest_queue_lag_seconds", "Alter des ältesten Datensatzes in der Write-Behind-Queue")
+ingested = metrics.counter("ingest_records_total", "Verarbeitete Datensätze nach Ergebnis (stored, retried, dead_lettered, replayed)")
+outages = metrics.counter("ingest_outages_total", "Batches, die komplett scheiterten; die Queue pausiert danach")
+batch_time = metrics.histogram("ingest_batch_seconds", "Dauer eines Write-Behind-Batches (Embedding, Vektor-DB, Commit)")
+
+
+class _Outage(Exception):
+    """Der ganze Batch scheiterte, ohne dass ein Teil davon gespeichert wurde."""
+
+    def __init__(self, error: Exception):
+        super().__init__(str(error))
+        self.error = error
+
+
+class _QueueFile:
+    """Die SQLite-Datei der Queue; alle Methoden blockieren und laufen im IO-Pool."""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # FULL: ein bestätigter Eintrag übersteht auch einen Stromausfall
+            self._conn.execute("PRAGMA synchronous=FULL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pending ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, chat_id TEXT NOT NULL UNIQUE, "
+                "prompt TEXT NOT NULL, response TEXT NOT NULL, timestamp TEXT NOT NULL, embedding BLOB, "
+                "enqueued_at REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+                "next_attempt REAL NOT NULL DEFAULT 0, last_error TEXT, claimed_by TEXT, claimed_until REAL)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(pending)")}
+            for column, kind in (("claimed_by", "TEXT"), ("claimed_until", "REAL")):
+                if column not in columns:
+                    # Queue-Datei einer älteren Version
+                    self._conn.execute(f"ALTER TABLE pending ADD COLUMN {column} {kind}")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS dead_letter ("
+                "seq INTEGER PRIMARY KEY, chat_id TEXT NOT NULL, prompt TEXT NOT NULL, response TEXT NOT NULL, "
+                "timestamp TEXT NOT NULL, embedding BLOB, enqueued_at REAL NOT NULL, attempts INTEGER NOT NULL, "
+                "last_error TEXT, failed_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def put(self, chat_id: str, prompt: str, response: str, timestamp: datetime, embedding: Optional[list]):
+        blob = np.asarray(embedding, dtype=np.float32).tobytes() if embedding is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pending (chat_id, prompt, response, timestamp, embedding, enqueued_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (chat_id, prompt, response, timestamp.isoformat(), blob, time.time()),
+            )
+            self._conn.commit()
+
+    def claim(self, limit: int, owner: str, lease: float) -> List[tuple]:
+        """Beansprucht bis zu `limit` fällige, nicht beanspruchte Einträge für `owner` (eine Schreibtransaktion)."""
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE: zwei Worker können nicht dieselben Zeilen auswählen
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT seq, chat_id, prompt, response, timestamp, embedding, attempts FROM pending "
+                    "WHERE next_attempt <= ? AND (claimed_until IS NULL OR claimed_until < ?) ORDER BY seq LIMIT ?",
+                    (now, now, limit),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE pending SET claimed_by = ?, claimed_until = ? WHERE seq = ?",
+                    [(owner, now + lease, row[0]) for row in rows],
+                )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+            return rows
+
+    def defer(self, seqs: Sequence[int], delay: float):
+        """Gibt beanspruchte Einträge frei und stellt sie zurück, ohne einen Versuch zu zählen."""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE pending SET next_attempt = ?, claimed_by = NULL, claimed_until = NULL WHERE seq = ?",
+                [(time.time() + delay, s) for s in seqs],
+            )
+            self._conn.commit()
+
+    def remove(self, seqs: List[int]):
+        with self._lock:
+            self._conn.executemany("DELETE FROM pending WHERE seq = ?", [(s,) for s in seqs])
+            self._conn.commit()
+
+    def postpone(self, seqs: List[int], delay: float, error: str):
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE pending SET attempts = attempts + 1, next_attempt = ?, last_error = ?, "
+                "claimed_by = NULL, claimed_until = NULL WHERE seq = ?",
+                [(time.time() + delay, error[:500], s) for s in seqs],
+            )
+            self._conn.commit()
+
+    def dead_letter(self, seq: int, error: str):
+        """Verschiebt einen Eintrag endgültig nach `dead_letter` (in einer Transaktion)."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO dead_letter (seq, chat_id, prompt, response, timestamp, embedding, "
+                "enqueued_at, attempts, last_error, failed_at) SELECT seq, chat_id, prompt, response, timestamp, "
+                "embedding, enqueued_at, attempts + 1, ?, ? FROM pending WHERE seq = ?",
+                (error[:500], time.time(), seq),
+            )
+            self._conn.execute("DELETE FROM pending WHERE seq = ?", (seq,))
+            self._conn.commit()
+
+    def dead_letters(self, limit: int) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chat_id, prompt, timestamp, attempts, last_error, failed_at FROM dead_letter "
+                "ORDER BY seq LIMIT ?", (limit,),
+            ).fetchall()
+        keys = ("chat_id", "prompt", "timestamp", "attempts", "last_error", "failed_at")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def replay_dead_letters(self, chat_ids: Optional[Sequence[str]] = None) -> int:
+        """Reiht Einträge aus `dead_letter` (alle oder `chat_ids`) mit zurückgesetzten Versuchen wieder ein."""
+        where, params = "", []
+        if chat_ids is not None:
+            if not chat_ids:
+                return 0
+            where, params = " WHERE chat_id IN (%s)" % ",".join("?" * len(chat_ids)), list(chat_ids)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Ursprüngliche seq: die Einträge behalten ihren Platz in der Reihenfolge
+                moved = self._conn.execute(
+                    "INSERT OR IGNORE INTO pending (seq, chat_id, prompt, response, timestamp, embedding, enqueued_at) "
+                    "SELECT seq, chat_id, prompt, response, timestamp, embedding, enqueued_at FROM dead_letter" + where,
+                    params,
+                ).rowcount
+                self._conn.execute("DELETE FROM dead_letter" + where, params)
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+            return moved
+
+    def stats(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*), MIN(enqueued_at) FROM pending").fetchone()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _write_history(db, entries: list):
+    for chat_id, prompt, response, timestamp in entries:
+        metadata = {"id": chat_id, "timestamp": timestamp}
+        # merge statt add: ein wiederholter Batch darf bereits geschriebene Zeilen nicht verdoppeln
+        db.merge(ChatHistory(id=chat_id, prompt=prompt, response=response, timestamp=timestamp,
+                             chat_metadata=json.dumps(metadata, default=str)))
+    db.commit()
+
+
+class IngestQueue:
+    def __init__(self, path: str = INGEST_QUEUE_PATH, batch_size: int = INGEST_BATCH_SIZE):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self._file: Optional[_QueueFile] = None
+        self._file_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self.owner = uuid.uuid4().hex
+        # Ausfall-Backoff der ganzen Queue (pro Worker)
+        self._outages = 0
+        self._paused_until = 0.0
+
+    def _queue_file(self) -> _QueueFile:
+        with self._file_lock:
+            if self._file is None:
+                self._file = _QueueFile(self.path)
+            return self._file
+
+    async def enqueue(self, chat_id: str, prompt: str, response: str, timestamp: datetime,
+                      embedding: Optional[list] = None):
+        """Kehrt zurück, sobald der Datensatz dauerhaft in der Queue-Datei steht."""
+        await run_io(self._queue_file().put, chat_id, prompt, response, timestamp, embedding)
+        backlog.inc()
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self):
+        """Startet den Worker im laufenden Event-Loop (Lifespan); ältere Einträge werden zuerst verarbeitet."""
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self, timeout: float = INGEST_DRAIN_TIMEOUT):
+        """Arbeitet fällige Einträge bis `timeout` ab; was dann noch offen ist, bleibt in der Datei."""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Write-Behind-Queue nicht vollständig geleert; Rest wird beim nächsten Start verarbeitet")
+        self._task = None
+        with self._file_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    async def _run(self):
+        while True:
+            try:
+                processed = await self.process_batch()
+                count, oldest = await run_io(self._queue_file().stats)
+            except Exception:
+                # Datei- oder Pool-Fehler: nicht abbrechen, sondern später erneut versuchen
+                logger.exception("Write-Behind-Worker: Fehler beim Abarbeiten der Queue")
+                processed, count, oldest = 0, None, None
+            if count is not None:
+                backlog.set(count)
+                lag.set(time.time() - oldest if oldest else 0)
+            if self._stopping and not processed:
+                return
+            if not processed:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), INGEST_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def process_batch(self) -> int:
+        """Verarbeitet einen Batch fälliger Einträge; liefert die Anzahl erfolgreich gespeicherter."""
+        if time.monotonic() < self._paused_until:
+            return 0
+        queue = self._queue_file()
+        rows = await run_io(queue.claim, self.batch_size, self.owner, INGEST_LEASE_SECONDS)
+        if not rows:
+            return 0
+        started = time.perf_counter()
+        try:
+            stored = await self._store_or_split(queue, rows)
+        except _Outage as e:
+            delay = self._outage(e.error)
+            # Ohne Zählung zurückstellen: besteht der Batch nur aus fehlerhaften Datensätzen, kommen so
+            # neuere zum Zug; gelingen die, wird der Rest beim nächsten gemischten Batch eingegrenzt
+            await run_io(queue.defer, [row[0] for row in rows], delay)
+            return 0
+        finally:
+            batch_time.observe(time.perf_counter() - started)
+        self._outages = 0
+        return stored
+
+    def _outage(self, error: Exception) -> float:
+        self._outages += 1
+        delay = min(INGEST_MAX_BACKOFF, 2 ** self._outages)
+        self._paused_until = time.monotonic() + delay
+        outages.inc()
+        logger.warning("Write-Behind: Batch komplett fehlgeschlagen, Queue pausiert %.0f s: %s", delay, error)
+        return delay
+
+    async def _attempt(self, queue: _QueueFile, rows: List[tuple]) -> Optional[Exception]:
+        """Speichert `rows` und entfernt sie aus der Queue; liefert den Fehler statt ihn zu werfen."""
+        try:
+            await self._store(rows)
+        except Exception as e:
+            return e
+        await run_io(queue.remove, [row[0] for row in rows])
+        ingested.inc(len(rows), {"result": "stored"})
+        return None
+
+    async def _store_or_split(self, queue: _QueueFile, rows: List[tuple]) -> int:
+        """
+        Speichert `rows`; scheitert das, werden die Hälften versucht. Scheitert dabei alles, gilt das
+        als Ausfall (`_Outage`), sonst wird der fehlerhafte Teil weiter eingegrenzt.
+        """
+        error = await self._attempt(queue, rows)
+        if error is None:
+            return len(rows)
+        if len(rows) == 1:
+            raise _Outage(error)
+        middle = len(rows) // 2
+        halves = (rows[:middle], rows[middle:])
+        errors = [await self._attempt(queue, half) for half in halves]
+        if all(errors):
+            raise _Outage(errors[-1])
+        stored = 0
+        for half, half_error in zip(halves, errors):
+            stored += len(half) if half_error is None else await self._isolate(queue, half, half_error)
+        return stored
+
+    async def _isolate(self, queue: _QueueFile, rows: List[tuple], error: Exception) -> int:
+        """Ein anderer Teil des Batches wurde gespeichert: der Fehler liegt an einzelnen Datensätzen."""
+        if len(rows) == 1:
+            await self._failed(queue, rows[0], error)
+            return 0
+        middle = len(rows) // 2
+        stored = 0
+        for half in (rows[:middle], rows[middle:]):
+            half_error = await self._attempt(queue, half)
+            stored += len(half) if half_error is None else await self._isolate(queue, half, half_error)
+        return stored
+
+    async def _store(self, rows: List[tuple]):
+        timestamps = [datetime.fromisoformat(row[4]) for row in rows]
+        embeddings = [np.frombuffer(row[5], dtype=np.float32).tolist() if row[5] else None for row in rows]
+        missing = [i for i, e in enumerate(embeddings) if e is None]
+        if missing:
+            vectors = await run_embed(embedding_service.embed_many, [rows[i][2] for i in missing])
+            for i, vector in zip(missing, vectors):
+                embeddings[i] = vector
+        metadatas = [
+            {"id": row[1], "timestamp": ts.isoformat(), "ts": to_epoch(ts)}
+            for row, ts in zip(rows, timestamps)
+        ]
+        await run_io(vector_db.add_many, [row[2] for row in rows], embeddings, metadatas)
+        await run_db(_write_history, [(row[1], row[2], row[3], ts) for row, ts in zip(rows, timestamps)])
+
+    async def _failed(self, queue: _QueueFile, row: tuple, error: Exception):
+        seq, chat_id, attempts = row[0], row[1], row[6] + 1
+        if attempts >= INGEST_MAX_ATTEMPTS:
+            logger.error("Write-Behind: Chat %s nach %d Versuchen nach dead_letter verschoben: %s", chat_id, attempts, error)
+            await run_io(queue.dead_letter, seq, repr(error))
+            ingested.inc(1, {"result": "dead_lettered"})
+            return
+        delay = min(INGEST_MAX_BACKOFF, 2 ** attempts)
+        logger.warning("Write-Behind: Chat %s fehlgeschlagen (Versuch %d), neuer Versuch in %.0f s: %s",
+                       chat_id, attempts, delay, error)
+        await run_io(queue.postpone, [seq], delay, repr(error))
+        ingested.inc(1, {"result": "retried"})
+
+    async def replay_dead_letters(self, chat_ids: Optional[Sequence[str]] = None) -> int:
+        moved = await run_io(self._queue_file().replay_dead_letters, chat_ids)
+        if moved:
+            ingested.inc(moved, {"result": "replayed"})
+            backlog.inc(moved)
+            if self._wakeup is not None:
+                self._wakeup.set()
+        return moved
+
+    async def dead_letters(self, limit: int = 100) -> List[dict]:
+        return await run_io(self._queue_file().dead_letters, limit)
+
+
+ingest_queue = IngestQueue()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Dead Letters der Write-Behind-Queue anzeigen oder wieder einreihen")
+    parser.add_argument("--replay", action="store_true", help="Dead Letters wieder in die Queue stellen")
+    parser.add_argument("--chat-id", action="append", help="Nur diese Chats (mehrfach angebbar)")
+    args = parser.parse_args()
+    queue_file = _QueueFile(INGEST_QUEUE_PATH)
+    try:
+        if args.replay:
+            print(f"Wieder eingereiht: {queue_file.replay_dead_letters(args.chat_id)}")
+        else:
+            for entry in queue_file.dead_letters(1000):
+                print(json.dumps(entry, default=str))
+    finally:
+        queue_file.close()
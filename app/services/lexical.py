@@ -0,0 +1,204 @@
+"""
+Lexikalischer Index (SQLite FTS5, BM25) über `chat_history.prompt/response` und `chat_messages.text`.
+
+Findet exakte Bezeichner, Fehlercodes und Namen, die das Embedding-Modell schlecht abbildet.
+Die FTS-Tabellen sind "external content" der Quelltabellen (kein doppelter Text) und werden
+per Trigger im selben Commit gepflegt – egal ob über die API, die Ingest-Queue, den
+Session-Import oder datagen geschrieben wird.
+
+Nur mit SQLite und FTS5 verfügbar; sonst liefert `is_available()` False und /query nutzt
+im Modus `hybrid` allein die Vektor-Suche.
+
+Neu aufbauen (z.B. nach VACUUM, das die rowids der Quelltabellen umnummerieren kann):
+    python -m app.services.lexical --rebuild
+"""
+import logging
+import re
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import DateTime, bindparam, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app.core import metrics
+from app.core.utils import to_epoch, to_naive_utc
+
+logger = logging.getLogger(__name__)
+
+lexical_query_time = metrics.histogram("lexical_query_seconds", "Dauer der BM25-Suche im FTS5-Index")
+
+# Quelltabelle -> (FTS-Tabelle, indizierte Spalten, BM25-Gewichte)
+_SOURCES = {
+    "chat_history": ("chat_history_fts", ("prompt", "response"), (2.0, 1.0)),
+    "chat_messages": ("chat_messages_fts", ("text",), (1.0,)),
+}
+# Max. Suchbegriffe pro Query (lange Prompts sollen keine riesigen OR-Ausdrücke erzeugen)
+_MAX_TERMS = 32
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+_available: Optional[bool] = None
+
+
+def _ddl(source: str) -> List[str]:
+    fts, columns, _ = _SOURCES[source]
+    cols = ", ".join(columns)
+    new = ", ".join(f"new.{c}" for c in columns)
+    old = ", ".join(f"old.{c}" for c in columns)
+    delete = f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES('delete', old.rowid, {old});"
+    insert = f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.rowid, {new});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{source}', "
+        f"tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {source} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {source} BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {source} BEGIN {delete} {insert} END",
+    ]
+
+
+def _exists(conn: Connection) -> bool:
+    names = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+    return all(fts in names for fts, _, _ in _SOURCES.values())
+
+
+def ensure(conn: Connection) -> bool:
+    """Legt FTS-Tabellen und Trigger an (idempotent) und füllt sie beim ersten Mal; False ohne FTS5."""
+    global _available
+    if conn.dialect.name != "sqlite":
+        logger.info("Lexikalischer Index nur mit SQLite verfügbar (Dialekt: %s)", conn.dialect.name)
+        _available = False
+        return False
+    created = not _exists(conn)
+    try:
+        for source in _SOURCES:
+            for statement in _ddl(source):
+                conn.execute(text(statement))
+    except OperationalError as e:
+        logger.warning("FTS5 nicht verfügbar, lexikalische Suche deaktiviert: %s", e)
+        _available = False
+        return False
+    if created:
+        rebuild(conn)
+    _available = True
+    return True
+
+
+def rebuild(conn: Connection):
+    """Baut den Index vollständig aus den Quelltabellen neu auf."""
+    for fts, _, _ in _SOURCES.values():
+        conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES('rebuild')"))
+
+
+def is_available() -> bool:
+    global _available
+    if _available is None:
+        from app.services.db import engine
+        try:
+            with engine.connect() as conn:
+                _available = conn.dialect.name == "sqlite" and _exists(conn)
+        except Exception:
+            logger.exception("Prüfung des lexikalischen Index fehlgeschlagen")
+            return False
+    return _available
+
+
+def match_expression(query: str) -> Optional[str]:
+    """
+    Freitext -> FTS5-Ausdruck: Wörter als Phrasen in Anführungszeichen, per OR verknüpft
+    (BM25 rankt Treffer mit mehr Begriffen höher). Sonderzeichen der FTS-Syntax fallen dabei weg.
+    """
+    terms = list(dict.fromkeys(t.lower() for t in _TOKEN.findall(query)))[:_MAX_TERMS]
+    if not terms:
+        return None
+    return " OR ".join(f'"{t}"' for t in terms)
+
+
+def _history_sql(since: bool, until: bool) -> str:
+    weights = ", ".join(str(w) for w in _SOURCES["chat_history"][2])
+    sql = (
+        f"SELECT h.id, h.prompt, h.timestamp, bm25(chat_history_fts, {weights}) AS rank "
+        "FROM chat_history_fts JOIN chat_history h ON h.rowid = chat_history_fts.rowid "
+        "WHERE chat_history_fts MATCH :q"
+    )
+    if since:
+        sql += " AND h.timestamp >= :since"
+    if until:
+        sql += " AND h.timestamp <= :until"
+    return sql + " ORDER BY rank LIMIT :n"
+
+
+def _messages_sql(session_id: bool, sender: bool, since: bool, until: bool) -> str:
+    sql = (
+        "SELECT m.id, m.text, m.timestamp, m.session_id, m.sender, bm25(chat_messages_fts) AS rank "
+        "FROM chat_messages_fts JOIN chat_messages m ON m.rowid = chat_messages_fts.rowid "
+        "WHERE chat_messages_fts MATCH :q"
+    )
+    if session_id:
+        sql += " AND m.session_id = :session_id"
+    if sender:
+        sql += " AND m.sender = :sender"
+    if since:
+        sql += " AND m.timestamp >= :since"
+    if until:
+        sql += " AND m.timestamp <= :until"
+    return sql + " ORDER BY rank LIMIT :n"
+
+
+def _bind(sql: str):
+    statement = text(sql)
+    for name in ("since", "until"):
+        if f":{name}" in sql:
+            statement = statement.bindparams(bindparam(name, type_=DateTime))
+    return statement.columns(timestamp=DateTime)
+
+
+def search(db: Session, query: str, n_results: int = 5, session_id: Optional[str] = None,
+           sender: Optional[str] = None, since: Optional[datetime] = None,
+           until: Optional[datetime] = None) -> List[Tuple[str, dict, float]]:
+    """
+    BM25-Suche über Chat-Verlauf und Session-Nachrichten mit denselben Filtern wie die
+    Vektor-Suche. Ergebnis wie `search_vector_db`: (Dokument, Metadaten, Score), Score = -bm25
+    (höher = besser). Einträge aus chat_history haben weder Session noch Sender und entfallen,
+    sobald danach gefiltert wird.
+    """
+    expression = match_expression(query)
+    if expression is None or not is_available():
+        return []
+    since, until = to_naive_utc(since), to_naive_utc(until)
+    params = {"q": expression, "n": n_results}
+    for name, value in (("session_id", session_id), ("sender", sender), ("since", since), ("until", until)):
+        if value is not None:
+            params[name] = value
+    hits = []
+    with metrics.timed(lexical_query_time, "lexical"):
+        if not session_id and not sender:
+            for row in db.execute(_bind(_history_sql(since is not None, until is not None)), params):
+                ts = row.timestamp
+                meta = {"id": row.id, "timestamp": ts.isoformat() if ts else None}
+                if ts:
+                    meta["ts"] = to_epoch(ts)
+                hits.append((row.prompt or "", meta, -row.rank))
+        sql = _messages_sql(bool(session_id), bool(sender), since is not None, until is not None)
+        for row in db.execute(_bind(sql), params):
+            meta = {"id": row.id, "session_id": row.session_id, "sender": row.sender}
+            if row.timestamp:
+                meta["ts"] = to_epoch(row.timestamp)
+            hits.append((row.text, meta, -row.rank))
+    # BM25 beider Tabellen ist nur näherungsweise vergleichbar; für die Fusion zählt der Rang
+    hits.sort(key=lambda hit: hit[2], reverse=True)
+    return hits[:n_results]
+
+
+if __name__ == "__main__":
+    import argparse
+    from app.services.db import engine
+
+    parser = argparse.ArgumentParser(description="Lexikalischen Index (FTS5) anlegen bzw. neu aufbauen")
+    parser.add_argument("--rebuild", action="store_true", help="Index vollständig aus den Tabellen neu aufbauen")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    with engine.begin() as conn:
+        if ensure(conn) and args.rebuild:
+            rebuild(conn)
+    print(f"Lexikalischer Index verfügbar: {_available}")
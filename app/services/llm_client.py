@@ -1,25 +1,253 @@
+"""
+Ollama-Client mit Generierungs-Scheduler.
+
+- Single-Flight: identische, gleichzeitig laufende (Modell, Prompt)-Paare erzeugen nur
+  eine Generierung; alle Wartenden erhalten denselben Token-Stream.
+- Pro Modell höchstens OLLAMA_MAX_CONCURRENCY parallele Generierungen; weitere warten in
+  einer Queue mit höchstens OLLAMA_MAX_QUEUE Einträgen. Ist sie voll, wird sofort
+  `GenerationQueueFull` geworfen (die API antwortet mit 429).
+- Hintergrund-Generierungen (z.B. Zusammenfassungen) haben eigene Slots
+  (OLLAMA_BACKGROUND_CONCURRENCY) und eine eigene Queue; sie belegen keinen Platz in der
+  Queue der Anfragen und können deshalb kein 429 auslösen.
+"""
+import asyncio
 import os
-import httpx
+import time
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from app.core import metrics
+from app.services.http_clients import get_client
 
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "2"))
+OLLAMA_MAX_QUEUE = int(os.getenv("OLLAMA_MAX_QUEUE", "32"))
+# Hintergrund-Generierungen (Zusammenfassungen): parallel pro Modell und wartend, darüber GenerationQueueFull
+OLLAMA_BACKGROUND_CONCURRENCY = int(os.getenv("OLLAMA_BACKGROUND_CONCURRENCY", "1"))
+OLLAMA_BACKGROUND_QUEUE = int(os.getenv("OLLAMA_BACKGROUND_QUEUE", "8"))
+# Empfohlene Wartezeit in Sekunden für den Retry-After-Header bei voller Queue
+OLLAMA_RETRY_AFTER = int(os.getenv("OLLAMA_RETRY_AFTER", "2"))
 
 import json
 
-async def query_ollama(prompt: str, model: str = "llama2") -> str:
+ollama_ttft = metrics.histogram(
+    "ollama_time_to_first_token_seconds",
+    "Zeit vom Absenden des Prompts bis zum ersten Token von Ollama",
+)
+ollama_generation_time = metrics.histogram(
+    "ollama_generation_seconds",
+    "Gesamtdauer einer Ollama-Generierung",
+)
+ollama_queue_wait = metrics.histogram(
+    "ollama_queue_wait_seconds",
+    "Wartezeit einer Generierung auf einen freien Slot",
+)
+ollama_queue_depth = metrics.gauge("ollama_queue_depth", "Generierungen, die auf einen freien Slot warten")
+ollama_active = metrics.gauge("ollama_active_generations", "Gerade laufende Generierungen")
+ollama_requests = metrics.counter(
+    "ollama_requests_total",
+    "Generierungsanfragen nach Ergebnis (started, coalesced, rejected, background, background_rejected)",
+)
+
+
+class GenerationQueueFull(Exception):
+    """Die Warteschlange für dieses Modell ist voll; der Aufrufer soll es später erneut versuchen."""
+
+    def __init__(self, model: str, retry_after: int = OLLAMA_RETRY_AFTER):
+        super().__init__(f"Zu viele ausstehende Generierungen für Modell {model}")
+        self.model = model
+        self.retry_after = retry_after
+
+
+async def _stream_upstream(prompt: str, model: str) -> AsyncIterator[str]:
+    """Ein einzelner Streaming-Request an Ollama, ohne Scheduler."""
+    url = f"{OLLAMA_BASE_URL}/api/generate"
+    payload = {"model": model, "prompt": prompt, "stream": True}
+    started = time.perf_counter()
+    first_token = True
+    client = get_client("ollama")
+    async with client.stream("POST", url, json=payload) as response:
+        async for line in response.aiter_lines():
+            if line.strip():
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                chunk = data.get("response", "")
+                if chunk:
+                    if first_token:
+                        ttft = time.perf_counter() - started
+                        ollama_ttft.observe(ttft, {"model": model})
+                        metrics.record_timing("ollama_ttft", ttft)
+                        first_token = False
+                    yield chunk
+                if data.get("done"):
+                    break
+    elapsed = time.perf_counter() - started
+    ollama_generation_time.observe(elapsed, {"model": model})
+    metrics.record_timing("ollama", elapsed)
+
+
+class _Flight:
+    """Eine laufende Generierung; Chunks werden gesammelt, damit spät Hinzukommende von vorn lesen."""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, chunk: str):
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait(self):
+        await self._changed.wait()
+
+
+class GenerationScheduler:
+    def __init__(self, max_concurrency: int = OLLAMA_MAX_CONCURRENCY, max_queue: int = OLLAMA_MAX_QUEUE):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._flights: Dict[Tuple[str, str], _Flight] = {}
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+        # Angenommene, noch nicht beendete Generierungen (laufend + wartend) pro Modell
+        self._admitted: Dict[str, int] = {}
+        self._background_slots: Dict[str, asyncio.Semaphore] = {}
+        self._background_admitted: Dict[str, int] = {}
+
+    def _reset_if_new_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Neuer Event-Loop (z.B. Neustart im selben Prozess): alten Zustand verwerfen
+            self._loop, self._flights, self._slots, self._admitted = loop, {}, {}, {}
+            self._background_slots, self._background_admitted = {}, {}
+
+    def stream(self, prompt: str, model: str) -> AsyncIterator[str]:
+        """
+        Meldet eine Generierung an und liefert einen Iterator über ihre Chunks.
+        Wirft `GenerationQueueFull` sofort (vor dem ersten Chunk), wenn die Queue voll ist.
+        Verlassen alle Leser den Stream vorzeitig, wird die Ollama-Anfrage abgebrochen.
+        """
+        self._reset_if_new_loop()
+        key = (model, prompt)
+        flight = self._flights.get(key)
+        if flight is not None:
+            ollama_requests.inc(labels={"model": model, "result": "coalesced"})
+        else:
+            if self._admitted.get(model, 0) >= self.max_concurrency + self.max_queue:
+                ollama_requests.inc(labels={"model": model, "result": "rejected"})
+                raise GenerationQueueFull(model)
+            ollama_requests.inc(labels={"model": model, "result": "started"})
+            self._admitted[model] = self._admitted.get(model, 0) + 1
+            slots = self._slots.setdefault(model, asyncio.Semaphore(self.max_concurrency))
+            flight = self._flights[key] = _Flight()
+            flight.task = self._loop.create_task(self._produce(key, flight, slots))
+        flight.subscribers += 1
+        return self._follow(key, flight)
+
+    async def generate_background(self, prompt: str, model: str) -> str:
+        """
+        Generierung mit niedriger Priorität: eigene Slots und Queue pro Modell, kein Single-Flight
+        mit Anfragen. Wirft `GenerationQueueFull`, wenn schon zu viele Hintergrund-Generierungen warten.
+        """
+        self._reset_if_new_loop()
+        limit = max(1, OLLAMA_BACKGROUND_CONCURRENCY)
+        if self._background_admitted.get(model, 0) >= limit + max(0, OLLAMA_BACKGROUND_QUEUE):
+            ollama_requests.inc(labels={"model": model, "result": "background_rejected"})
+            raise GenerationQueueFull(model)
+        ollama_requests.inc(labels={"model": model, "result": "background"})
+        self._background_admitted[model] = self._background_admitted.get(model, 0) + 1
+        try:
+            async with self._background_slots.setdefault(model, asyncio.Semaphore(limit)):
+                return "".join([chunk async for chunk in _stream_upstream(prompt, model)])
+        finally:
+            self._background_admitted[model] -= 1
+
+    async def _produce(self, key: Tuple[str, str], flight: _Flight, slots: asyncio.Semaphore):
+        model, prompt = key
+        labels = {"model": model}
+        queued = time.perf_counter()
+        ollama_queue_depth.inc(1, labels)
+        error = None
+        try:
+            try:
+                await slots.acquire()
+            finally:
+                ollama_queue_depth.dec(1, labels)
+            ollama_queue_wait.observe(time.perf_counter() - queued, labels)
+            ollama_active.inc(1, labels)
+            try:
+                async for chunk in _stream_upstream(prompt, model):
+                    flight.publish(chunk)
+            finally:
+                ollama_active.dec(1, labels)
+                slots.release()
+        except asyncio.CancelledError as e:
+            error = e
+            raise
+        except Exception as e:
+            error = e
+        finally:
+            self._admitted[model] -= 1
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.finish(error)
+
+    async def _follow(self, key: Tuple[str, str], flight: _Flight) -> AsyncIterator[str]:
+        position = 0
+        try:
+            while True:
+                while position < len(flight.chunks):
+                    yield flight.chunks[position]
+                    position += 1
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # Letzter Leser weg (z.B. Client-Abbruch): neue Anfragen nicht mehr anhängen
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+
+
+scheduler = GenerationScheduler()
+
+
+def stream_ollama(prompt: str, model: str = "llama2") -> AsyncIterator[str]:
+    """
+    Send a prompt to the local Ollama server and return an async iterator over response chunks.
+    Identical in-flight prompts share one generation; raises GenerationQueueFull when the
+    model's queue is full. Closing the iterator (e.g. on client disconnect) aborts the
+    upstream request once no other request is reading it.
+    """
+    return scheduler.stream(prompt, model)
+
+
+async def query_ollama(prompt: str, model: str = "llama2", background: bool = False) -> str:
     """
     Send a prompt to the local Ollama server and return the response.
-    Handles streaming responses from Ollama correctly.
+    Handles streaming responses from Ollama correctly. `background=True` runs it with low
+    priority outside the request queue (see GenerationScheduler.generate_background).
     """
-    url = f"{OLLAMA_BASE_URL}/api/generate"
-    payload = {"model": model, "prompt": prompt, "stream": True}
+    if background:
+        return await scheduler.generate_background(prompt, model)
     response_text = ""
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        async with client.stream("POST", url, json=payload) as response:
-            async for line in response.aiter_lines():
-                if line.strip():
-                    try:
-                        data = json.loads(line)
-                        response_text += data.get("response", "")
-                    except json.JSONDecodeError:
-                        pass
+    async for chunk in stream_ollama(prompt, model=model):
+        response_text += chunk
     return response_text
@@ -0,0 +1,202 @@
+"""
+Schlanke, versionierte Schema-Migrationen.
+
+Jede Migration ist eine Funktion, die eine Connection bekommt und idempotent ist
+(sie darf auf einer Datenbank laufen, die mit dem alten `create_all` angelegt wurde).
+Die angewendeten Versionen stehen in der Tabelle `schema_migrations`.
+
+Starten mehrere Worker gleichzeitig, migriert nur einer: Postgres serialisiert über
+`pg_advisory_lock`, SQLite über `BEGIN IMMEDIATE` je Migration. Jede Migration liest die
+Version in ihrer Transaktion neu und überspringt, was ein anderer Worker schon angewendet hat.
+
+Manuell ausführen:
+    python -m app.services.migrations
+"""
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import (Column, DateTime, ForeignKey, Integer, MetaData, String, Table, Text, func, inspect, select,
+                        text, update)
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+
+from app.services.db import ChatHistory, ChatMessage, ChatSession, ListVersion, ReindexChange, ReindexJob, VectorCollection
+
+logger = logging.getLogger(__name__)
+
+_meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _meta,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+# Schlüssel für pg_advisory_lock (beliebig, aber fest)
+_LOCK_KEY = 0x6D696772
+
+# Schema vor der ersten Migration, eingefroren: spätere Modelländerungen gehören in neue Migrationen
+_baseline = MetaData()
+Table(
+    "chat_sessions",
+    _baseline,
+    Column("id", String, primary_key=True),
+    Column("title", String, nullable=True),
+    Column("created_at", DateTime),
+)
+Table(
+    "chat_messages",
+    _baseline,
+    Column("id", String, primary_key=True),
+    Column("session_id", String, ForeignKey("chat_sessions.id"), nullable=False),
+    Column("sender", String, nullable=False),
+    Column("text", Text, nullable=False),
+    Column("timestamp", DateTime),
+)
+Table(
+    "chat_history",
+    _baseline,
+    Column("id", String, primary_key=True, index=True),
+    Column("prompt", Text),
+    Column("response", Text),
+    Column("timestamp", DateTime),
+    Column("chat_metadata", Text, nullable=True),
+)
+
+
+def _create_base_schema(conn: Connection):
+    _baseline.create_all(conn, checkfirst=True)
+
+
+def _add_query_indexes(conn: Connection):
+    for index in list(ChatMessage.__table__.indexes) + list(ChatHistory.__table__.indexes):
+        index.create(conn, checkfirst=True)
+
+
+def _add_reindex_tables(conn: Connection):
+    VectorCollection.__table__.create(conn, checkfirst=True)
+    ReindexJob.__table__.create(conn, checkfirst=True)
+
+
+def _add_session_aggregates(conn: Connection):
+    table = ChatSession.__table__
+    existing = {c["name"] for c in inspect(conn).get_columns(table.name)}
+    for column in (table.c.message_count, table.c.last_message_at):
+        if column.name in existing:
+            continue
+        ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=conn.dialect)}"
+        if column.server_default is not None:
+            ddl += f" NOT NULL DEFAULT {column.server_default.arg}"
+        conn.execute(text(ddl))
+    for index in table.indexes:
+        index.create(conn, checkfirst=True)
+    # Backfill in einem UPDATE mit korrelierten Subqueries (nutzt den Index session_id, timestamp)
+    messages = ChatMessage.__table__
+    conn.execute(update(table).values(
+        message_count=select(func.count(messages.c.id)).where(messages.c.session_id == table.c.id).scalar_subquery(),
+        last_message_at=select(func.max(messages.c.timestamp)).where(messages.c.session_id == table.c.id).scalar_subquery(),
+    ))
+
+
+def _add_lexical_index(conn: Connection):
+    # Nur SQLite mit FTS5; sonst bleibt die lexikalische Suche aus (nachholen: python -m app.services.lexical)
+    from app.services import lexical
+    lexical.ensure(conn)
+
+
+def _add_reindex_changes(conn: Connection):
+    ReindexChange.__table__.create(conn, checkfirst=True)
+
+
+def _add_list_versions(conn: Connection):
+    import uuid
+    table = ListVersion.__table__
+    table.create(conn, checkfirst=True)
+    if conn.execute(select(table.c.name).where(table.c.name == "sessions")).first() is None:
+        conn.execute(table.insert().values(name="sessions", token=uuid.uuid4().hex[:12], version=0))
+
+
+# (Version, Beschreibung, Funktion) – nur hinten anfügen, nie umnummerieren
+MIGRATIONS = [
+    (1, "Basisschema", _create_base_schema),
+    (2, "Indizes chat_messages(session_id, timestamp) und chat_history(timestamp)", _add_query_indexes),
+    (3, "Tabellen vector_collections und reindex_jobs", _add_reindex_tables),
+    (4, "chat_sessions.message_count/last_message_at samt Backfill, Index chat_sessions(created_at, id)", _add_session_aggregates),
+    (5, "FTS5-Index chat_history_fts/chat_messages_fts samt Triggern", _add_lexical_index),
+    (6, "Tabelle reindex_changes (Schreibzugriffe während eines Re-Index)", _add_reindex_changes),
+    (7, "Tabelle list_versions (ETag von /sessions über alle Worker)", _add_list_versions),
+]
+
+
+def current_version(conn: Connection) -> int:
+    return conn.execute(select(func.coalesce(func.max(schema_migrations.c.version), 0))).scalar()
+
+
+@contextmanager
+def _advisory_lock(engine: Engine):
+    """Hält auf Postgres für die Dauer aller Migrationen eine Sperre; sonst ohne Wirkung."""
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": _LOCK_KEY})
+        conn.commit()
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _LOCK_KEY})
+            conn.commit()
+
+
+@contextmanager
+def _transaction(engine: Engine):
+    """`engine.begin()`, auf SQLite mit sofortiger Schreibsperre statt erst beim ersten Schreiben."""
+    with engine.begin() as conn:
+        if conn.dialect.name == "sqlite":
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        yield conn
+
+
+def _apply(engine: Engine, number: int, description: str, migrate) -> bool:
+    """Wendet eine Migration an; False, wenn ein anderer Worker sie schon angewendet hat."""
+    try:
+        # Jede Migration in eigener Transaktion, damit ein Fehler nichts halb anwendet
+        with _transaction(engine) as conn:
+            if current_version(conn) >= number:
+                return False
+            migrate(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=number, description=description, applied_at=datetime.utcnow()
+            ))
+    except IntegrityError:
+        # Dialekte ohne Sperre: ein anderer Worker hat die Version zuerst eingetragen
+        with engine.connect() as conn:
+            if current_version(conn) >= number:
+                return False
+        raise
+    return True
+
+
+def run_migrations(engine: Engine) -> int:
+    """Wendet alle ausstehenden Migrationen an und gibt die neue Schema-Version zurück."""
+    with _advisory_lock(engine):
+        with _transaction(engine) as conn:
+            _meta.create_all(conn, checkfirst=True)
+            version = current_version(conn)
+        for number, description, migrate in MIGRATIONS:
+            if number <= version:
+                continue
+            if _apply(engine, number, description, migrate):
+                logger.info("Migration %d angewendet: %s", number, description)
+        with engine.connect() as conn:
+            return current_version(conn)
+
+
+if __name__ == "__main__":
+    from app.services.db import engine
+
+    logging.basicConfig(level=logging.INFO)
+    print(f"Schema-Version: {run_migrations(engine)}")
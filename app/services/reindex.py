@@ -0,0 +1,342 @@
+"""
+Re-Index der Vektor-DB, z.B. nach einem Wechsel des Embedding-Modells oder um die
+Null-Vektoren zu ersetzen, die restore_session für Nachrichten ohne Embedding einfügt.
+
+Ablauf: ChatHistory (Prompt) und ChatMessage (Text) werden per Keyset über die ID in Chunks
+von REINDEX_CHUNK_SIZE Zeilen gelesen, in Batches von REINDEX_EMBED_BATCH eingebettet und in eine
+neue, versionierte Collection (`chat_data_v2`, ...) geschrieben. Nach jedem Chunk steht der
+Fortschritt in `reindex_jobs`; ein angehaltener Lauf setzt beim nächsten Start dort wieder auf,
+ein fehlgeschlagener wird verworfen und neu begonnen.
+Solange ein Job läuft oder angehalten ist, protokolliert `vector_db` jedes add/delete in
+`reindex_changes`. Andere Prozesse bemerken einen neuen Job erst nach VECTOR_ACTIVE_CHECK_INTERVAL;
+so lange wartet der Job vor dem ersten Chunk. Zum Schluss werden die Änderungen in Reihenfolge
+nachgespielt (auch Zeilen mit alten Zeitstempeln und Löschungen), die neue Collection wird aktiviert
+(`vector_db.activate`), nach einem weiteren Intervall schreiben alle Prozesse in die neue Collection,
+und was bis dahin noch in die alte ging, wird ein weiteres Mal nachgespielt. Die alte Collection
+bleibt bis zum Umschalten aktiv.
+
+    python -m app.services.reindex [--model NAME] [--restart]
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core import metrics
+from app.core.utils import generate_id, to_epoch
+from app.services import vector_db
+from app.services.db import ChatHistory, ChatMessage, ReindexChange, ReindexJob, SessionLocal, VectorCollection
+from app.services.embedding import EmbeddingService, embedding_service
+from app.services.embedding_cache import EmbeddingCache
+from app.services.vector_store import DEFAULT_COLLECTION, VECTOR_BACKEND, create_store
+
+REINDEX_CHUNK_SIZE = int(os.getenv("REINDEX_CHUNK_SIZE", "1000"))
+REINDEX_EMBED_BATCH = int(os.getenv("REINDEX_EMBED_BATCH", "256"))
+
+PHASES = ("history", "messages", "catchup")
+# Status fortsetzbarer Jobs; für sie protokolliert vector_db Schreibzugriffe (reindex_changes)
+PENDING = ("running", "paused")
+# Fehlgeschlagene Jobs werden nicht fortgesetzt, sondern beim nächsten Start verworfen
+UNFINISHED = PENDING + ("failed",)
+
+logger = logging.getLogger(__name__)
+
+reindexed = metrics.counter("reindex_documents_total", "Beim Re-Index eingebettete und geschriebene Dokumente")
+throughput = metrics.gauge("reindex_docs_per_second", "Durchsatz des laufenden Re-Index")
+
+
+def _history_docs(rows) -> tuple:
+    texts = [r.prompt or "" for r in rows]
+    metadatas = []
+    for r in rows:
+        meta = {"id": r.id}
+        if r.timestamp:
+            meta.update(timestamp=r.timestamp.isoformat(), ts=to_epoch(r.timestamp))
+        metadatas.append(meta)
+    return texts, metadatas
+
+
+def _message_docs(rows) -> tuple:
+    texts = [r.text for r in rows]
+    metadatas = []
+    for r in rows:
+        meta = {"id": r.id, "session_id": r.session_id, "sender": r.sender}
+        if r.timestamp:
+            meta["ts"] = to_epoch(r.timestamp)
+        metadatas.append(meta)
+    return texts, metadatas
+
+
+def _history_query(db: Session):
+    return db.query(ChatHistory.id, ChatHistory.prompt, ChatHistory.timestamp)
+
+
+def _message_query(db: Session):
+    return db.query(ChatMessage.id, ChatMessage.session_id, ChatMessage.sender, ChatMessage.text, ChatMessage.timestamp)
+
+
+# Phase -> (Abfrage, Modell für ID/Zeitstempel, Umwandlung in Dokumente)
+_SOURCES = {
+    "history": (_history_query, ChatHistory, _history_docs),
+    "messages": (_message_query, ChatMessage, _message_docs),
+}
+
+
+def _next_collection_name(db: Session, backend: str) -> str:
+    names = [row[0] for row in db.query(VectorCollection.name).filter_by(backend=backend)]
+    names += [row[0] for row in db.query(ReindexJob.collection).filter_by(backend=backend)]
+    versions = [int(m.group(1)) for m in (re.fullmatch(rf"{DEFAULT_COLLECTION}_v(\d+)", n) for n in names) if m]
+    return f"{DEFAULT_COLLECTION}_v{max(versions, default=1) + 1}"
+
+
+def _job_status(job: Optional[ReindexJob], running: bool) -> Optional[dict]:
+    if job is None:
+        return None
+    remaining = max(0, job.total - job.processed)
+    return {
+        "id": job.id,
+        "collection": job.collection,
+        "model_name": job.model_name,
+        "status": job.status,
+        "phase": job.phase,
+        "processed": job.processed,
+        "total": job.total,
+        "docs_per_sec": job.docs_per_sec,
+        "eta_seconds": round(remaining / job.docs_per_sec) if job.docs_per_sec and job.status == "running" else None,
+        "error": job.error,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "running": running,
+    }
+
+
+class Reindexer:
+    def __init__(self, backend: str = VECTOR_BACKEND):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._cancel = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def status(self) -> Optional[dict]:
+        db = SessionLocal()
+        try:
+            job = db.query(ReindexJob).filter_by(backend=self.backend).order_by(ReindexJob.started_at.desc()).first()
+            return _job_status(job, self.running)
+        finally:
+            db.close()
+
+    def prepare(self, model_name: Optional[str] = None, restart: bool = False) -> str:
+        """
+        Setzt einen angehaltenen Lauf fort oder legt einen neuen an; liefert die Job-ID. Ein
+        fehlgeschlagener Lauf wird verworfen: sein Protokoll ist seit dem Fehler unvollständig.
+        """
+        model_name = model_name or embedding_service.model_name
+        db = SessionLocal()
+        try:
+            unfinished = (db.query(ReindexJob).filter_by(backend=self.backend)
+                          .filter(ReindexJob.status.in_(UNFINISHED))
+                          .order_by(ReindexJob.started_at.desc()).first())
+            if unfinished is not None:
+                if not restart and unfinished.status in PENDING and unfinished.model_name == model_name:
+                    return unfinished.id
+                unfinished.status = "abandoned"
+            # Protokoll beendeter Jobs (Nachzügler anderer Prozesse innerhalb eines Prüfintervalls)
+            pending = [row[0] for row in db.query(ReindexJob.collection).filter(ReindexJob.status.in_(PENDING))]
+            db.query(ReindexChange).filter(ReindexChange.collection.notin_(pending)).delete(synchronize_session=False)
+            total = (db.query(func.count(ChatHistory.id)).scalar() or 0) + (db.query(func.count(ChatMessage.id)).scalar() or 0)
+            job = ReindexJob(id=generate_id(), backend=self.backend, collection=_next_collection_name(db, self.backend),
+                             model_name=model_name, status="paused", phase=PHASES[0], processed=0, total=total,
+                             started_at=datetime.utcnow(), updated_at=datetime.utcnow())
+            db.add(job)
+            db.add(VectorCollection(backend=self.backend, name=job.collection, model_name=model_name, active=False))
+            db.commit()
+            vector_db.invalidate()
+            return job.id
+        finally:
+            db.close()
+
+    def start(self, model_name: Optional[str] = None, restart: bool = False) -> Optional[dict]:
+        """Startet (oder setzt fort) im Hintergrund-Thread; läuft schon einer, bleibt es bei diesem."""
+        with self._lock:
+            if not self.running:
+                job_id = self.prepare(model_name, restart)
+                self._cancel.clear()
+                self._thread = threading.Thread(target=self._run_logged, args=(job_id,), name="reindex", daemon=True)
+                self._thread.start()
+        return self.status()
+
+    def cancel(self, wait: float = 0):
+        """Hält den Lauf nach dem aktuellen Chunk an (Status `paused`, fortsetzbar)."""
+        self._cancel.set()
+        thread = self._thread
+        if wait and thread is not None:
+            thread.join(wait)
+
+    @staticmethod
+    def _replay(db: Session, job: ReindexJob, store, write: Callable[[List[str], List[dict]], None]) -> int:
+        """
+        Spielt die protokollierten Schreibzugriffe des Jobs in Reihenfolge in `store` ein und löscht sie
+        danach; nach einem Abbruch wiederholt sich höchstens ein Chunk (add/delete sind idempotent).
+        """
+        replayed = 0
+        while True:
+            changes = (db.query(ReindexChange).filter_by(collection=job.collection)
+                       .order_by(ReindexChange.seq).limit(REINDEX_CHUNK_SIZE).all())
+            if not changes:
+                return replayed
+            for op, group in itertools.groupby(changes, key=lambda c: c.op):
+                # Pro ID zählt innerhalb einer Gruppe nur der letzte Stand
+                latest = {c.doc_id: c for c in group}
+                if op == "delete":
+                    store.delete(list(latest))
+                else:
+                    write([c.document or "" for c in latest.values()],
+                          [dict(json.loads(c.doc_metadata or "{}"), id=c.doc_id) for c in latest.values()])
+            db.query(ReindexChange).filter(ReindexChange.collection == job.collection,
+                                           ReindexChange.seq <= changes[-1].seq).delete(synchronize_session=False)
+            store.flush()
+            db.commit()
+            replayed += len(changes)
+
+    @staticmethod
+    def _pause(db: Session, job: ReindexJob) -> dict:
+        job.status = "paused"
+        db.commit()
+        logger.info("Re-Index %s angehalten bei %d/%d", job.id, job.processed, job.total)
+        return _job_status(job, False)
+
+    def _run_logged(self, job_id: str):
+        try:
+            self.run(job_id)
+        except Exception:
+            logger.exception("Re-Index %s fehlgeschlagen", job_id)
+
+    def run(self, job_id: str, progress: Optional[Callable[[dict], None]] = None) -> dict:
+        """Führt den Job synchron aus (CLI oder Hintergrund-Thread)."""
+        db = SessionLocal()
+        try:
+            job = db.get(ReindexJob, job_id)
+            job.status, job.error = "running", None
+            db.commit()
+            service = embedding_service if job.model_name == embedding_service.model_name \
+                else EmbeddingService(job.model_name, cache=EmbeddingCache(max_size=0))
+            store = create_store(job.backend, job.collection)
+            started, done = time.perf_counter(), 0
+
+            def write(texts: List[str], metadatas: List[dict]):
+                for i in range(0, len(texts), REINDEX_EMBED_BATCH):
+                    batch = texts[i:i + REINDEX_EMBED_BATCH]
+                    embeddings = service.embed_many(batch)
+                    store.add([m["id"] for m in metadatas[i:i + len(batch)]], batch, embeddings, metadatas[i:i + len(batch)])
+                reindexed.inc(len(texts))
+
+            try:
+                if job.backend == VECTOR_BACKEND:
+                    # Erst wenn alle Prozesse den Job kennen, protokollieren sie; was davor geschrieben
+                    # wurde, findet der Keyset-Lauf in den Tabellen
+                    waited = (datetime.utcnow() - job.started_at).total_seconds()
+                    if self._cancel.wait(max(0.0, vector_db.VECTOR_ACTIVE_CHECK_INTERVAL - waited)):
+                        return self._pause(db, job)
+                for phase in PHASES[PHASES.index(job.phase):] if job.phase in PHASES else ():
+                    job.phase = phase
+                    if phase == "catchup":
+                        # Schreibzugriffe seit prepare(): der Keyset-Lauf verpasst Zeilen hinter dem Cursor und Löschungen
+                        self._replay(db, job, store, write)
+                        break
+                    query, model, to_docs = _SOURCES[phase]
+                    while True:
+                        if self._cancel.is_set():
+                            return self._pause(db, job)
+                        rows = query(db).filter(model.id > (job.cursor or "")).order_by(model.id).limit(REINDEX_CHUNK_SIZE).all()
+                        if not rows:
+                            break
+                        write(*to_docs(rows))
+                        done += len(rows)
+                        job.cursor = rows[-1].id
+                        job.processed += len(rows)
+                        job.docs_per_sec = int(done / max(time.perf_counter() - started, 1e-6))
+                        job.updated_at = datetime.utcnow()
+                        # Checkpoint: nach einem Absturz geht es ab hier weiter (Upserts machen Wiederholung harmlos)
+                        store.flush()
+                        db.commit()
+                        throughput.set(job.docs_per_sec)
+                        if progress:
+                            progress(_job_status(job, True))
+                    job.cursor = None
+                    db.commit()
+                store.flush()
+                if service is not embedding_service:
+                    # Das geladene Modell übernehmen statt es neu zu laden
+                    embedding_service.use_model(job.model_name, service.model)
+                if job.backend == VECTOR_BACKEND:
+                    vector_db.activate(job.collection, job.model_name, store)
+                    # Andere Prozesse schalten spätestens nach einem Prüfintervall um; bis dahin schreiben
+                    # sie in die alte Collection und protokollieren weiter (der Job ist noch unfertig)
+                    time.sleep(vector_db.VECTOR_ACTIVE_CHECK_INTERVAL)
+                    self._replay(db, job, store, write)
+                else:
+                    store.close()
+                job.status, job.phase, job.finished_at = "done", "done", datetime.utcnow()
+                job.updated_at = job.finished_at
+                db.commit()
+                vector_db.invalidate()
+                if job.backend == VECTOR_BACKEND:
+                    # Schreiber, die den Job kurz vor "done" noch als unfertig gesehen haben
+                    self._replay(db, job, store, write)
+                throughput.set(0)
+                logger.info("Re-Index %s fertig: %d Dokumente, %s docs/s, aktiv: %s",
+                            job.id, job.processed, job.docs_per_sec or 0, job.collection)
+                return _job_status(job, False)
+            except Exception as e:
+                db.rollback()
+                job = db.get(ReindexJob, job_id)
+                job.status, job.error, job.updated_at = "failed", repr(e), datetime.utcnow()
+                # Wird nicht fortgesetzt: Protokoll verwerfen, vector_db hört damit auf
+                db.query(ReindexChange).filter_by(collection=job.collection).delete(synchronize_session=False)
+                db.commit()
+                vector_db.invalidate()
+                throughput.set(0)
+                raise
+        finally:
+            db.close()
+
+
+reindexer = Reindexer()
+
+
+if __name__ == "__main__":
+    from app.services.db import engine
+    from app.services.migrations import run_migrations
+
+    parser = argparse.ArgumentParser(description="Vektor-DB in eine neue Collection neu aufbauen")
+    parser.add_argument("--model", help="Embedding-Modell (Standard: aktuelles Modell)")
+    parser.add_argument("--restart", action="store_true", help="Angehaltenen Lauf verwerfen und neu beginnen")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    run_migrations(engine)
+    job_id = reindexer.prepare(args.model, args.restart)
+
+    def report(status: dict):
+        print(f"{status['phase']}: {status['processed']}/{status['total']} Dokumente, {status['docs_per_sec']} docs/s",
+              flush=True)
+
+    try:
+        result = reindexer.run(job_id, progress=report)
+    except KeyboardInterrupt:
+        print("Abgebrochen; erneuter Aufruf setzt beim letzten Checkpoint fort")
+        raise SystemExit(1)
+    print(f"Fertig: {result['processed']} Dokumente, {result['docs_per_sec'] or 0} docs/s, aktive Collection {result['collection']}")
@@ -0,0 +1,156 @@
+"""
+Semantischer Antwort-Cache für /chat (opt-in über CHAT_CACHE_ENABLED).
+
+Einträge sind nach (Modell, Systemprompt-Version) getrennt. Ein Prompt trifft, wenn die
+Kosinus-Ähnlichkeit seines Embeddings zu einem gespeicherten Prompt mindestens
+CHAT_CACHE_THRESHOLD beträgt; dann wird die gespeicherte Antwort ohne LLM-Aufruf geliefert.
+Einträge verfallen nach CHAT_CACHE_TTL Sekunden; über CHAT_CACHE_MAX_ENTRIES fliegen die ältesten.
+"""
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from app.core import metrics
+
+CHAT_CACHE_ENABLED = os.getenv("CHAT_CACHE_ENABLED", "0") == "1"
+CHAT_CACHE_THRESHOLD = float(os.getenv("CHAT_CACHE_THRESHOLD", "0.95"))
+CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", "86400"))
+CHAT_CACHE_MAX_ENTRIES = int(os.getenv("CHAT_CACHE_MAX_ENTRIES", "10000"))
+
+cache_requests = metrics.counter("chat_cache_requests_total", "Anfragen an den semantischen Antwort-Cache nach Ergebnis")
+cache_entries = metrics.gauge("chat_cache_entries", "Einträge im semantischen Antwort-Cache")
+
+BucketKey = Tuple[str, str]
+
+
+class _Bucket:
+    """
+    Einträge eines (Modell, Prompt-Version)-Paars.
+
+    Die Vektoren liegen in einem vorab allokierten Array: neue Zeilen werden am Ende eingetragen,
+    verfallene vorne nur per Offset übersprungen. Neu aufgebaut wird erst, wenn hinten kein Platz
+    mehr ist – dann mit doppelt so viel Platz wie Einträgen, also amortisiert O(1) pro Eintrag.
+    """
+
+    INITIAL_CAPACITY = 16
+
+    def __init__(self):
+        self.responses = []
+        self.created = []
+        self._rows: Optional[np.ndarray] = None
+        self._start = 0
+
+    def __len__(self) -> int:
+        return len(self.responses)
+
+    def matrix(self) -> np.ndarray:
+        if self._rows is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        return self._rows[self._start:self._start + len(self.responses)]
+
+    def append(self, vector: np.ndarray, response: str, created: float):
+        end = self._start + len(self.responses)
+        if self._rows is None or end == len(self._rows):
+            self._grow(vector.shape[0])
+            end = len(self.responses)
+        self._rows[end] = vector
+        self.responses.append(response)
+        self.created.append(created)
+
+    def _grow(self, dim: int):
+        rows = np.empty((max(self.INITIAL_CAPACITY, 2 * (len(self.responses) + 1)), dim), dtype=np.float32)
+        if self.responses:
+            rows[:len(self.responses)] = self.matrix()
+        self._rows = rows
+        self._start = 0
+
+    def drop_first(self, n: int):
+        if n <= 0:
+            return
+        del self.responses[:n], self.created[:n]
+        self._start += n
+        if not self.responses:
+            self._rows = None
+            self._start = 0
+
+
+class SemanticResponseCache:
+    def __init__(self, threshold: float = CHAT_CACHE_THRESHOLD, ttl: float = CHAT_CACHE_TTL,
+                 max_entries: int = CHAT_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._buckets: Dict[BucketKey, _Bucket] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expire(self, bucket: _Bucket, now: float):
+        # Einträge sind nach Erstellzeit sortiert: abgelaufene liegen vorne
+        expired = 0
+        while expired < len(bucket.created) and now - bucket.created[expired] > self.ttl:
+            expired += 1
+        bucket.drop_first(expired)
+        self._size -= expired
+
+    def lookup(self, model: str, prompt_version: str, embedding) -> Optional[Tuple[str, float]]:
+        """Gespeicherte Antwort und Ähnlichkeit des besten Treffers, oder None."""
+        query = self._normalize(embedding)
+        with self._lock:
+            bucket = self._buckets.get((model, prompt_version))
+            if bucket is not None:
+                self._expire(bucket, time.time())
+            if bucket is None or not bucket:
+                cache_requests.inc(labels={"result": "miss"})
+                return None
+            scores = bucket.matrix() @ query
+            best = int(np.argmax(scores))
+            score = float(scores[best])
+            response = bucket.responses[best]
+        if score < self.threshold:
+            cache_requests.inc(labels={"result": "miss"})
+            return None
+        cache_requests.inc(labels={"result": "hit"})
+        return response, score
+
+    def store(self, model: str, prompt_version: str, embedding, response: str):
+        if not response:
+            return
+        now = time.time()
+        key = (model, prompt_version)
+        with self._lock:
+            bucket = self._buckets.setdefault(key, _Bucket())
+            self._expire(bucket, now)
+            bucket.append(self._normalize(embedding), response, now)
+            self._size += 1
+            self._evict()
+            cache_entries.set(self._size)
+
+    def _evict(self):
+        # Ältesten Eintrag über alle Buckets entfernen (Buckets = Modelle x Prompt-Versionen, also wenige)
+        while self._size > self.max_entries:
+            oldest = min((b for b in self._buckets.values() if b.created), key=lambda b: b.created[0], default=None)
+            if oldest is None:
+                break
+            oldest.drop_first(1)
+            self._size -= 1
+
+    def record_bypass(self):
+        cache_requests.inc(labels={"result": "bypass"})
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self._size = 0
+            cache_entries.set(0)
+
+
+response_cache = SemanticResponseCache()
@@ -0,0 +1,117 @@
+"""
+Kurzlebiger Cache für "existiert Session X noch?", damit /query nicht bei jeder Suche
+alle Session-IDs laden muss. Abgefragt werden nur die IDs, die in den Treffern vorkommen.
+
+Dazu das ETag der Session-Liste für /sessions, berechnet aus `chat_sessions` selbst.
+"""
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.services.db import ChatSession, ListVersion
+
+SESSION_EXISTS_CACHE_TTL = float(os.getenv("SESSION_EXISTS_CACHE_TTL", "10"))
+SESSION_EXISTS_CACHE_SIZE = int(os.getenv("SESSION_EXISTS_CACHE_SIZE", "10000"))
+# So lange (Sekunden) gilt ein berechnetes ETag von /sessions; Änderungen anderer Worker sieht es spätestens danach
+SESSIONS_ETAG_TTL = float(os.getenv("SESSIONS_ETAG_TTL", "2"))
+
+# Hilfsgrenze für IN (...)-Listen (SQLite erlaubt nur begrenzt viele Parameter)
+_IN_CHUNK = 500
+
+
+class SessionExistenceCache:
+    def __init__(self, ttl: float = SESSION_EXISTS_CACHE_TTL, max_size: int = SESSION_EXISTS_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: Dict[str, Tuple[bool, float]] = {}
+        self._lock = threading.Lock()
+
+    def existing(self, db: Session, session_ids: Iterable[str]) -> Set[str]:
+        """Gibt die Teilmenge der übergebenen IDs zurück, deren Session existiert."""
+        now = time.monotonic()
+        result, unknown = set(), []
+        with self._lock:
+            for sid in set(session_ids):
+                entry = self._entries.get(sid)
+                if entry and entry[1] > now:
+                    if entry[0]:
+                        result.add(sid)
+                else:
+                    unknown.append(sid)
+        if unknown:
+            found = set()
+            for i in range(0, len(unknown), _IN_CHUNK):
+                chunk = unknown[i:i + _IN_CHUNK]
+                found.update(row[0] for row in db.query(ChatSession.id).filter(ChatSession.id.in_(chunk)))
+            expires = now + self.ttl
+            with self._lock:
+                if len(self._entries) + len(unknown) > self.max_size:
+                    self._entries.clear()
+                for sid in unknown:
+                    self._entries[sid] = (sid in found, expires)
+            result.update(found)
+        return result
+
+    def invalidate(self, session_id: str = None):
+        """Nach Anlegen/Löschen/Restore einer Session aufrufen."""
+        with self._lock:
+            if session_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(session_id, None)
+
+
+session_exists_cache = SessionExistenceCache()
+
+
+class SessionListVersion:
+    """
+    ETag der Session-Liste aus Anzahl, neuestem `created_at`, neuestem `last_message_at` und Summe
+    der `message_count` in `chat_sessions`; Schreibpfade sperren dafür keine gemeinsame Zeile. Jeder
+    Worker hält das ETag SESSIONS_ETAG_TTL Sekunden, eigene Änderungen verwerfen es sofort
+    (invalidate); Änderungen anderer Worker erscheinen also nach höchstens SESSIONS_ETAG_TTL Sekunden.
+    Der Token aus `list_versions` sorgt dafür, dass nach dem Neuanlegen der DB kein altes ETag passt.
+    """
+
+    name = "sessions"
+
+    def __init__(self, ttl: float = SESSIONS_ETAG_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._token: Optional[str] = None
+        self._cached: Optional[Tuple[str, float]] = None
+        self._generation = 0
+
+    def invalidate(self):
+        """Nach dem Commit einer Änderung an Sessions oder Nachrichten aufrufen."""
+        with self._lock:
+            self._generation += 1
+            self._cached = None
+
+    def etag(self, db: Session) -> str:
+        now = time.monotonic()
+        with self._lock:
+            if self._cached is not None and self._cached[1] > now:
+                return self._cached[0]
+            generation = self._generation
+        if self._token is None:
+            self._token = db.query(ListVersion.token).filter_by(name=self.name).scalar() or "0"
+        count, created, last_message, messages = db.query(
+            func.count(ChatSession.id), func.max(ChatSession.created_at),
+            func.max(ChatSession.last_message_at), func.coalesce(func.sum(ChatSession.message_count), 0),
+        ).one()
+        digest = hashlib.sha1(f"{count}|{created}|{last_message}|{messages}".encode("utf-8")).hexdigest()[:16]
+        etag = f'W/"{self.name}-{self._token}-{digest}"'
+        with self._lock:
+            # Inzwischen lokal geändert: nicht den älteren Stand cachen
+            if generation == self._generation:
+                self._cached = (etag, now + self.ttl)
+        return etag
+
+
+session_list_version = SessionListVersion()
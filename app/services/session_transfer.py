@@ -0,0 +1,363 @@
+"""
+Streaming-Export und -Import von Sessions samt Nachrichten und Embeddings.
+
+Formate:
+- `ndjson`: eine JSON-Zeile pro Datensatz, zuerst die Session, danach ihre Nachrichten:
+  `{"type": "session", "id", "title", "created_at"}`,
+  `{"type": "message", "id", "session_id", "sender", "text", "timestamp", "embedding_f32"}`.
+  `embedding_f32` ist das Embedding als base64-kodiertes float32 (little endian); beim Import
+  wird auch eine Zahlenliste unter `embedding` akzeptiert.
+- `columnar`: binär, `MAGIC` gefolgt von Frames `<u32 Header-Länge><u32 Payload-Länge><Header><Payload>`.
+  Der Header ist JSON mit `type` ("sessions"/"messages") und einer Liste pro Spalte; bei Nachrichten
+  zusätzlich `dim` und `has_embedding`, die Payload enthält die vorhandenen Embeddings als
+  zusammenhängendes float32-Array (eine Zeile pro `true` in `has_embedding`).
+
+Export liest per Keyset in Chunks (SESSION_EXPORT_CHUNK), Import schreibt pro Chunk
+(SESSION_IMPORT_CHUNK) mit einem executemany-Insert und einem Vektor-add. Mitgelieferte Embeddings
+werden übernommen, fehlende (auch Null-Vektoren älterer Restores) optional neu berechnet.
+Bestehende Sessions werden nie verändert: Sessions mit vorhandener ID und deren Nachrichten
+werden übersprungen.
+"""
+import base64
+import json
+import logging
+import os
+import struct
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Set
+
+import numpy as np
+from sqlalchemy import bindparam, case, insert, or_, update
+from sqlalchemy.orm import Session
+
+from app.core.utils import to_epoch, to_naive_utc
+from app.services import vector_db
+from app.services.db import ChatMessage, ChatSession, SessionLocal
+from app.services.embedding import embedding_service
+from app.services.executor import run_db, run_embed, run_io
+from app.services.session_cache import session_list_version
+
+SESSION_EXPORT_CHUNK = int(os.getenv("SESSION_EXPORT_CHUNK", "1000"))
+SESSION_IMPORT_CHUNK = int(os.getenv("SESSION_IMPORT_CHUNK", "1000"))
+# Max. Größe eines Frames im Spaltenformat (Schutz vor kaputten Längenfeldern)
+SESSION_IMPORT_MAX_FRAME = int(os.getenv("SESSION_IMPORT_MAX_FRAME", str(256 * 1024 * 1024)))
+
+MAGIC = b"LVCCOL1\n"
+_FRAME = struct.Struct("<II")
+# Sessions pro IN (...)-Abfrage (SQLite-Parameterlimit)
+_IN_CHUNK = 500
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "columnar": "application/octet-stream"}
+
+logger = logging.getLogger(__name__)
+
+
+def pack_embedding(vector) -> str:
+    return base64.b64encode(np.asarray(vector, dtype="<f4").tobytes()).decode("ascii")
+
+
+def unpack_embedding(packed: str) -> list:
+    return np.frombuffer(base64.b64decode(packed), dtype="<f4").tolist()
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _parse_ts(value) -> datetime:
+    if isinstance(value, datetime):
+        return to_naive_utc(value)
+    if isinstance(value, str):
+        try:
+            return to_naive_utc(datetime.fromisoformat(value))
+        except ValueError:
+            pass
+    return datetime.utcnow()
+
+
+# ----- Export -----
+
+def _embeddings_for(ids: List[str]) -> Dict[str, np.ndarray]:
+    try:
+        found = vector_db.get_embeddings(ids)
+    except Exception:
+        logger.exception("Embeddings für den Export nicht lesbar; Export ohne Embeddings")
+        return {}
+    vectors = {}
+    for id_, vector in found.items():
+        vector = np.asarray(vector, dtype="<f4")
+        # Null-Vektoren (Platzhalter älterer Restores) nicht exportieren: der Import berechnet sie neu
+        if vector.size and np.any(vector):
+            vectors[id_] = vector
+    return vectors
+
+
+def _frame(header: dict, payload: bytes = b"") -> bytes:
+    raw = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    return _FRAME.pack(len(raw), len(payload)) + raw + payload
+
+
+def _encode_sessions(rows, fmt: str) -> bytes:
+    if fmt == "columnar":
+        return _frame({"type": "sessions", "columns": {
+            "id": [r.id for r in rows],
+            "title": [r.title for r in rows],
+            "created_at": [_iso(r.created_at) for r in rows],
+        }})
+    return "".join(
+        json.dumps({"type": "session", "id": r.id, "title": r.title, "created_at": _iso(r.created_at)},
+                   ensure_ascii=False) + "\n"
+        for r in rows
+    ).encode("utf-8")
+
+
+def _encode_messages(rows, vectors: Dict[str, np.ndarray], fmt: str) -> bytes:
+    if fmt == "columnar":
+        has_embedding = [r.id in vectors for r in rows]
+        stacked = [vectors[r.id] for r in rows if r.id in vectors]
+        payload = np.stack(stacked).astype("<f4").tobytes() if stacked else b""
+        return _frame({"type": "messages", "dim": int(stacked[0].size) if stacked else 0,
+                       "has_embedding": has_embedding, "columns": {
+                           "id": [r.id for r in rows],
+                           "session_id": [r.session_id for r in rows],
+                           "sender": [r.sender for r in rows],
+                           "text": [r.text for r in rows],
+                           "timestamp": [_iso(r.timestamp) for r in rows],
+                       }}, payload)
+    lines = []
+    for r in rows:
+        record = {"type": "message", "id": r.id, "session_id": r.session_id, "sender": r.sender,
+                  "text": r.text, "timestamp": _iso(r.timestamp)}
+        if r.id in vectors:
+            record["embedding_f32"] = pack_embedding(vectors[r.id])
+        lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+    return "".join(lines).encode("utf-8")
+
+
+def iter_export(session_id: Optional[str] = None, fmt: str = "ndjson", embeddings: bool = True) -> Iterator[bytes]:
+    """
+    Export als Byte-Chunks für eine StreamingResponse. Eigene DB-Session, weil der Stream
+    länger läuft als die Request-Dependency.
+    """
+    db = SessionLocal()
+    try:
+        if fmt == "columnar":
+            yield MAGIC
+        after = ""
+        while True:
+            q = db.query(ChatSession.id, ChatSession.title, ChatSession.created_at).filter(ChatSession.id > after)
+            if session_id is not None:
+                q = q.filter(ChatSession.id == session_id)
+            sessions = q.order_by(ChatSession.id).limit(_IN_CHUNK).all()
+            if not sessions:
+                return
+            after = sessions[-1].id
+            yield _encode_sessions(sessions, fmt)
+            messages = (
+                db.query(ChatMessage.id, ChatMessage.session_id, ChatMessage.sender, ChatMessage.text,
+                         ChatMessage.timestamp)
+                .filter(ChatMessage.session_id.in_([s.id for s in sessions]))
+                .order_by(ChatMessage.session_id, ChatMessage.timestamp, ChatMessage.id)
+                .execution_options(stream_results=True)
+                .yield_per(SESSION_EXPORT_CHUNK)
+            )
+            batch = []
+            for row in messages:
+                batch.append(row)
+                if len(batch) >= SESSION_EXPORT_CHUNK:
+                    yield _encode_messages(batch, _embeddings_for([r.id for r in batch]) if embeddings else {}, fmt)
+                    batch = []
+            if batch:
+                yield _encode_messages(batch, _embeddings_for([r.id for r in batch]) if embeddings else {}, fmt)
+    finally:
+        db.close()
+
+
+# ----- Import -----
+
+def _existing(db: Session, column, ids) -> Set[str]:
+    ids = list(ids)
+    found = set()
+    for i in range(0, len(ids), _IN_CHUNK):
+        found.update(row[0] for row in db.query(column).filter(column.in_(ids[i:i + _IN_CHUNK])))
+    return found
+
+
+class SessionImporter:
+    """Sammelt Datensätze und schreibt sie chunkweise; Reihenfolge: Session vor ihren Nachrichten."""
+
+    def __init__(self, embed_missing: bool = True, chunk_size: int = SESSION_IMPORT_CHUNK):
+        self.embed_missing = embed_missing
+        self.chunk_size = max(1, chunk_size)
+        self._sessions: List[dict] = []
+        self._messages: List[dict] = []
+        # Sessions dieses Imports (nur an sie werden Nachrichten angehängt) bzw. übersprungene
+        self._imported: Set[str] = set()
+        self._skipped: Set[str] = set()
+        self.stats = {"sessions": 0, "messages": 0, "skipped_sessions": 0, "skipped_messages": 0,
+                      "vectors": 0, "embedded": 0}
+
+    async def add_session(self, session_id: str, title: Optional[str], created_at):
+        self._sessions.append({"id": session_id, "title": title, "created_at": _parse_ts(created_at)})
+        if len(self._sessions) >= self.chunk_size:
+            await self.flush()
+
+    async def add_message(self, message_id: str, session_id: str, sender: str, text: str, timestamp,
+                          embedding: Optional[list] = None):
+        if embedding is not None and not np.any(np.asarray(embedding, dtype="<f4")):
+            # Null-Vektor (Platzhalter aus älteren Restores): wie fehlend behandeln
+            embedding = None
+        self._messages.append({"id": message_id, "session_id": session_id, "sender": sender, "text": text,
+                               "timestamp": _parse_ts(timestamp), "embedding": embedding})
+        if len(self._messages) >= self.chunk_size:
+            await self.flush()
+
+    def _write(self, db: Session, sessions: List[dict], messages: List[dict]) -> List[dict]:
+        existing = _existing(db, ChatSession.id, [s["id"] for s in sessions])
+        new_sessions = [s for s in sessions if s["id"] not in existing]
+        self._skipped.update(existing)
+        self._imported.update(s["id"] for s in new_sessions)
+        accepted = [m for m in messages if m["session_id"] in self._imported]
+        present = _existing(db, ChatMessage.id, [m["id"] for m in accepted])
+        accepted = [m for m in accepted if m["id"] not in present]
+        if new_sessions:
+            db.execute(insert(ChatSession.__table__), new_sessions)
+        if accepted:
+            db.execute(insert(ChatMessage.__table__),
+                       [{k: v for k, v in m.items() if k != "embedding"} for m in accepted])
+            self._update_aggregates(db, accepted)
+        db.commit()
+        if new_sessions or accepted:
+            session_list_version.invalidate()
+        self.stats["sessions"] += len(new_sessions)
+        self.stats["skipped_sessions"] += len(existing)
+        self.stats["messages"] += len(accepted)
+        self.stats["skipped_messages"] += len(messages) - len(accepted)
+        return accepted
+
+    @staticmethod
+    def _update_aggregates(db: Session, messages: List[dict]):
+        # Nachrichten einer Session können über mehrere Chunks verteilt sein: aufaddieren statt setzen
+        per_session: Dict[str, dict] = {}
+        for m in messages:
+            entry = per_session.setdefault(m["session_id"], {"sid": m["session_id"], "n": 0, "last": m["timestamp"]})
+            entry["n"] += 1
+            entry["last"] = max(entry["last"], m["timestamp"])
+        table = ChatSession.__table__
+        last = table.c.last_message_at
+        db.execute(
+            update(table).where(table.c.id == bindparam("sid")).values(
+                message_count=table.c.message_count + bindparam("n"),
+                last_message_at=case((or_(last.is_(None), last < bindparam("last")), bindparam("last")), else_=last),
+            ),
+            list(per_session.values()),
+        )
+
+    async def flush(self):
+        sessions, self._sessions = self._sessions, []
+        messages, self._messages = self._messages, []
+        if not sessions and not messages:
+            return
+        accepted = await run_db(self._write, sessions, messages)
+        missing = [m for m in accepted if not m["embedding"]]
+        if missing and self.embed_missing:
+            vectors = await run_embed(embedding_service.embed_many, [m["text"] for m in missing])
+            for m, vector in zip(missing, vectors):
+                m["embedding"] = vector
+            self.stats["embedded"] += len(missing)
+        indexed = [m for m in accepted if m["embedding"]]
+        if indexed:
+            metadatas = [{"id": m["id"], "session_id": m["session_id"], "sender": m["sender"],
+                          "ts": to_epoch(m["timestamp"])} for m in indexed]
+            await run_io(vector_db.add_many, [m["text"] for m in indexed], [m["embedding"] for m in indexed], metadatas)
+            self.stats["vectors"] += len(indexed)
+
+    @property
+    def touched_sessions(self) -> Set[str]:
+        return self._imported
+
+
+async def _lines(stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    buffer = b""
+    async for chunk in stream:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+
+async def import_ndjson(stream: AsyncIterator[bytes], importer: SessionImporter):
+    async for line in _lines(stream):
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        kind = record.get("type")
+        if kind == "session":
+            await importer.add_session(record["id"], record.get("title"), record.get("created_at"))
+        elif kind == "message":
+            embedding = record.get("embedding")
+            if record.get("embedding_f32"):
+                embedding = unpack_embedding(record["embedding_f32"])
+            await importer.add_message(record["id"], record["session_id"], record["sender"], record["text"],
+                                       record.get("timestamp"), embedding)
+        else:
+            raise ValueError(f"Unbekannter Datensatztyp: {kind!r}")
+    await importer.flush()
+
+
+class _Reader:
+    """Liest exakte Byte-Mengen aus einem asynchronen Chunk-Stream."""
+
+    def __init__(self, stream: AsyncIterator[bytes]):
+        self._stream = stream.__aiter__()
+        self._buffer = bytearray()
+
+    async def read(self, n: int) -> bytes:
+        while len(self._buffer) < n:
+            try:
+                self._buffer += await self._stream.__anext__()
+            except StopAsyncIteration:
+                break
+        data = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        return data
+
+
+async def import_columnar(stream: AsyncIterator[bytes], importer: SessionImporter):
+    reader = _Reader(stream)
+    if await reader.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Kein Export im Spaltenformat")
+    while True:
+        prefix = await reader.read(_FRAME.size)
+        if not prefix:
+            break
+        if len(prefix) < _FRAME.size:
+            raise ValueError("Abgeschnittener Frame")
+        header_len, payload_len = _FRAME.unpack(prefix)
+        if header_len + payload_len > SESSION_IMPORT_MAX_FRAME:
+            raise ValueError("Frame zu groß")
+        header = json.loads(await reader.read(header_len))
+        payload = await reader.read(payload_len)
+        if len(payload) < payload_len:
+            raise ValueError("Abgeschnittener Frame")
+        columns = header["columns"]
+        if header["type"] == "sessions":
+            for session_id, title, created_at in zip(columns["id"], columns["title"], columns["created_at"]):
+                await importer.add_session(session_id, title, created_at)
+        elif header["type"] == "messages":
+            has_embedding = header.get("has_embedding") or [False] * len(columns["id"])
+            dim = header.get("dim") or 0
+            matrix = np.frombuffer(payload, dtype="<f4").reshape(-1, dim) if dim and payload else None
+            row = 0
+            for i, message_id in enumerate(columns["id"]):
+                embedding = None
+                if has_embedding[i] and matrix is not None:
+                    embedding = matrix[row].tolist()
+                    row += 1
+                await importer.add_message(message_id, columns["session_id"][i], columns["sender"][i],
+                                           columns["text"][i], columns["timestamp"][i], embedding)
+        else:
+            raise ValueError(f"Unbekannter Frame-Typ: {header['type']!r}")
+    await importer.flush()
@@ -0,0 +1,500 @@
+"""
+Embedding-/Vektor-Sidecar für den Betrieb mit mehreren API-Workern.
+
+Ein einzelner Prozess besitzt das Embedding-Modell und die Vektor-Backends; die Worker
+(SIDECAR_MODE=client) schicken ihm embed/query/add/delete über einen Unix-Socket. So gibt es
+nur eine Modellkopie im Speicher und nur einen Schreiber pro Chroma-Verzeichnis.
+
+Gleichartige Requests verschiedener Worker, die eintreffen, während ein Aufruf läuft, werden
+zu einem Aufruf zusammengefasst: ein `encode()` für alle Texte, eine Multi-Vektor-Suche pro
+Parametersatz, ein `add` pro Collection. Bei wenig Last entsteht dadurch keine Wartezeit.
+
+Protokoll: Frames `<u32 Header-Länge><u32 Payload-Länge><JSON-Header><Payload>`, Vektoren in
+der Payload als float32-Matrix (little endian). Pro Verbindung ein Request zur Zeit.
+
+    python -m app.services.sidecar                   # Sidecar allein starten
+    SIDECAR_MODE=client uvicorn app.main:app --workers 4
+    python -m app.main --workers 4 --sidecar          # beides zusammen
+"""
+import asyncio
+import json
+import logging
+import os
+import queue
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core import metrics
+
+# off: alles im Worker-Prozess (Standard); client: Embeddings und Vektor-DB über den Sidecar
+SIDECAR_MODE = os.getenv("SIDECAR_MODE", "off")
+SIDECAR_SOCKET = os.getenv("SIDECAR_SOCKET", "./sidecar.sock")
+SIDECAR_TIMEOUT = float(os.getenv("SIDECAR_TIMEOUT", "60"))
+# Offene Verbindungen pro Worker, die nach einem Request für den nächsten behalten werden
+SIDECAR_POOL_SIZE = int(os.getenv("SIDECAR_POOL_SIZE", "16"))
+# Gleichzeitig laufende Aufrufe pro Art (embed bzw. query/add je Parametersatz) im Sidecar
+SIDECAR_MAX_INFLIGHT = int(os.getenv("SIDECAR_MAX_INFLIGHT", "2"))
+# Max. Texte bzw. Vektoren pro zusammengefasstem Aufruf
+SIDECAR_MAX_BATCH = int(os.getenv("SIDECAR_MAX_BATCH", "256"))
+# Wartezeit beim Start (Supervisor bzw. Worker), bis der Sidecar antwortet
+SIDECAR_START_TIMEOUT = float(os.getenv("SIDECAR_START_TIMEOUT", "120"))
+
+_FRAME = struct.Struct("<II")
+# Felder des Query-Ergebnisses, die pro Query-Vektor eine Liste enthalten
+_RESULT_KEYS = ("ids", "documents", "metadatas", "distances")
+_STORE_OPS = ("delete", "count", "get_embeddings", "flush")
+
+logger = logging.getLogger(__name__)
+
+request_time = metrics.histogram("sidecar_request_seconds", "Dauer eines Sidecar-Requests aus Sicht des Workers")
+batch_size = metrics.histogram(
+    "sidecar_batch_requests",
+    "Zusammengefasste Worker-Requests pro Aufruf im Sidecar",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+
+
+class SidecarError(RuntimeError):
+    """Fehler, den der Sidecar beim Ausführen eines Requests gemeldet hat."""
+
+
+def _pack(header: dict, matrix: Optional[np.ndarray] = None) -> bytes:
+    payload = b"" if matrix is None else np.ascontiguousarray(matrix, dtype="<f4").tobytes()
+    if matrix is not None:
+        header = dict(header, rows=int(matrix.shape[0]), dim=int(matrix.shape[1]) if matrix.ndim == 2 else 0)
+    raw = json.dumps(header, default=_json_default).encode("utf-8")
+    return _FRAME.pack(len(raw), len(payload)) + raw + payload
+
+
+def _unpack(header: dict, payload: bytes) -> Optional[np.ndarray]:
+    if not header.get("rows"):
+        return None
+    return np.frombuffer(payload, dtype="<f4").reshape(header["rows"], header["dim"])
+
+
+def _json_default(value):
+    # numpy-Skalare/-Arrays aus den Backends
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Nicht serialisierbar: {type(value).__name__}")
+
+
+def _matrix(vectors: Sequence) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype="<f4")
+    return matrix.reshape(len(vectors), -1) if len(vectors) else matrix.reshape(0, 0)
+
+
+# ----- Client (im API-Worker) -----
+
+class SidecarClient:
+    """Blockierender Client mit Verbindungs-Pool; wird aus den Thread-Pools der Worker aufgerufen."""
+
+    def __init__(self, path: str = SIDECAR_SOCKET, timeout: float = SIDECAR_TIMEOUT, pool_size: int = SIDECAR_POOL_SIZE):
+        self.path = path
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[socket.socket]" = queue.LifoQueue(maxsize=max(1, pool_size))
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.path)
+        return sock
+
+    @staticmethod
+    def _read(sock: socket.socket, n: int) -> bytes:
+        buffer = bytearray()
+        while len(buffer) < n:
+            chunk = sock.recv(n - len(buffer))
+            if not chunk:
+                raise ConnectionError("Sidecar hat die Verbindung geschlossen")
+            buffer += chunk
+        return bytes(buffer)
+
+    def _roundtrip(self, sock: socket.socket, frame: bytes) -> Tuple[dict, bytes]:
+        sock.sendall(frame)
+        header_len, payload_len = _FRAME.unpack(self._read(sock, _FRAME.size))
+        header = json.loads(self._read(sock, header_len))
+        return header, self._read(sock, payload_len)
+
+    def call(self, op: str, matrix: Optional[np.ndarray] = None, **fields) -> Tuple[dict, Optional[np.ndarray]]:
+        frame = _pack(dict(fields, op=op), matrix)
+        started = time.perf_counter()
+        # Eine Wiederholung mit frischer Verbindung, z.B. nach Neustart des Sidecars (alle Ops sind idempotent)
+        for attempt in (0, 1):
+            sock = None
+            if not attempt:
+                try:
+                    sock = self._idle.get_nowait()
+                except queue.Empty:
+                    pass
+            if sock is None:
+                sock = self._connect()
+            try:
+                header, payload = self._roundtrip(sock, frame)
+            except (ConnectionError, socket.timeout, OSError):
+                sock.close()
+                if attempt:
+                    raise
+                # Die übrigen Verbindungen im Pool stammen meist vom selben (beendeten) Sidecar
+                self.close()
+                continue
+            try:
+                self._idle.put_nowait(sock)
+            except queue.Full:
+                sock.close()
+            break
+        request_time.observe(time.perf_counter() - started, {"op": op})
+        if not header.get("ok"):
+            raise SidecarError(header.get("error") or "Unbekannter Fehler im Sidecar")
+        return header, _unpack(header, payload)
+
+    def ping(self) -> dict:
+        return self.call("ping")[0]
+
+    def embed(self, model_name: str, texts: Sequence[str]) -> List[list]:
+        if not texts:
+            return []
+        return self.call("embed", model=model_name, texts=list(texts))[1].tolist()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_client: Optional[SidecarClient] = None
+
+
+def enable_client(path: str = SIDECAR_SOCKET) -> SidecarClient:
+    """Leitet Embeddings und Vektor-Backends dieses Prozesses an den Sidecar um."""
+    global _client
+    from app.services import embedding, vector_store
+
+    _client = SidecarClient(path)
+    embedding.set_remote(_client)
+    vector_store.set_remote(_client)
+    return _client
+
+
+def client() -> Optional[SidecarClient]:
+    return _client
+
+
+def wait_ready(path: str = SIDECAR_SOCKET, timeout: float = SIDECAR_START_TIMEOUT) -> dict:
+    """Wartet, bis der Sidecar auf `ping` antwortet (Modell geladen)."""
+    probe = SidecarClient(path, timeout=5, pool_size=1)
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            try:
+                return probe.ping()
+            except (OSError, SidecarError):
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.2)
+    finally:
+        probe.close()
+
+
+def spawn(path: str = SIDECAR_SOCKET) -> subprocess.Popen:
+    """Startet den Sidecar als Kindprozess und wartet, bis er bereit ist."""
+    env = dict(os.environ, SIDECAR_MODE="off", SIDECAR_SOCKET=path)
+    # Eigene Session: Strg+C trifft nur Supervisor und Worker; der Sidecar wird erst nach den Workern beendet
+    process = subprocess.Popen([sys.executable, "-m", "app.services.sidecar"], env=env, start_new_session=True)
+    try:
+        wait_ready(path)
+    except Exception:
+        process.terminate()
+        raise
+    return process
+
+
+# ----- Server (im Sidecar-Prozess) -----
+
+class _Coalescer:
+    """
+    Führt Requests sofort aus, solange weniger als `max_inflight` Aufrufe laufen; was
+    währenddessen eintrifft, wird beim nächsten Aufruf zusammengefasst (bis `max_items`).
+    """
+
+    def __init__(self, run: Callable, max_inflight: int = SIDECAR_MAX_INFLIGHT, max_items: int = SIDECAR_MAX_BATCH,
+                 on_idle: Optional[Callable[[], None]] = None):
+        self.run = run
+        self.on_idle = on_idle
+        self.max_inflight = max(1, max_inflight)
+        self.max_items = max(1, max_items)
+        self._pending: list = []
+        self._inflight = 0
+        self._tasks: set = set()
+
+    async def submit(self, item, size: int):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, size, future))
+        self._dispatch()
+        return await future
+
+    def _dispatch(self):
+        while self._pending and self._inflight < self.max_inflight:
+            batch, total = [], 0
+            while self._pending and (not batch or total + self._pending[0][1] <= self.max_items):
+                entry = self._pending.pop(0)
+                batch.append(entry)
+                total += entry[1]
+            self._inflight += 1
+            task = asyncio.get_running_loop().create_task(self._execute(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _execute(self, batch: list):
+        batch_size.observe(len(batch))
+        try:
+            results = await self.run([item for item, _, _ in batch])
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, _, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._inflight -= 1
+            self._dispatch()
+            if self.on_idle is not None and not self._inflight and not self._pending:
+                self.on_idle()
+
+
+class SidecarServer:
+    # Gleichzeitig geladene Embedding-Modelle samt Standardmodell (ein zweites z.B. während eines Re-Index)
+    MAX_MODELS = 2
+
+    def __init__(self, path: str = SIDECAR_SOCKET):
+        from app.services.embedding import embedding_service
+
+        self.path = path
+        self._services = {embedding_service.model_name: embedding_service}
+        self._stores: Dict[str, object] = {}
+        self._embedders: Dict[str, _Coalescer] = {}
+        self._queries: Dict[tuple, _Coalescer] = {}
+        self._adders: Dict[str, _Coalescer] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop: Optional[asyncio.Event] = None
+
+    # Ressourcen
+
+    def _service(self, model_name: str):
+        from app.services.embedding import EmbeddingService
+
+        service = self._services.get(model_name)
+        if service is None:
+            if len(self._services) >= max(2, self.MAX_MODELS):
+                # Ältestes Zusatzmodell freigeben, das Standardmodell bleibt
+                oldest = list(self._services)[1]
+                self._services.pop(oldest)
+                self._embedders.pop(oldest, None)
+            service = self._services[model_name] = EmbeddingService(model_name)
+        return service
+
+    def _store(self, collection: str):
+        from app.services.vector_store import VECTOR_BACKEND, create_store
+
+        store = self._stores.get(collection)
+        if store is None:
+            store = self._stores[collection] = create_store(VECTOR_BACKEND, collection)
+        return store
+
+    # Zusammengefasste Aufrufe
+
+    def _embedder(self, model_name: str) -> _Coalescer:
+        from app.services.executor import run_embed
+
+        if model_name not in self._embedders:
+            service = self._service(model_name)
+
+            async def run(requests: List[List[str]]):
+                vectors = await run_embed(service.embed_many, [text for texts in requests for text in texts])
+                out, start = [], 0
+                for texts in requests:
+                    out.append(vectors[start:start + len(texts)])
+                    start += len(texts)
+                return out
+
+            self._embedders[model_name] = _Coalescer(run)
+        return self._embedders[model_name]
+
+    def _querier(self, key: tuple) -> _Coalescer:
+        from app.services.executor import run_io
+
+        if key not in self._queries:
+            collection, n_results, where, search_params, max_distance = key
+            store = self._store(collection)
+
+            async def run(requests: List[np.ndarray]):
+                stacked = np.concatenate(requests) if len(requests) > 1 else requests[0]
+                result = await run_io(store.query, stacked, n_results=n_results, search_params=json.loads(search_params),
+                                      where=json.loads(where), max_distance=max_distance)
+                out, start = [], 0
+                for matrix in requests:
+                    end = start + len(matrix)
+                    out.append({k: result[k][start:end] for k in _RESULT_KEYS if result.get(k) is not None})
+                    start = end
+                return out
+
+            # Schlüssel enthalten Filter (Session-IDs, Zeitstempel): Eintrag entfernen, sobald nichts mehr läuft
+            self._queries[key] = _Coalescer(run, on_idle=lambda: self._queries.pop(key, None))
+        return self._queries[key]
+
+    def _adder(self, collection: str) -> _Coalescer:
+        from app.services.executor import run_io
+
+        if collection not in self._adders:
+            store = self._store(collection)
+
+            async def run(requests: List[tuple]):
+                ids, documents, metadatas, matrices = [], [], [], []
+                for r_ids, r_documents, r_metadatas, matrix in requests:
+                    ids += r_ids
+                    documents += r_documents
+                    metadatas += r_metadatas
+                    matrices.append(matrix)
+                await run_io(store.add, ids, documents, np.concatenate(matrices), metadatas)
+                return [None] * len(requests)
+
+            self._adders[collection] = _Coalescer(run)
+        return self._adders[collection]
+
+    # Requests
+
+    async def handle(self, header: dict, matrix: Optional[np.ndarray]) -> Tuple[dict, Optional[np.ndarray]]:
+        from app.services.executor import run_io
+
+        op = header.get("op")
+        if op == "ping":
+            return {"pid": os.getpid(), "models": list(self._services)}, None
+        if op == "embed":
+            texts = header["texts"]
+            vectors = await self._embedder(header["model"]).submit(texts, len(texts))
+            return {}, _matrix(vectors)
+        collection = header.get("collection")
+        if op == "query":
+            key = (collection, int(header["n_results"]), json.dumps(header.get("where"), sort_keys=True),
+                   json.dumps(header.get("search_params"), sort_keys=True), header.get("max_distance"))
+            return {"result": await self._querier(key).submit(matrix, len(matrix))}, None
+        if op == "add":
+            if header["ids"]:
+                request = (header["ids"], header["documents"], header["metadatas"], matrix)
+                await self._adder(collection).submit(request, len(header["ids"]))
+            return {}, None
+        if op not in _STORE_OPS:
+            raise SidecarError(f"Unbekannte Operation: {op!r}")
+        store = self._store(collection)
+        if op == "delete":
+            await run_io(store.delete, header["ids"])
+            return {}, None
+        if op == "count":
+            return {"count": await run_io(store.count)}, None
+        if op == "get_embeddings":
+            found = await run_io(store.get_embeddings, header["ids"])
+            ids = list(found)
+            return {"ids": ids}, _matrix([found[i] for i in ids])
+        await run_io(store.flush)
+        return {}, None
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    prefix = await reader.readexactly(_FRAME.size)
+                except asyncio.IncompleteReadError:
+                    break
+                header_len, payload_len = _FRAME.unpack(prefix)
+                header = json.loads(await reader.readexactly(header_len))
+                matrix = _unpack(header, await reader.readexactly(payload_len))
+                try:
+                    response, out = await self.handle(header, matrix)
+                    response["ok"] = True
+                except Exception as e:
+                    if not isinstance(e, SidecarError):
+                        logger.exception("Sidecar-Request %s fehlgeschlagen", header.get("op"))
+                    response, out = {"ok": False, "error": f"{type(e).__name__}: {e}"}, None
+                writer.write(_pack(response, out))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # Client weg oder Sidecar fährt herunter
+            pass
+        finally:
+            writer.close()
+
+    def stop(self):
+        """Beendet `serve()` (aus einem beliebigen Thread)."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+
+    def _claim_socket(self):
+        if not os.path.exists(self.path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.path)
+        except OSError:
+            # Übrig von einem abgestürzten Lauf
+            os.unlink(self.path)
+        else:
+            raise RuntimeError(f"Auf {self.path} läuft bereits ein Sidecar")
+        finally:
+            probe.close()
+
+    async def serve(self):
+        from app.services.embedding import embedding_service
+        from app.services.executor import run_embed, shutdown_executors
+
+        # Erst das Modell, dann den Socket: ein erfolgreicher ping heißt "bereit"
+        await run_embed(embedding_service.load)
+        self._claim_socket()
+        self._server = await asyncio.start_unix_server(self._serve_connection, path=self.path)
+        logger.info("Sidecar bereit auf %s (pid %d)", os.path.abspath(self.path), os.getpid())
+        self._stop = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        try:
+            if threading.current_thread() is threading.main_thread():
+                for sig in (signal.SIGINT, signal.SIGTERM):
+                    self._loop.add_signal_handler(sig, self._stop.set)
+            await self._stop.wait()
+        finally:
+            self._server.close()
+            await self._server.wait_closed()
+            shutdown_executors()
+            for collection, store in self._stores.items():
+                try:
+                    store.flush()
+                    store.close()
+                except Exception:
+                    logger.exception("Fehler beim Schließen der Collection %s", collection)
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            logger.info("Sidecar beendet")
+
+
+if __name__ == "__main__":
+    import argparse
+    from app.core import log
+
+    parser = argparse.ArgumentParser(description="Embedding-/Vektor-Sidecar für mehrere API-Worker")
+    parser.add_argument("--socket", default=SIDECAR_SOCKET, help="Pfad des Unix-Sockets")
+    args = parser.parse_args()
+    log.setup_logging()
+    try:
+        asyncio.run(SidecarServer(args.socket).serve())
+    finally:
+        log.shutdown_logging()
@@ -1,71 +1,321 @@
-import chromadb
+import json
+import logging
 import os
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
 
-CHROMA_DB_PATH = os.getenv("CHROMA_DB_PATH", "./chroma_db")
-print(f"[ChromaDB-DEBUG] Initialisiere PersistentClient mit Pfad: {os.path.abspath(CHROMA_DB_PATH)}")
+from app.core import metrics
+from app.core.utils import generate_id, to_epoch
+from app.services.vector_store import DEFAULT_COLLECTION, VECTOR_BACKEND, VectorStore, create_store
 
-chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-collection = chroma_client.get_or_create_collection("chat_data")
+# Max. Dokumente pro add / delete beim Backend
+VECTOR_DB_BATCH_SIZE = int(os.getenv("VECTOR_DB_BATCH_SIZE", "512"))
+# Mindestabstand in Sekunden zwischen zwei flush()-Aufrufen beim Backend
+VECTOR_DB_PERSIST_INTERVAL = float(os.getenv("VECTOR_DB_PERSIST_INTERVAL", "30"))
+# Wie oft (Sekunden) geprüft wird, ob ein anderer Prozess per Re-Index die aktive Collection gewechselt
+# oder einen Re-Index-Job angelegt hat; Re-Index wartet beim Start und nach dem Umschalten so lange
+VECTOR_ACTIVE_CHECK_INTERVAL = float(os.getenv("VECTOR_ACTIVE_CHECK_INTERVAL", "15"))
 
-def add_to_vector_db(text: str, embedding: list, metadata: dict = None):
-    import logging
-    import traceback
-    print(f"[ChromaDB-DEBUG] add_to_vector_db called with id={metadata.get('id') if metadata else None}")
+logger = logging.getLogger(__name__)
+
+vector_query_time = metrics.histogram("vector_query_seconds", "Dauer einer (Multi-)Vektor-Suche im Backend")
+
+_store: Optional[VectorStore] = None
+_store_collection: Optional[str] = None
+_active_checked = 0.0
+# Collections unfertiger Re-Index-Jobs, für die Schreibzugriffe protokolliert werden
+_journal_targets: List[str] = []
+_init_lock = threading.Lock()
+_persist_lock = threading.Lock()
+_dirty = False
+_last_persist = time.monotonic()
+
+
+def active_collection() -> Tuple[str, Optional[str]]:
+    """(Name, Embedding-Modell) der aktiven Collection des Backends; ohne Re-Index die ursprüngliche."""
+    from app.services.db import SessionLocal, VectorCollection
+
+    db = SessionLocal()
     try:
-        collection.add(
-            documents=[text],
-            embeddings=[embedding],
-            metadatas=[metadata or {}],
-            ids=[metadata.get("id") if metadata and "id" in metadata else None]
-        )
-        logging.info(f"[ChromaDB] Embedding erfolgreich gespeichert: {metadata.get('id') if metadata else None}")
-        print(f"[ChromaDB] Embedding erfolgreich gespeichert: {metadata.get('id') if metadata else None}")
-        import os
-        chroma_dir = os.path.abspath("chroma_db")
-        print(f"[ChromaDB-DEBUG] chroma_db exists? {os.path.exists(chroma_dir)}")
-        if os.path.exists(chroma_dir):
-            print(f"[ChromaDB-DEBUG] Inhalt von chroma_db: {os.listdir(chroma_dir)}")
-        else:
-            print(f"[ChromaDB-DEBUG] chroma_db nicht vorhanden")
-        # Versuche, persist() aufzurufen, falls verfügbar
+        row = db.query(VectorCollection.name, VectorCollection.model_name).filter_by(
+            backend=VECTOR_BACKEND, active=True).first()
+    except Exception:
+        # Tabelle fehlt (Migrationen noch nicht gelaufen): ursprüngliche Collection
+        return DEFAULT_COLLECTION, None
+    finally:
+        db.close()
+    return (row.name, row.model_name) if row else (DEFAULT_COLLECTION, None)
+
+
+def _pending_reindex_collections() -> List[str]:
+    from app.services.db import ReindexJob, SessionLocal
+    from app.services.reindex import PENDING
+
+    db = SessionLocal()
+    try:
+        return [row[0] for row in db.query(ReindexJob.collection).filter(
+            ReindexJob.backend == VECTOR_BACKEND, ReindexJob.status.in_(PENDING))]
+    except Exception:
+        # Tabellen fehlen (Migrationen noch nicht gelaufen): es gibt keinen Re-Index
+        return []
+    finally:
+        db.close()
+
+
+def _use(collection: str, model_name: Optional[str], store: Optional[VectorStore] = None):
+    """Setzt Backend und Embedding-Modell auf `collection` (Aufrufer hält _init_lock)."""
+    global _store, _store_collection
+    from app.services.embedding import embedding_service
+
+    if model_name and model_name != embedding_service.model_name:
+        logger.info("Embedding-Modell der Collection %s: %s", collection, model_name)
+        embedding_service.use_model(model_name)
+    old = _store
+    _store = store if store is not None else create_store(collection=collection)
+    _store_collection = collection
+    if old is not None:
+        # Kein close(): laufende Suchen dürfen das alte Backend noch zu Ende benutzen
         try:
-            if hasattr(collection, 'persist'):
-                collection.persist()
-                print("[ChromaDB-DEBUG] collection.persist() wurde aufgerufen.")
-            elif hasattr(globals().get('chroma_client', None), 'persist'):
-                chroma_client.persist()
-                print("[ChromaDB-DEBUG] chroma_client.persist() wurde aufgerufen.")
-        except Exception as persist_exc:
-            print(f"[ChromaDB-DEBUG] Fehler beim Persistieren: {persist_exc}")
-    except Exception as e:
-        print(f"[ChromaDB-DEBUG] Fehler beim Hinzufügen zu ChromaDB: {e}")
-        traceback.print_exc()
+            old.flush()
+        except Exception:
+            logger.exception("Fehler beim Persistieren der alten Collection")
+
+
+def get_store() -> VectorStore:
+    """
+    Öffnet das konfigurierte Backend (VECTOR_BACKEND) beim ersten Zugriff statt beim Import. Alle
+    VECTOR_ACTIVE_CHECK_INTERVAL Sekunden werden aktive Collection und unfertige Re-Index-Jobs neu gelesen.
+    """
+    global _active_checked, _journal_targets
+    now = time.monotonic()
+    if _store is None or now - _active_checked >= VECTOR_ACTIVE_CHECK_INTERVAL:
+        with _init_lock:
+            if _store is None or now - _active_checked >= VECTOR_ACTIVE_CHECK_INTERVAL:
+                _active_checked = now
+                _journal_targets = _pending_reindex_collections()
+                collection, model_name = active_collection()
+                if _store is None or collection != _store_collection:
+                    _use(collection, model_name)
+    return _store
+
+
+def invalidate():
+    """Der nächste Zugriff liest aktive Collection und Re-Index-Jobs sofort neu (nach Änderungen in diesem Prozess)."""
+    global _active_checked
+    _active_checked = 0.0
+
+
+def activate(collection: str, model_name: str, store: Optional[VectorStore] = None):
+    """
+    Macht `collection` zur aktiven Collection: erst in der DB (für andere Prozesse), dann hier.
+    Suchen sehen ab dem nächsten get_store() die neue Collection.
+    """
+    global _active_checked
+    from app.services.db import SessionLocal, VectorCollection
+
+    db = SessionLocal()
+    try:
+        db.query(VectorCollection).filter_by(backend=VECTOR_BACKEND).update({"active": False})
+        row = db.get(VectorCollection, (VECTOR_BACKEND, collection))
+        if row is None:
+            row = VectorCollection(backend=VECTOR_BACKEND, name=collection, model_name=model_name)
+            db.add(row)
+        row.active = True
+        row.model_name = model_name
+        row.activated_at = datetime.utcnow()
+        db.commit()
+    finally:
+        db.close()
+    with _init_lock:
+        _use(collection, model_name, store)
+        _active_checked = time.monotonic()
+
+
+def is_ready() -> bool:
+    return _store is not None
+
+
+def _chunks(seq: Sequence, size: int):
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+def flush():
+    """Persistiert ausstehende Änderungen des Backends (z.B. persist() bei älteren Chroma-Versionen)."""
+    global _dirty, _last_persist
+    with _persist_lock:
+        if not _dirty:
+            return
+        _dirty = False
+        _last_persist = time.monotonic()
+    try:
+        if _store is not None:
+            _store.flush()
+    except Exception:
+        logger.exception("Fehler beim Persistieren der Vektor-DB")
+
+
+def close():
+    """Beim Shutdown: ausstehende Änderungen schreiben und das Backend schließen."""
+    global _store, _store_collection
+    flush()
+    with _init_lock:
+        if _store is not None:
+            _store.close()
+            _store = None
+            _store_collection = None
+
+
+def _mark_dirty():
+    global _dirty
+    with _persist_lock:
+        _dirty = True
+        due = time.monotonic() - _last_persist >= VECTOR_DB_PERSIST_INTERVAL
+    if due:
+        flush()
+
+
+def _journal(op: str, ids: Sequence[str], documents: Optional[Sequence[str]] = None,
+             metadatas: Optional[Sequence[dict]] = None):
+    """
+    Hält Schreibzugriffe für unfertige Re-Index-Jobs in `reindex_changes` fest; der Job übernimmt sie
+    der Reihe nach in seine Collection, auch noch nach dem Umschalten. Ohne Job kein DB-Zugriff: welche
+    Jobs unfertig sind, liest get_store() im Takt von VECTOR_ACTIVE_CHECK_INTERVAL.
+    """
+    get_store()
+    targets = _journal_targets
+    if not targets:
+        return
+    from sqlalchemy import insert
+    from app.services.db import ReindexChange, SessionLocal
+
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        db.execute(insert(ReindexChange.__table__), [
+            {"collection": collection, "doc_id": id_, "op": op, "created_at": now,
+             "document": documents[i] if documents is not None else None,
+             "doc_metadata": json.dumps(metadatas[i], default=str) if metadatas is not None else None}
+            for collection in targets for i, id_ in enumerate(ids)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def add_many(texts: Sequence[str], embeddings: Sequence[list], metadatas: Sequence[Optional[dict]]) -> int:
+    """
+    Fügt viele Dokumente mit einem add pro Chunk (VECTOR_DB_BATCH_SIZE) hinzu.
+    Die ID kommt aus metadata["id"]; fehlt sie, wird eine neue erzeugt.
+    """
+    metadatas = [m or {} for m in metadatas]
+    ids = [m.get("id") or generate_id() for m in metadatas]
+    rows = list(zip(ids, texts, embeddings, metadatas))
+    if rows:
+        _journal("add", [r[0] for r in rows], [r[1] for r in rows], [r[3] for r in rows])
+    store = get_store()
+    for chunk in _chunks(rows, VECTOR_DB_BATCH_SIZE):
+        store.add(
+            ids=[r[0] for r in chunk],
+            documents=[r[1] for r in chunk],
+            embeddings=[r[2] for r in chunk],
+            metadatas=[r[3] for r in chunk],
+        )
+    if rows:
+        logger.debug("Vektor-DB: %d Embeddings gespeichert", len(rows))
+        _mark_dirty()
+    return len(rows)
+
+
+def delete_many(ids: Sequence[str]) -> int:
+    """Entfernt viele Einträge, ein delete pro Chunk."""
+    ids = list(ids)
+    if ids:
+        _journal("delete", ids)
+    store = get_store()
+    for chunk in _chunks(ids, VECTOR_DB_BATCH_SIZE):
+        store.delete(chunk)
+    if ids:
+        logger.debug("Vektor-DB: %d Embeddings entfernt", len(ids))
+        _mark_dirty()
+    return len(ids)
+
+
+def get_embeddings(ids: Sequence[str]) -> dict:
+    """Gespeicherte Vektoren zu `ids`, ein Backend-Aufruf pro Chunk."""
+    ids = list(ids)
+    store = get_store()
+    found = {}
+    for chunk in _chunks(ids, VECTOR_DB_BATCH_SIZE):
+        found.update(store.get_embeddings(chunk))
+    return found
+
+
+def add_to_vector_db(text: str, embedding: list, metadata: dict = None):
+    try:
+        add_many([text], [embedding], [metadata])
+    except Exception:
+        logger.exception("Fehler beim Hinzufügen zur Vektor-DB: %s", metadata.get('id') if metadata else None)
 
 def remove_from_vector_db(chat_id: str):
-    """Entfernt einen Eintrag aus der ChromaDB-Collection anhand der ID."""
-    print(f"[ChromaDB-DEBUG] remove_from_vector_db called with id={chat_id}")
+    """Entfernt einen Eintrag aus der Vektor-DB anhand der ID."""
     try:
-        collection.delete(ids=[chat_id])
-        if hasattr(collection, 'persist'):
-            collection.persist()
-            print("[ChromaDB-DEBUG] collection.persist() nach Delete aufgerufen.")
-        elif hasattr(globals().get('chroma_client', None), 'persist'):
-            chroma_client.persist()
-            print("[ChromaDB-DEBUG] chroma_client.persist() nach Delete aufgerufen.")
-    except Exception as e:
-        print(f"[ChromaDB-DEBUG] Fehler beim Entfernen aus ChromaDB: {e}")
-
-def query_vector_db(query_embedding: list, n_results: int = 5, score_threshold: float = 0.5):
+        delete_many([chat_id])
+    except Exception:
+        logger.exception("Fehler beim Entfernen aus der Vektor-DB: %s", chat_id)
+
+def build_where(session_id: Optional[str] = None, sender: Optional[str] = None,
+                since: Optional[datetime] = None, until: Optional[datetime] = None) -> Optional[dict]:
+    """
+    Metadaten-Filter für die Vektor-Suche. Zeitfilter nutzen das numerische Feld `ts`
+    (Unix-Zeit), das beim Speichern mitgeschrieben wird.
+    """
+    conditions = []
+    if session_id:
+        conditions.append({"session_id": session_id})
+    if sender:
+        conditions.append({"sender": sender})
+    if since:
+        conditions.append({"ts": {"$gte": to_epoch(since)}})
+    if until:
+        conditions.append({"ts": {"$lte": to_epoch(until)}})
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def search_vector_db(query_embeddings: List[list], n_results: int = 5, score_threshold: Optional[float] = None,
+                     where: Optional[dict] = None, search_params: Optional[dict] = None) -> List[List[Tuple[str, dict, float]]]:
+    """
+    Multi-Vektor-Suche in einem Backend-Aufruf. Filter und Score-Schwelle (als Distanz-Schranke)
+    werden an das Backend durchgereicht. Ergebnis: pro Query eine Liste (Dokument, Metadaten, Score).
+    """
+    max_distance = 1.0 - score_threshold if score_threshold is not None else None
+    store = get_store()
+    with metrics.timed(vector_query_time, "vector_query", {"backend": VECTOR_BACKEND}):
+        results = store.query(query_embeddings, n_results=n_results, search_params=search_params,
+                              where=where, max_distance=max_distance)
+    # Backends geben Distanzen zurück, wir wandeln sie in Ähnlichkeit um: similarity = 1 - distance
+    hits = []
+    for docs, metas, dists in zip(results.get('documents') or [], results.get('metadatas') or [], results.get('distances') or []):
+        hits.append([
+            (doc, meta or {}, 1.0 - dist if dist is not None else 0.0)
+            for doc, meta, dist in zip(docs, metas, dists)
+        ])
+    return hits
+
+
+def query_vector_db(query_embedding: list, n_results: int = 5, score_threshold: float = 0.5, search_params: dict = None,
+                    where: Optional[dict] = None):
     """
     Gibt nur Ergebnisse zurück, deren Score >= score_threshold ist. Score wird mitgeliefert.
+    `search_params` (z.B. `{"nprobe": 16}`) steuern Recall vs. Latenz beim ANN-Index.
     """
-    results = collection.query(query_embeddings=[query_embedding], n_results=n_results, include=['documents', 'metadatas', 'distances'])
-    # Chroma gibt Distanzen zurück, wir wandeln sie in Ähnlichkeit um: similarity = 1 - distance
-    filtered = {'documents': [[]], 'metadatas': [[]], 'scores': [[]]}
-    for doc, meta, dist in zip(results.get('documents', [[]])[0], results.get('metadatas', [[]])[0], results.get('distances', [[]])[0]):
-        score = 1.0 - dist if dist is not None else 0.0
-        if score >= score_threshold:
-            filtered['documents'][0].append(doc)
-            filtered['metadatas'][0].append(meta)
-            filtered.setdefault('scores', [[]])[0].append(score)
-    return filtered
+    hits = search_vector_db([query_embedding], n_results, score_threshold, where, search_params)[0]
+    return {
+        'documents': [[doc for doc, _, _ in hits]],
+        'metadatas': [[meta for _, meta, _ in hits]],
+        'scores': [[score for _, _, score in hits]],
+    }
@@ -0,0 +1,47 @@
+"""
+Austauschbare Vektor-Backends. Auswahl per `VECTOR_BACKEND`:
+
+- `chroma` (Standard): ChromaDB PersistentClient unter CHROMA_DB_PATH
+- `numpy`: memory-mapped float32-Index unter VECTOR_INDEX_PATH (exakte Suche)
+
+Mit SIDECAR_MODE=client liefert `create_store` für das konfigurierte Backend einen
+`RemoteVectorStore`, der an den Sidecar-Prozess weiterreicht (app/services/sidecar.py).
+
+Neben der ursprünglichen Collection `chat_data` kann es versionierte Collections aus
+einem Re-Index geben (`chat_data_v2`, ...); welche aktiv ist, steht in `vector_collections`.
+"""
+import os
+
+from app.services.vector_store.base import VectorStore
+
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+CHROMA_DB_PATH = os.getenv("CHROMA_DB_PATH", "./chroma_db")
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", "./vector_index")
+
+DEFAULT_COLLECTION = "chat_data"
+
+# Sidecar-Client (SIDECAR_MODE=client): Collections des konfigurierten Backends liegen im Sidecar
+_remote = None
+
+
+def set_remote(client):
+    global _remote
+    _remote = client
+
+
+def create_store(backend: str = VECTOR_BACKEND, collection: str = DEFAULT_COLLECTION) -> VectorStore:
+    if _remote is not None and backend == VECTOR_BACKEND:
+        from app.services.vector_store.remote_store import RemoteVectorStore
+        return RemoteVectorStore(_remote, collection)
+    if backend == "chroma":
+        from app.services.vector_store.chroma_store import ChromaVectorStore
+        return ChromaVectorStore(CHROMA_DB_PATH, collection)
+    if backend == "numpy":
+        from app.services.vector_store.numpy_store import NumpyVectorStore
+        # Versionierte Collections als Unterverzeichnisse, die ursprüngliche bleibt, wo sie war
+        path = VECTOR_INDEX_PATH if collection == DEFAULT_COLLECTION else os.path.join(VECTOR_INDEX_PATH, "collections", collection)
+        return NumpyVectorStore(path)
+    raise ValueError(f"Unbekanntes Vektor-Backend: {backend}")
+
+
+__all__ = ["VectorStore", "create_store", "VECTOR_BACKEND", "DEFAULT_COLLECTION"]
@@ -0,0 +1,46 @@
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence
+
+
+class VectorStore(ABC):
+    """
+    Gemeinsame Schnittstelle der Vektor-Backends hinter `app.services.vector_db`.
+
+    `query` liefert das von Chroma bekannte Format: pro Query-Vektor je eine Liste
+    in `ids`, `documents`, `metadatas` und `distances` (kleiner = ähnlicher).
+    `search_params` (z.B. `{"nprobe": 16}`) sind backend-spezifisch; unbekannte werden ignoriert.
+
+    `where` ist ein Metadaten-Filter in Chroma-Syntax, z.B.
+    `{"$and": [{"session_id": "abc"}, {"ts": {"$gte": 1700000000}}]}`
+    (Operatoren: `$eq`, `$ne`, `$gt`, `$gte`, `$lt`, `$lte`, `$in`, `$and`, `$or`).
+    `max_distance` verwirft Treffer mit größerer Distanz bereits im Backend.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def add(self, ids: Sequence[str], documents: Sequence[str], embeddings: Sequence[list], metadatas: Sequence[dict]):
+        ...
+
+    @abstractmethod
+    def delete(self, ids: Sequence[str]):
+        ...
+
+    @abstractmethod
+    def query(self, query_embeddings: Sequence[list], n_results: int, search_params: Optional[dict] = None,
+              where: Optional[dict] = None, max_distance: Optional[float] = None) -> Dict[str, List[list]]:
+        ...
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    def get_embeddings(self, ids: Sequence[str]) -> Dict[str, Sequence[float]]:
+        """Gespeicherte Vektoren zu `ids` (Liste oder float32-Array); fehlende IDs fehlen im Ergebnis."""
+        return {}
+
+    def flush(self):
+        """Ausstehende Änderungen dauerhaft schreiben (falls das Backend puffert)."""
+
+    def close(self):
+        """Ressourcen freigeben."""
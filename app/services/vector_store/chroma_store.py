@@ -0,0 +1,70 @@
+import logging
+import os
+from typing import Dict, List, Sequence
+
+from app.services.vector_store.base import VectorStore
+
+logger = logging.getLogger(__name__)
+
+
+class ChromaVectorStore(VectorStore):
+    """Backend auf Basis von `chromadb.PersistentClient` (Standard)."""
+
+    name = "chroma"
+
+    def __init__(self, path: str, collection_name: str = "chat_data"):
+        import chromadb
+        logger.info("Initialisiere ChromaDB PersistentClient mit Pfad: %s", os.path.abspath(path))
+        self.client = chromadb.PersistentClient(path=path)
+        # Kosinus-Distanz wie im NumPy-Backend, damit score_threshold (1 - Distanz) in beiden gleich wirkt
+        self.collection = self.client.get_or_create_collection(collection_name, metadata={"hnsw:space": "cosine"})
+        space = (getattr(self.collection, "metadata", None) or {}).get("hnsw:space", "l2")
+        if space != "cosine":
+            # Bestehende Collections behalten ihre Metrik; ein Re-Index legt eine neue mit cosine an
+            logger.warning("Collection %s nutzt die Distanz %r statt cosine; für einheitliche Scores neu indizieren "
+                           "(python -m app.services.reindex)", collection_name, space)
+
+    def add(self, ids, documents, embeddings, metadatas):
+        # upsert (ab Chroma 0.4): wiederholte Batches der Write-Behind-Queue lösen keine Duplikat-Fehler aus
+        write = getattr(self.collection, "upsert", self.collection.add)
+        write(ids=list(ids), documents=list(documents), embeddings=list(embeddings), metadatas=list(metadatas))
+
+    def delete(self, ids: Sequence[str]):
+        self.collection.delete(ids=list(ids))
+
+    def query(self, query_embeddings, n_results: int, search_params=None, where=None, max_distance=None) -> Dict[str, List[list]]:
+        # Chroma erlaubt kein ef/nprobe pro Query; search_params werden ignoriert
+        results = self.collection.query(
+            query_embeddings=list(query_embeddings),
+            n_results=n_results,
+            where=where or None,
+            include=['documents', 'metadatas', 'distances'],
+        )
+        if max_distance is None:
+            return results
+        # Distanz-Schranke kennt Chroma nicht; Treffer sind sortiert, also abschneiden
+        out = {key: [] for key in ('ids', 'documents', 'metadatas', 'distances')}
+        for i, distances in enumerate(results.get('distances') or []):
+            keep = sum(1 for d in distances if d is not None and d <= max_distance)
+            for key in out:
+                out[key].append(results[key][i][:keep])
+        return out
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def get_embeddings(self, ids: Sequence[str]) -> Dict[str, Sequence[float]]:
+        if not ids:
+            return {}
+        result = self.collection.get(ids=list(ids), include=['embeddings'])
+        embeddings = result.get('embeddings')
+        if embeddings is None:
+            return {}
+        return {id_: e for id_, e in zip(result.get('ids') or [], embeddings) if e is not None}
+
+    def flush(self):
+        # Chroma >= 0.4 schreibt selbst auf Platte; ältere Versionen brauchen persist()
+        if hasattr(self.collection, 'persist'):
+            self.collection.persist()
+        elif hasattr(self.client, 'persist'):
+            self.client.persist()
@@ -0,0 +1,106 @@
+"""
+IVF-Flat-Index (inverted file) für das NumPy-Backend.
+
+Die Vektoren werden per sphärischem k-Means in `nlist` Listen eingeteilt. Eine Suche
+vergleicht die Query nur mit den Zeilen der `nprobe` nächstgelegenen Listen; größeres
+`nprobe` = höherer Recall, höhere Latenz. Neue Zeilen werden inkrementell der nächsten
+Liste zugeordnet, ohne neu zu trainieren.
+"""
+import os
+from typing import Optional
+
+import numpy as np
+
+_ASSIGN_CHUNK = 65536
+
+
+def _assign(matrix: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nächster Centroid (max. Skalarprodukt) pro Zeile, in Blöcken gegen Speicherspitzen."""
+    out = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), _ASSIGN_CHUNK):
+        block = np.asarray(matrix[start:start + _ASSIGN_CHUNK], dtype=np.float32)
+        out[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+def _build_lists(assign: np.ndarray, nlist: int):
+    order = np.argsort(assign, kind="stable").astype(np.int64)
+    offsets = np.zeros(nlist + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assign, minlength=nlist), out=offsets[1:])
+    return order, offsets
+
+
+class IVFIndex:
+    """
+    Unveränderlich: `extended()` liefert ein neues Objekt, damit laufende Suchen
+    ohne Sperre auf einem konsistenten Stand arbeiten.
+    """
+
+    def __init__(self, centroids: np.ndarray, assign: np.ndarray, file_generation: int,
+                 trained_rows: int, base: Optional[int] = None, lists=None):
+        self.centroids = centroids
+        self.nlist = len(centroids)
+        self.assign = assign
+        self.file_generation = file_generation
+        self.trained_rows = trained_rows
+        # Zeilen < base liegen in den CSR-Listen, der Rest im "Tail" (inkrementell hinzugefügt)
+        self.base = len(assign) if base is None else base
+        self.order, self.offsets = lists if lists is not None else _build_lists(assign[:self.base], self.nlist)
+
+    @property
+    def n_rows(self) -> int:
+        return len(self.assign)
+
+    @classmethod
+    def train(cls, matrix: np.ndarray, n_rows: int, alive: np.ndarray, nlist: int, file_generation: int,
+              iterations: int = 10, sample_size: int = 100000, seed: int = 0) -> "IVFIndex":
+        rng = np.random.default_rng(seed)
+        live = np.flatnonzero(alive[:n_rows])
+        sample_rows = rng.choice(live, size=min(sample_size, len(live)), replace=False)
+        sample = np.asarray(matrix[np.sort(sample_rows)], dtype=np.float32)
+        nlist = max(1, min(nlist, len(sample)))
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # Leere Listen mit zufälligen Samples neu besetzen
+            if empty.any():
+                sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+                norms[empty] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+        assign = _assign(matrix[:n_rows], centroids)
+        return cls(centroids, assign, file_generation, trained_rows=n_rows)
+
+    def extended(self, matrix: np.ndarray, n_rows: int, tail_limit: int) -> "IVFIndex":
+        """Ordnet neue Zeilen zu; ist der Tail zu groß, werden die CSR-Listen neu aufgebaut."""
+        if n_rows <= self.n_rows:
+            return self
+        assign = np.concatenate([self.assign, _assign(matrix[self.n_rows:n_rows], self.centroids)])
+        if n_rows - self.base > tail_limit:
+            return IVFIndex(self.centroids, assign, self.file_generation, self.trained_rows)
+        return IVFIndex(self.centroids, assign, self.file_generation, self.trained_rows,
+                        base=self.base, lists=(self.order, self.offsets))
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        nprobe = max(1, min(nprobe, self.nlist))
+        centroid_scores = self.centroids @ query
+        probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe] if nprobe < self.nlist else np.arange(self.nlist)
+        parts = [self.order[self.offsets[p]:self.offsets[p + 1]] for p in probes]
+        if self.n_rows > self.base:
+            tail = self.assign[self.base:]
+            parts.append(np.flatnonzero(np.isin(tail, probes)) + self.base)
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def save(self, path: str):
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, centroids=self.centroids, assign=self.assign,
+                 file_generation=self.file_generation, trained_rows=self.trained_rows)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        data = np.load(path)
+        return cls(data["centroids"], data["assign"], int(data["file_generation"]), int(data["trained_rows"]))
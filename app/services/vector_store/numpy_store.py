@@ -0,0 +1,585 @@
+"""
+In-Process-Vektorindex: normalisierte float32-Vektoren in einer memory-mapped Datei,
+exakte Top-k-Suche per Matrix-Vektor-Produkt und `argpartition`.
+
+Aufbau des Verzeichnisses (VECTOR_INDEX_PATH):
+- `meta.db`: SQLite mit Zeilennummer, ID, Dokument, Metadaten und Tombstone-Flag; `tombstones`
+  hält pro Generation die gelöschten Zeilen, damit Leser ihre Maske inkrementell nachführen
+- `vectors.<generation>.f32`: Rohmatrix (Kapazität x Dimension); die aktive Datei steht in `meta.db`
+- `write.lock`: Dateisperre für Schreiber (mehrere Worker-Prozesse)
+
+- `ivf.npz`: trainierter IVF-Index (nur bei VECTOR_INDEX_MODE=ivf)
+
+Leser mappen die Vektordatei nur lesend und teilen sich so die Seiten im Page-Cache.
+Löschen setzt nur einen Tombstone; überschreitet der Anteil gelöschter Zeilen
+VECTOR_COMPACT_RATIO, wird in eine neue Datei kompaktiert und atomar umgeschaltet.
+
+Suchmodi (VECTOR_INDEX_MODE): `exact` vergleicht mit allen Zeilen, `ivf` nutzt einen
+IVF-Flat-Index (siehe ivf.py), sobald mindestens IVF_MIN_ROWS Zeilen vorhanden sind.
+Bis der Index trainiert ist, wird exakt gesucht.
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.services.vector_store.base import VectorStore
+from app.services.vector_store.ivf import IVFIndex
+
+try:
+    import fcntl
+except ImportError:  # Windows: nur prozessinterne Sperre
+    fcntl = None
+
+VECTOR_COMPACT_RATIO = float(os.getenv("VECTOR_COMPACT_RATIO", "0.3"))
+VECTOR_COMPACT_MIN_ROWS = int(os.getenv("VECTOR_COMPACT_MIN_ROWS", "1000"))
+VECTOR_INDEX_MODE = os.getenv("VECTOR_INDEX_MODE", "exact")
+# 0 = automatisch (~sqrt(Zeilen))
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+IVF_MIN_ROWS = int(os.getenv("IVF_MIN_ROWS", "50000"))
+IVF_TRAIN_SAMPLE = int(os.getenv("IVF_TRAIN_SAMPLE", "100000"))
+# Neu trainieren, wenn der Index seit dem letzten Training um diesen Faktor gewachsen ist
+IVF_RETRAIN_GROWTH = float(os.getenv("IVF_RETRAIN_GROWTH", "2.0"))
+_INITIAL_CAPACITY = 1024
+_IN_CHUNK = 500
+# Wiederholungen, wenn zwischen Suche und Lookup kompaktiert wurde
+_RENUMBER_RETRIES = 5
+
+logger = logging.getLogger(__name__)
+
+_INDEXED_FILTER_KEYS = ("session_id", "sender", "ts")
+_FILTER_KEY = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_OPERATORS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+def _where_sql(where: dict, params: list) -> str:
+    """Übersetzt einen Filter in Chroma-Syntax in eine SQL-Bedingung über die JSON-Metadaten."""
+    clauses = []
+    for key, value in where.items():
+        if key in ("$and", "$or"):
+            joined = f" {key[1:].upper()} ".join(f"({_where_sql(sub, params)})" for sub in value)
+            clauses.append(joined or "1")
+            continue
+        if not _FILTER_KEY.match(key):
+            raise ValueError(f"Ungültiger Filter-Schlüssel: {key}")
+        column = f"json_extract(metadata, '$.{key}')"
+        conditions = value if isinstance(value, dict) else {"$eq": value}
+        for op, operand in conditions.items():
+            if op == "$in":
+                operand = list(operand)
+                if not operand:
+                    clauses.append("0")
+                    continue
+                clauses.append(f"{column} IN ({','.join('?' * len(operand))})")
+                params.extend(operand)
+            elif op in _OPERATORS:
+                clauses.append(f"{column} {_OPERATORS[op]} ?")
+                params.append(operand)
+            else:
+                raise ValueError(f"Nicht unterstützter Filter-Operator: {op}")
+    return " AND ".join(clauses) or "1"
+
+
+class _Renumbered(Exception):
+    """Seit dem Snapshot wurde kompaktiert: Zeilennummern in meta.db passen nicht mehr zur Matrix."""
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _top_k(rows: np.ndarray, scores: np.ndarray, k: int, min_score: Optional[float] = None):
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    top = top[np.argsort(-scores[top])]
+    if min_score is not None:
+        top = top[scores[top] >= min_score]
+    else:
+        top = top[np.isfinite(scores[top])]
+    return rows[top], scores[top]
+
+
+class NumpyVectorStore(VectorStore):
+    name = "numpy"
+
+    def __init__(self, path: str, index_mode: str = VECTOR_INDEX_MODE):
+        self.path = path
+        self.index_mode = index_mode
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(os.path.join(path, "meta.db"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS rows (
+                row INTEGER PRIMARY KEY,
+                id TEXT NOT NULL UNIQUE,
+                document TEXT,
+                metadata TEXT,
+                deleted INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS tombstones (row INTEGER PRIMARY KEY, generation INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS ix_tombstones_generation ON tombstones (generation);
+        """)
+        # Ausdrucks-Indizes für die häufigsten Filter (Syntax muss exakt zu _where_sql passen)
+        for key in _INDEXED_FILTER_KEYS:
+            self._db.execute(
+                f"CREATE INDEX IF NOT EXISTS ix_rows_{key} ON rows (json_extract(metadata, '$.{key}'))"
+            )
+        self._db.commit()
+        self._generation = None
+        self._matrix: Optional[np.memmap] = None
+        self._alive = np.zeros(0, dtype=bool)
+        self._n_rows = 0
+        self._dim = 0
+        self._file_generation = 0
+        self._ivf: Optional[IVFIndex] = None
+        self._ivf_mtime = None
+        self._training: Optional[threading.Thread] = None
+        self._sync()
+
+    # ----- Zustand -----
+
+    def _info(self, key: str, default=None):
+        row = self._db.execute("SELECT value FROM info WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_info(self, **values):
+        self._db.executemany(
+            "INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)",
+            [(k, str(v)) for k, v in values.items()],
+        )
+
+    def _vector_file(self, generation: int) -> str:
+        return os.path.join(self.path, f"vectors.{generation}.f32")
+
+    def _sync(self):
+        """
+        Zustand neu laden, falls ein anderer Prozess (oder Thread) geschrieben hat. Die Maske lebender
+        Zeilen wird um neue Zeilen und seit der letzten Generation gelöschte Zeilen ergänzt; komplett
+        neu gelesen wird nur nach einer Kompaktierung (neue Zeilennummern).
+        """
+        with self._lock:
+            # Eine Lesetransaktion: info und Tombstones aus demselben Stand
+            begun = not self._db.in_transaction
+            if begun:
+                self._db.execute("BEGIN")
+            try:
+                info = dict(self._db.execute("SELECT key, value FROM info"))
+                generation = int(info.get("generation", 0))
+                if generation == self._generation:
+                    return
+                n_rows = int(info.get("n_rows", 0))
+                file_generation = int(info.get("file_generation", 0))
+                rescan = self._generation is None or file_generation != self._file_generation
+                if rescan:
+                    rows = [r for (r,) in self._db.execute("SELECT row FROM rows WHERE deleted = 0")]
+                else:
+                    rows = [r for (r,) in self._db.execute(
+                        "SELECT row FROM tombstones WHERE generation > ?", (self._generation,))]
+            finally:
+                if begun:
+                    self._db.execute("COMMIT")
+            rows = np.asarray(rows, dtype=np.int64)
+            if rescan:
+                alive = np.zeros(n_rows, dtype=bool)
+                alive[rows] = True
+            else:
+                # Neue Zeilen sind lebend angehängt; danach gelöschte stehen in tombstones
+                alive = np.ones(n_rows, dtype=bool)
+                alive[:len(self._alive)] = self._alive[:n_rows]
+                alive[rows[rows < n_rows]] = False
+            dim, capacity = int(info.get("dim", 0)), int(info.get("capacity", 0))
+            if rescan or dim != self._dim or self._matrix is None or self._matrix.shape[0] != capacity:
+                self._matrix = None
+                if dim and capacity:
+                    self._matrix = np.memmap(self._vector_file(file_generation), dtype=np.float32, mode="r",
+                                             shape=(capacity, dim))
+            self._dim = dim
+            self._n_rows = n_rows
+            self._file_generation = file_generation
+            self._alive = alive
+            self._generation = generation
+
+    @contextmanager
+    def _write(self):
+        """Prozessübergreifende Schreibsperre + frischer Zustand + neue Generation am Ende."""
+        with self._lock:
+            with open(os.path.join(self.path, "write.lock"), "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._sync()
+                    yield
+                    self._set_info(generation=(self._generation or 0) + 1)
+                    self._db.commit()
+                    self._sync()
+                except BaseException:
+                    self._db.rollback()
+                    self._generation = None
+                    raise
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # ----- Schreiben -----
+
+    def _ensure_capacity(self, needed: int) -> np.memmap:
+        capacity = int(self._info("capacity", 0))
+        file_generation = int(self._info("file_generation", 0))
+        path = self._vector_file(file_generation)
+        if needed > capacity:
+            new_capacity = max(_INITIAL_CAPACITY, capacity)
+            while new_capacity < needed:
+                new_capacity *= 2
+            # Datei vergrößern; bestehende Zeilen bleiben erhalten
+            with open(path, "ab") as f:
+                f.truncate(new_capacity * self._dim * 4)
+            self._set_info(capacity=new_capacity)
+            capacity = new_capacity
+        return np.memmap(path, dtype=np.float32, mode="r+", shape=(capacity, self._dim))
+
+    def add(self, ids, documents, embeddings, metadatas):
+        if not ids:
+            return
+        # Doppelte IDs im selben Aufruf: der letzte Eintrag gewinnt
+        latest = {id_: i for i, id_ in enumerate(ids)}
+        keep = sorted(latest.values())
+        ids = [ids[i] for i in keep]
+        documents = [documents[i] for i in keep]
+        metadatas = [metadatas[i] for i in keep]
+        vectors = normalize_rows(np.asarray([embeddings[i] for i in keep], dtype=np.float32))
+        with self._write():
+            if not self._dim:
+                self._dim = vectors.shape[1]
+                self._set_info(dim=self._dim)
+            if vectors.shape[1] != self._dim:
+                raise ValueError(f"Embedding-Dimension {vectors.shape[1]} passt nicht zum Index ({self._dim})")
+            # Vorhandene IDs werden ersetzt: alte Zeilen freigeben, ihre Vektoren bleiben bis zur Kompaktierung liegen
+            self._tombstone(ids)
+            self._purge_ids(ids)
+            start = self._n_rows
+            matrix = self._ensure_capacity(start + len(ids))
+            matrix[start:start + len(ids)] = vectors
+            matrix.flush()
+            del matrix
+            self._db.executemany(
+                "INSERT INTO rows (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                [
+                    (start + i, id_, doc, json.dumps(meta or {}))
+                    for i, (id_, doc, meta) in enumerate(zip(ids, documents, metadatas))
+                ],
+            )
+            self._set_info(n_rows=start + len(ids))
+
+    def _purge_ids(self, ids):
+        for i in range(0, len(ids), _IN_CHUNK):
+            chunk = list(ids[i:i + _IN_CHUNK])
+            self._db.execute("DELETE FROM rows WHERE deleted = 1 AND id IN (%s)" % ",".join("?" * len(chunk)), chunk)
+
+    def _tombstone(self, ids) -> int:
+        """Markiert die Zeilen zu `ids` als gelöscht und vermerkt sie für die Generation dieses Schreibvorgangs."""
+        generation = (self._generation or 0) + 1
+        changed = 0
+        for i in range(0, len(ids), _IN_CHUNK):
+            chunk = list(ids[i:i + _IN_CHUNK])
+            placeholders = ",".join("?" * len(chunk))
+            rows = [r for (r,) in self._db.execute(
+                "SELECT row FROM rows WHERE deleted = 0 AND id IN (%s)" % placeholders, chunk)]
+            if not rows:
+                continue
+            self._db.execute("UPDATE rows SET deleted = 1 WHERE row IN (%s)" % ",".join("?" * len(rows)), rows)
+            self._db.executemany("INSERT OR REPLACE INTO tombstones (row, generation) VALUES (?, ?)",
+                                 [(row, generation) for row in rows])
+            changed += len(rows)
+        return changed
+
+    def delete(self, ids: Sequence[str]):
+        if not ids:
+            return
+        with self._write():
+            self._tombstone(list(ids))
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        n_rows = self._n_rows
+        dead = n_rows - int(self._alive.sum())
+        if n_rows >= VECTOR_COMPACT_MIN_ROWS and dead / max(n_rows, 1) >= VECTOR_COMPACT_RATIO:
+            self.compact()
+
+    def compact(self):
+        """Schreibt nur lebende Zeilen in eine neue Vektordatei und schaltet atomar um."""
+        with self._write():
+            if self._matrix is None:
+                return
+            old_file_generation = int(self._info("file_generation", 0))
+            new_file_generation = old_file_generation + 1
+            live = [r for (r,) in self._db.execute("SELECT row FROM rows WHERE deleted = 0 ORDER BY row")]
+            capacity = max(_INITIAL_CAPACITY, len(live))
+            new_path = self._vector_file(new_file_generation)
+            new_matrix = np.memmap(new_path, dtype=np.float32, mode="w+", shape=(capacity, self._dim))
+            if live:
+                new_matrix[:len(live)] = self._matrix[np.asarray(live, dtype=np.int64)]
+            new_matrix.flush()
+            del new_matrix
+            self._db.execute("DELETE FROM rows WHERE deleted = 1")
+            # Neue Zeilennummern: Leser lesen nach dem Wechsel der Datei ohnehin alles neu
+            self._db.execute("DELETE FROM tombstones")
+            # Aufsteigend umnummerieren: neue Nummer <= alte, daher keine Kollision
+            self._db.executemany("UPDATE rows SET row = ? WHERE row = ?", list(enumerate(live)))
+            self._set_info(n_rows=len(live), capacity=capacity, file_generation=new_file_generation)
+        # Erst nach dem Commit löschen; Leser mit altem Mapping behalten ihre Seiten (POSIX)
+        try:
+            os.remove(self._vector_file(old_file_generation))
+        except OSError:
+            pass
+
+    # ----- Lesen -----
+
+    def _snapshot(self):
+        self._sync()
+        with self._lock:
+            return self._matrix, self._alive, self._n_rows, self._current_ivf(), self._file_generation
+
+    @contextmanager
+    def _read(self, file_generation: int):
+        """
+        Lesetransaktion auf meta.db, deren Zeilennummern zur Vektordatei `file_generation` gehören.
+        compact() (auch aus einem anderen Prozess) nummeriert um; dann _Renumbered.
+        """
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                if int(self._info("file_generation", 0)) != file_generation:
+                    raise _Renumbered()
+                yield
+            finally:
+                self._db.execute("COMMIT")
+
+    @staticmethod
+    def _retry(read: Callable):
+        for attempt in range(_RENUMBER_RETRIES):
+            try:
+                return read()
+            except _Renumbered:
+                # Nächster Versuch mit frischem Snapshot (_sync sieht die neue Generation)
+                if attempt == _RENUMBER_RETRIES - 1:
+                    raise RuntimeError("Vektorindex wurde während der Suche wiederholt kompaktiert")
+
+    def _lookup(self, rows: List[int], file_generation: int) -> Dict[int, tuple]:
+        found = {}
+        with self._read(file_generation):
+            for i in range(0, len(rows), _IN_CHUNK):
+                chunk = rows[i:i + _IN_CHUNK]
+                query = "SELECT row, id, document, metadata FROM rows WHERE row IN (%s)" % ",".join("?" * len(chunk))
+                for row, id_, doc, meta in self._db.execute(query, chunk):
+                    found[row] = (id_, doc, json.loads(meta) if meta else {})
+        return found
+
+    def _filter_mask(self, where: dict, n_rows: int, file_generation: int) -> np.ndarray:
+        params = []
+        condition = _where_sql(where, params)
+        mask = np.zeros(n_rows, dtype=bool)
+        with self._read(file_generation):
+            rows = [r for (r,) in self._db.execute(f"SELECT row FROM rows WHERE deleted = 0 AND ({condition})", params)]
+        rows = np.asarray([r for r in rows if r < n_rows], dtype=np.int64)
+        mask[rows] = True
+        return mask
+
+    def search_rows(self, query_embeddings, n_results: int, nprobe: Optional[int] = None, exact: bool = False,
+                    where: Optional[dict] = None, min_score: Optional[float] = None):
+        """
+        Top-k als (Zeilennummern, Ähnlichkeiten) pro Query, bereits absteigend sortiert.
+        Mit IVF-Index werden nur die Zeilen der `nprobe` nächsten Listen verglichen.
+        `where` schränkt die Kandidaten vor dem Scoring ein, `min_score` schneidet danach ab.
+        """
+        return self._retry(lambda: self._search_rows(query_embeddings, n_results, nprobe, exact, where, min_score)[1])
+
+    def _search_rows(self, query_embeddings, n_results: int, nprobe: Optional[int], exact: bool,
+                     where: Optional[dict], min_score: Optional[float]):
+        """Wie search_rows, zusätzlich mit der Generation der Vektordatei, zu der die Zeilennummern gehören."""
+        matrix, alive, n_rows, ivf, file_generation = self._snapshot()
+        queries = normalize_rows(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+        if matrix is None or not alive.any():
+            return file_generation, [empty for _ in queries]
+        allowed = alive
+        if where:
+            allowed = alive & self._filter_mask(where, n_rows, file_generation)
+            n_allowed = int(allowed.sum())
+            if not n_allowed:
+                return file_generation, [empty for _ in queries]
+            # Selektive Filter: exakt über die wenigen erlaubten Zeilen ist schneller und vollständig
+            if n_allowed <= max(IVF_MIN_ROWS, n_rows // 20):
+                rows = np.flatnonzero(allowed)
+                scores = queries @ np.asarray(matrix[rows]).T
+                k = min(n_results, len(rows))
+                return file_generation, [_top_k(rows, row_scores, k, min_score) for row_scores in scores]
+        if ivf is not None and not exact:
+            return file_generation, [self._search_ivf(matrix, allowed, ivf, q, n_results, nprobe or IVF_NPROBE, min_score) for q in queries]
+        scores = queries @ matrix[:n_rows].T
+        scores[:, ~allowed] = -np.inf
+        k = min(n_results, int(allowed.sum()))
+        return file_generation, [_top_k(np.arange(n_rows), row_scores, k, min_score) for row_scores in scores]
+
+    def _search_ivf(self, matrix, allowed, ivf: IVFIndex, query: np.ndarray, n_results: int, nprobe: int,
+                    min_score: Optional[float] = None):
+        rows = np.sort(ivf.candidates(query, nprobe))
+        rows = rows[allowed[rows]]
+        if not len(rows):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return _top_k(rows, matrix[rows] @ query, min(n_results, len(rows)), min_score)
+
+    # ----- IVF-Index -----
+
+    def _ivf_path(self) -> str:
+        return os.path.join(self.path, "ivf.npz")
+
+    def _current_ivf(self) -> Optional[IVFIndex]:
+        """Aktueller IVF-Index (um neue Zeilen erweitert) oder None für exakte Suche. Aufruf unter self._lock."""
+        if self.index_mode != "ivf" or self._matrix is None:
+            return None
+        path = self._ivf_path()
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+        if mtime is not None and mtime != self._ivf_mtime:
+            # Von diesem oder einem anderen Prozess neu trainiert
+            try:
+                self._ivf = IVFIndex.load(path)
+                self._ivf_mtime = mtime
+            except Exception:
+                logger.exception("IVF-Index konnte nicht geladen werden")
+        ivf = self._ivf
+        stale = ivf is None or ivf.file_generation != self._file_generation
+        grown = ivf is not None and self._n_rows >= IVF_RETRAIN_GROWTH * max(ivf.trained_rows, 1)
+        if (stale or grown) and self._n_rows >= IVF_MIN_ROWS:
+            self.rebuild()
+        if stale:
+            return None
+        tail_limit = max(4096, ivf.base // 10)
+        self._ivf = ivf = ivf.extended(self._matrix, self._n_rows, tail_limit)
+        return ivf
+
+    def rebuild(self, wait: bool = False) -> bool:
+        """Trainiert den IVF-Index im Hintergrund neu. False, wenn bereits ein Training läuft."""
+        with self._lock:
+            if self._training is not None and self._training.is_alive():
+                return False
+            self._training = threading.Thread(target=self._train, name="ivf-train", daemon=True)
+            self._training.start()
+            training = self._training
+        if wait:
+            training.join()
+        return True
+
+    def _train(self):
+        started = time.perf_counter()
+        try:
+            with self._lock:
+                matrix, alive, n_rows, file_generation = self._matrix, self._alive, self._n_rows, self._file_generation
+            if matrix is None or not alive.any():
+                return
+            nlist = IVF_NLIST or int(np.clip(np.sqrt(alive.sum()), 16, 4096))
+            ivf = IVFIndex.train(matrix, n_rows, alive, nlist, file_generation, sample_size=IVF_TRAIN_SAMPLE)
+            ivf.save(self._ivf_path())
+            with self._lock:
+                self._ivf = ivf
+                self._ivf_mtime = os.path.getmtime(self._ivf_path())
+            logger.info("IVF-Index trainiert: %d Zeilen, %d Listen, %.1f s", n_rows, ivf.nlist, time.perf_counter() - started)
+        except Exception:
+            logger.exception("IVF-Training fehlgeschlagen")
+
+    def recall_report(self, sample: int = 100, k: int = 10, nprobes: Sequence[int] = (1, 2, 4, 8, 16, 32, 64)) -> dict:
+        """
+        Recall@k und Latenz des IVF-Index gegenüber der exakten Suche. Als Queries dienen
+        leicht verrauschte Vektoren zufälliger Zeilen des Index.
+        """
+        matrix, alive, n_rows, ivf, _ = self._snapshot()
+        if matrix is None or not alive.any():
+            return {"rows": 0, "error": "Index ist leer"}
+        rng = np.random.default_rng(0)
+        live = np.flatnonzero(alive)
+        picked = np.sort(rng.choice(live, size=min(sample, len(live)), replace=False))
+        queries = np.asarray(matrix[picked], dtype=np.float32)
+        queries = normalize_rows(queries + rng.normal(scale=0.05, size=queries.shape).astype(np.float32))
+        started = time.perf_counter()
+        truth = [set(rows.tolist()) for rows, _ in self.search_rows(queries, k, exact=True)]
+        exact_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        report = {"rows": int(alive.sum()), "k": k, "queries": len(queries), "exact_latency_ms": exact_ms,
+                  "mode": "ivf" if ivf is not None else "exact", "nlist": ivf.nlist if ivf is not None else None,
+                  "nprobe": []}
+        if ivf is None:
+            return report
+        for nprobe in nprobes:
+            started = time.perf_counter()
+            found = [set(rows.tolist()) for rows, _ in self.search_rows(queries, k, nprobe=nprobe)]
+            latency = (time.perf_counter() - started) * 1000 / len(queries)
+            recall = float(np.mean([len(f & t) / max(len(t), 1) for f, t in zip(found, truth)]))
+            report["nprobe"].append({"nprobe": nprobe, "recall": recall, "latency_ms": latency})
+        return report
+
+    def _format(self, hits, file_generation: int) -> Dict[str, List[list]]:
+        wanted = sorted({int(r) for rows, _ in hits for r in rows})
+        meta = self._lookup(wanted, file_generation)
+        out = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for rows, sims in hits:
+            entries = [(meta[int(r)], float(s)) for r, s in zip(rows, sims) if int(r) in meta]
+            out["ids"].append([e[0][0] for e in entries])
+            out["documents"].append([e[0][1] for e in entries])
+            out["metadatas"].append([e[0][2] for e in entries])
+            out["distances"].append([1.0 - e[1] for e in entries])
+        return out
+
+    def query(self, query_embeddings, n_results: int, search_params: Optional[dict] = None,
+              where: Optional[dict] = None, max_distance: Optional[float] = None) -> Dict[str, List[list]]:
+        nprobe = (search_params or {}).get("nprobe")
+        min_score = 1.0 - max_distance if max_distance is not None else None
+
+        def search():
+            file_generation, hits = self._search_rows(query_embeddings, n_results, nprobe, False, where, min_score)
+            return self._format(hits, file_generation)
+
+        return self._retry(search)
+
+    def count(self) -> int:
+        self._sync()
+        return int(self._alive.sum())
+
+    def get_embeddings(self, ids: Sequence[str]) -> Dict[str, Sequence[float]]:
+        """Die gespeicherten (normalisierten) Zeilen der Matrix."""
+        return self._retry(lambda: self._get_embeddings(ids))
+
+    def _get_embeddings(self, ids: Sequence[str]) -> Dict[str, Sequence[float]]:
+        self._sync()
+        found = {}
+        with self._lock:
+            matrix, n_rows, file_generation = self._matrix, self._n_rows, self._file_generation
+        if matrix is None:
+            return found
+        with self._read(file_generation):
+            for i in range(0, len(ids), _IN_CHUNK):
+                chunk = list(ids[i:i + _IN_CHUNK])
+                query = "SELECT id, row FROM rows WHERE deleted = 0 AND id IN (%s)" % ",".join("?" * len(chunk))
+                for id_, row in self._db.execute(query, chunk):
+                    if row < n_rows:
+                        found[id_] = np.array(matrix[row])
+        return found
+
+    def close(self):
+        with self._lock:
+            self._matrix = None
+            self._db.close()
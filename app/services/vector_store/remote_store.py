@@ -0,0 +1,44 @@
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from app.services.vector_store.base import VectorStore
+
+
+class RemoteVectorStore(VectorStore):
+    """Reicht alle Aufrufe an den Sidecar weiter, der die Collection tatsächlich öffnet (siehe app/services/sidecar.py)."""
+
+    name = "remote"
+
+    def __init__(self, client, collection: str):
+        self.client = client
+        self.collection = collection
+
+    def add(self, ids, documents, embeddings, metadatas):
+        if not ids:
+            return
+        self.client.call("add", np.asarray(embeddings, dtype=np.float32), collection=self.collection,
+                         ids=list(ids), documents=list(documents), metadatas=list(metadatas))
+
+    def delete(self, ids: Sequence[str]):
+        self.client.call("delete", collection=self.collection, ids=list(ids))
+
+    def query(self, query_embeddings, n_results: int, search_params=None, where=None, max_distance=None) -> Dict[str, List[list]]:
+        header, _ = self.client.call("query", np.asarray(query_embeddings, dtype=np.float32), collection=self.collection,
+                                     n_results=n_results, search_params=search_params, where=where,
+                                     max_distance=max_distance)
+        return header["result"]
+
+    def count(self) -> int:
+        return self.client.call("count", collection=self.collection)[0]["count"]
+
+    def get_embeddings(self, ids: Sequence[str]) -> Dict[str, Sequence[float]]:
+        if not ids:
+            return {}
+        header, matrix = self.client.call("get_embeddings", collection=self.collection, ids=list(ids))
+        if matrix is None:
+            return {}
+        return dict(zip(header["ids"], matrix))
+
+    def flush(self):
+        self.client.call("flush", collection=self.collection)
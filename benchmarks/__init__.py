@@ -0,0 +1,9 @@
+"""
+Benchmark- und Lasttest-Suite.
+
+- `fake_upstreams`: lokale Stand-ins für Ollama (NDJSON-Streaming) und die Wikipedia-API
+- `datagen`: synthetische Sessions, Nachrichten, Chat-Verlauf und Embeddings (10k bis 10M)
+- `micro`: Micro-Benchmarks für Embedding, Vektor-Suche und DB-Hydration
+- `load`: End-to-End-Last gegen einen laufenden Server (p50/p95/p99, RPS)
+- `report`: JSON-Berichte speichern und zwischen Versionen vergleichen
+"""
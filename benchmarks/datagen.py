@@ -0,0 +1,158 @@
+"""
+Synthetische Daten für Benchmarks: Sessions, Nachrichten, Chat-Verlauf und Embeddings.
+
+Schreibt in die konfigurierte DB (DATABASE_URL) und Vektor-DB (VECTOR_BACKEND) der App, in Chunks,
+damit auch 10M Zeilen in konstantem Speicher durchlaufen. Ohne `--embed` sind die Embeddings
+zufällige Einheitsvektoren (schnell, für Latenz-Messungen der Suche ausreichend); mit `--embed`
+rechnet das echte Modell.
+
+    python -m benchmarks.datagen --history 100000 --sessions 10000 --messages-per-session 10
+    python -m benchmarks.datagen --history 10000000 --no-vectors   # nur DB
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Iterator, List
+
+import numpy as np
+from sqlalchemy import insert
+
+from app.core.utils import to_epoch
+from app.services import vector_db
+from app.services.db import ChatHistory, ChatMessage, ChatSession, SessionLocal, engine
+from app.services.migrations import run_migrations
+
+EMBEDDING_DIM = 384
+
+_TOPICS = ("Katzen", "Hunde", "Vektorsuche", "Python", "Berlin", "Kaffee", "Fußball", "Quantenphysik",
+           "Rezepte", "Urlaub", "Steuern", "Musik", "Datenbanken", "Wetter", "Geschichte", "Linux")
+_WORDS = ("wie", "funktioniert", "warum", "ist", "der", "die", "das", "beste", "schnell", "erklär",
+          "mir", "bitte", "genau", "Unterschied", "zwischen", "heute", "morgen", "Beispiel", "kurz")
+
+
+def _sentence(rng: random.Random, length: int) -> str:
+    words = [rng.choice(_WORDS) for _ in range(length)]
+    words.insert(rng.randrange(len(words) + 1), rng.choice(_TOPICS))
+    return " ".join(words).capitalize() + "?"
+
+
+def _unit_vectors(rng: np.random.Generator, n: int) -> np.ndarray:
+    vectors = rng.standard_normal((n, EMBEDDING_DIM), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def _ids(prefix: str, start: int, count: int) -> List[str]:
+    # Feste, sortierbare IDs: wiederholte Läufe mit gleichem Seed überschreiben statt zu verdoppeln
+    return [f"{prefix}-{i:010d}" for i in range(start, start + count)]
+
+
+def _chunks(total: int, size: int) -> Iterator[range]:
+    for start in range(0, total, size):
+        yield range(start, min(start + size, total))
+
+
+class Generator:
+    def __init__(self, seed: int = 42, chunk_size: int = 10000, vectors: bool = True, embed: bool = False,
+                 days: int = 365):
+        self.rng = random.Random(seed)
+        self.np_rng = np.random.default_rng(seed)
+        self.chunk_size = chunk_size
+        self.vectors = vectors
+        self.embed = embed
+        self.start = datetime.utcnow() - timedelta(days=days)
+        self.span = days * 86400
+
+    def _timestamp(self) -> datetime:
+        return self.start + timedelta(seconds=self.rng.uniform(0, self.span))
+
+    def _embeddings(self, texts: List[str]) -> list:
+        if self.embed:
+            from app.services.embedding import embedding_service
+            return embedding_service.embed_many(texts)
+        return _unit_vectors(self.np_rng, len(texts)).tolist()
+
+    def _write(self, table, rows: List[dict], texts: List[str], metadatas: List[dict]):
+        db = SessionLocal()
+        try:
+            # Core-Insert mit executemany statt ORM-Objekten
+            db.execute(insert(table.__table__).prefix_with("OR REPLACE", dialect="sqlite"), rows)
+            db.commit()
+        finally:
+            db.close()
+        if self.vectors and texts:
+            vector_db.add_many(texts, self._embeddings(texts), metadatas)
+
+    def history(self, count: int) -> Iterator[int]:
+        for chunk in _chunks(count, self.chunk_size):
+            rows, texts, metadatas = [], [], []
+            for chat_id in _ids("hist", chunk.start, len(chunk)):
+                prompt = _sentence(self.rng, self.rng.randint(4, 16))
+                ts = self._timestamp()
+                rows.append({"id": chat_id, "prompt": prompt, "response": _sentence(self.rng, self.rng.randint(20, 80)),
+                             "timestamp": ts, "chat_metadata": None})
+                texts.append(prompt)
+                metadatas.append({"id": chat_id, "timestamp": ts.isoformat(), "ts": to_epoch(ts)})
+            self._write(ChatHistory, rows, texts, metadatas)
+            yield len(chunk)
+
+    def sessions(self, count: int, messages_per_session: int) -> Iterator[int]:
+        per_chunk = max(1, self.chunk_size // max(1, messages_per_session))
+        for chunk in _chunks(count, per_chunk):
+            session_rows, rows, texts, metadatas = [], [], [], []
+            for session_id in _ids("sess", chunk.start, len(chunk)):
+                created = self._timestamp()
+                title = _sentence(self.rng, 3)
+                ts = created
+                for j in range(messages_per_session):
+                    ts = ts + timedelta(seconds=self.rng.randint(5, 600))
+                    message_id = f"{session_id}-{j:05d}"
+                    sender = "user" if j % 2 == 0 else "assistant"
+                    text = _sentence(self.rng, self.rng.randint(4, 40))
+                    rows.append({"id": message_id, "session_id": session_id, "sender": sender, "text": text,
+                                 "timestamp": ts})
+                    texts.append(text)
+                    metadatas.append({"id": message_id, "session_id": session_id, "sender": sender, "ts": to_epoch(ts)})
+                session_rows.append({"id": session_id, "title": title, "created_at": created,
+                                     "message_count": messages_per_session,
+                                     "last_message_at": ts if messages_per_session else None})
+            db = SessionLocal()
+            try:
+                db.execute(insert(ChatSession.__table__).prefix_with("OR REPLACE", dialect="sqlite"), session_rows)
+                db.commit()
+            finally:
+                db.close()
+            self._write(ChatMessage, rows, texts, metadatas)
+            yield len(chunk)
+
+
+def _run(label: str, total: int, steps: Iterator[int]):
+    started = time.perf_counter()
+    done = 0
+    for n in steps:
+        done += n
+        elapsed = time.perf_counter() - started
+        print(f"{label}: {done}/{total} ({done / elapsed:.0f}/s)", flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetische Benchmark-Daten erzeugen")
+    parser.add_argument("--history", type=int, default=10000, help="Einträge in chat_history")
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--messages-per-session", type=int, default=10)
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Zeilen pro Transaktion bzw. Vektor-add")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--days", type=int, default=365, help="Zeitraum der Zeitstempel")
+    parser.add_argument("--embed", action="store_true", help="Echte Embeddings statt Zufallsvektoren")
+    parser.add_argument("--no-vectors", action="store_true", help="Nur die DB füllen")
+    args = parser.parse_args()
+    run_migrations(engine)
+    gen = Generator(args.seed, args.chunk_size, vectors=not args.no_vectors, embed=args.embed, days=args.days)
+    try:
+        if args.history:
+            _run("chat_history", args.history, gen.history(args.history))
+        if args.sessions:
+            _run("sessions", args.sessions, gen.sessions(args.sessions, args.messages_per_session))
+    finally:
+        vector_db.close()
@@ -0,0 +1,96 @@
+"""
+Lokale Stand-ins für Ollama und die Wikipedia-API, damit Benchmarks ohne GPU und ohne Netz laufen.
+
+    python -m benchmarks.fake_upstreams ollama --port 11434 --ttft-ms 150 --tokens-per-sec 40 --tokens 64
+    python -m benchmarks.fake_upstreams wikipedia --port 8081 --latency-ms 80 --hit-rate 0.7
+
+Die App zeigt per OLLAMA_BASE_URL=http://localhost:11434 bzw.
+WIKIPEDIA_API_URL=http://localhost:8081/{language}/w/api.php auf die Fakes.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+_WORDS = ("der", "die", "das", "Vektor", "Modell", "Antwort", "schnell", "Daten", "Index", "Suche",
+          "Sitzung", "Katze", "Hund", "Stadt", "Fluss", "Berg", "Zahl", "Frage", "lokal", "heute")
+
+
+def _jitter(seconds: float, jitter: float) -> float:
+    return max(0.0, seconds * (1 + random.uniform(-jitter, jitter)))
+
+
+def ollama_app(ttft_ms: float = 150, tokens_per_sec: float = 40, tokens: int = 64, jitter: float = 0.1) -> FastAPI:
+    """/api/generate mit NDJSON-Streaming wie Ollama: erst Wartezeit bis zum ersten Token, dann konstante Rate."""
+    app = FastAPI()
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        # Deterministische Antwort pro Prompt, damit Caches und Coalescing messbar sind
+        rng = random.Random(hashlib.sha256(body.get("prompt", "").encode("utf-8")).digest())
+        words = [rng.choice(_WORDS) for _ in range(tokens)]
+        stream = body.get("stream", True)
+
+        async def chunks():
+            await asyncio.sleep(_jitter(ttft_ms / 1000, jitter))
+            for i, word in enumerate(words):
+                if i and tokens_per_sec > 0:
+                    await asyncio.sleep(_jitter(1 / tokens_per_sec, jitter))
+                yield json.dumps({"model": body.get("model"), "response": word + " ", "done": False}) + "\n"
+            yield json.dumps({"model": body.get("model"), "response": "", "done": True, "eval_count": tokens}) + "\n"
+
+        if not stream:
+            text = "".join([json.loads(line)["response"] async for line in chunks()])
+            return {"model": body.get("model"), "response": text, "done": True}
+        return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": "llama2"}]}
+
+    return app
+
+
+def wikipedia_app(latency_ms: float = 80, hit_rate: float = 0.7, jitter: float = 0.1) -> FastAPI:
+    """`list=search` der MediaWiki-API; ob eine Aussage "gefunden" wird, hängt deterministisch am Text."""
+    app = FastAPI()
+
+    @app.get("/{language}/w/api.php")
+    async def search(language: str, srsearch: str = ""):
+        await asyncio.sleep(_jitter(latency_ms / 1000, jitter))
+        digest = hashlib.sha256(f"{language}\0{srsearch}".encode("utf-8")).digest()
+        if digest[0] / 255 >= hit_rate:
+            return {"query": {"search": []}}
+        title = " ".join(srsearch.split()[:3]) or "Artikel"
+        return {"query": {"search": [{"title": title, "snippet": f"<span>{srsearch}</span> …"}]}}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake-Upstreams für Benchmarks")
+    sub = parser.add_subparsers(dest="upstream", required=True)
+    ollama = sub.add_parser("ollama")
+    ollama.add_argument("--port", type=int, default=11434)
+    ollama.add_argument("--ttft-ms", type=float, default=150, help="Wartezeit bis zum ersten Token")
+    ollama.add_argument("--tokens-per-sec", type=float, default=40, help="Token-Rate danach; 0 = sofort")
+    ollama.add_argument("--tokens", type=int, default=64, help="Tokens pro Antwort")
+    ollama.add_argument("--jitter", type=float, default=0.1, help="Relative Streuung der Wartezeiten")
+    wiki = sub.add_parser("wikipedia")
+    wiki.add_argument("--port", type=int, default=8081)
+    wiki.add_argument("--latency-ms", type=float, default=80)
+    wiki.add_argument("--hit-rate", type=float, default=0.7, help="Anteil der Aussagen mit Treffer")
+    wiki.add_argument("--jitter", type=float, default=0.1)
+    args = parser.parse_args()
+    if args.upstream == "ollama":
+        fake = ollama_app(args.ttft_ms, args.tokens_per_sec, args.tokens, args.jitter)
+    else:
+        fake = wikipedia_app(args.latency_ms, args.hit_rate, args.jitter)
+    uvicorn.run(fake, host="127.0.0.1", port=args.port, log_level="warning")
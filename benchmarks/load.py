@@ -0,0 +1,175 @@
+"""
+End-to-End-Lasttest gegen einen laufenden Server.
+
+Pro Szenario laufen `--concurrency` Worker für `--duration` Sekunden (oder bis `--requests`
+erreicht sind); gemessen werden Latenz (p50/p95/p99), RPS und Fehler, bei `chat_stream`
+zusätzlich die Zeit bis zum ersten Chunk. Ergebnis als JSON unter benchmarks/results/.
+
+    python -m benchmarks.fake_upstreams ollama &          # statt echtem Ollama
+    uvicorn app.main:app --port 8000 &
+    python -m benchmarks.load --scenarios chat,query,sessions,factcheck --concurrency 16 --duration 30
+"""
+import argparse
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.datagen import _sentence
+from benchmarks.report import save_report, summarize
+
+
+class Scenario:
+    """Ein Request-Typ; `call` liefert die Zeit bis zum ersten Chunk (nur beim Streaming) oder None."""
+
+    def __init__(self, name: str, call: Callable[[httpx.AsyncClient, random.Random], Awaitable[Optional[float]]],
+                 setup: Optional[Callable[[httpx.AsyncClient], Awaitable[None]]] = None):
+        self.name = name
+        self.call = call
+        self.setup = setup
+
+
+async def _chat(client: httpx.AsyncClient, rng: random.Random) -> None:
+    # cache=False: sonst misst man ab dem zweiten Durchlauf den Antwort-Cache
+    r = await client.post("/chat", json={"prompt": _sentence(rng, rng.randint(4, 16)), "cache": False})
+    r.raise_for_status()
+
+
+async def _chat_stream(client: httpx.AsyncClient, rng: random.Random) -> float:
+    started = time.perf_counter()
+    first = None
+    payload = {"prompt": _sentence(rng, rng.randint(4, 16)), "stream": True, "cache": False}
+    async with client.stream("POST", "/chat", json=payload) as r:
+        r.raise_for_status()
+        async for line in r.aiter_lines():
+            if line.strip() and first is None:
+                first = time.perf_counter() - started
+    return first
+
+
+async def _query(client: httpx.AsyncClient, rng: random.Random) -> None:
+    r = await client.post("/query", json={"query": _sentence(rng, rng.randint(4, 16)), "n_results": 5})
+    r.raise_for_status()
+
+
+_session_ids: List[str] = []
+
+
+async def _sessions_setup(client: httpx.AsyncClient):
+    for _ in range(20):
+        r = await client.post("/sessions", json={"title": "Lasttest"})
+        r.raise_for_status()
+        _session_ids.append(r.json()["id"])
+
+
+async def _sessions(client: httpx.AsyncClient, rng: random.Random) -> None:
+    # Mischung wie im Frontend: Liste, Nachrichten lesen, Nachricht schreiben
+    roll = rng.random()
+    if roll < 0.3:
+        r = await client.get("/sessions")
+    elif roll < 0.7:
+        r = await client.get(f"/sessions/{rng.choice(_session_ids)}/messages", params={"limit": 20})
+    else:
+        r = await client.post(f"/sessions/{rng.choice(_session_ids)}/message",
+                              json={"sender": "user", "text": _sentence(rng, rng.randint(4, 30))})
+    r.raise_for_status()
+
+
+async def _factcheck(client: httpx.AsyncClient, rng: random.Random) -> None:
+    text = ". ".join(_sentence(rng, rng.randint(3, 8)).rstrip("?") for _ in range(rng.randint(1, 4)))
+    r = await client.post("/factcheck", json={"text": text, "language": "de"})
+    r.raise_for_status()
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "chat": Scenario("chat", _chat),
+    "chat_stream": Scenario("chat_stream", _chat_stream),
+    "query": Scenario("query", _query),
+    "sessions": Scenario("sessions", _sessions, _sessions_setup),
+    "factcheck": Scenario("factcheck", _factcheck),
+}
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, concurrency: int, duration: float,
+                       max_requests: Optional[int], seed: int) -> dict:
+    if scenario.setup is not None:
+        await scenario.setup(client)
+    latencies: List[float] = []
+    first_chunks: List[float] = []
+    errors: Dict[str, int] = {}
+    issued = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(index: int):
+        nonlocal issued
+        rng = random.Random(seed * 1000 + index)
+        while time.perf_counter() < deadline and (max_requests is None or issued < max_requests):
+            issued += 1
+            started = time.perf_counter()
+            try:
+                first = await scenario.call(client, rng)
+            except httpx.HTTPStatusError as e:
+                key = str(e.response.status_code)
+                errors[key] = errors.get(key, 0) + 1
+                continue
+            except httpx.HTTPError as e:
+                key = type(e).__name__
+                errors[key] = errors.get(key, 0) + 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            if first is not None:
+                first_chunks.append(first)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    summary = summarize(latencies, elapsed, sum(errors.values()))
+    summary["errors_by_kind"] = errors
+    if first_chunks:
+        ttfc = summarize(first_chunks)
+        summary.update({f"first_chunk_{k}": v for k, v in ttfc.items() if k.endswith("_ms")})
+    return summary
+
+
+async def main(args) -> Tuple[dict, Optional[str]]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        results = {}
+        for name in args.scenarios.split(","):
+            scenario = SCENARIOS[name.strip()]
+            print(f"{scenario.name}: {args.concurrency} parallel, {args.duration:.0f} s ...", flush=True)
+            results[scenario.name] = await run_scenario(client, scenario, args.concurrency, args.duration,
+                                                        args.requests, args.seed)
+            s = results[scenario.name]
+            print(f"  {s['rps']:.1f} req/s  p50 {s['p50_ms']:.1f} ms  p95 {s['p95_ms']:.1f} ms  "
+                  f"p99 {s['p99_ms']:.1f} ms  Fehler {s['errors']}", flush=True)
+        try:
+            # Server-Metriken mitschreiben (Stufen-Histogramme, Queue-Tiefen) für die Auswertung
+            metrics_text = (await client.get("/metrics")).text
+        except httpx.HTTPError:
+            metrics_text = None
+    return results, metrics_text
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lasttest gegen einen laufenden Server")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--scenarios", default="chat,query,sessions,factcheck",
+                        help=f"Kommagetrennt aus: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20, help="Sekunden pro Szenario")
+    parser.add_argument("--requests", type=int, help="Max. Requests pro Szenario")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Pfad des JSON-Berichts (Standard: benchmarks/results/)")
+    parser.add_argument("--save-metrics", help="/metrics nach dem Lauf zusätzlich in diese Datei schreiben")
+    args = parser.parse_args()
+    results, metrics_text = asyncio.run(main(args))
+    if args.save_metrics and metrics_text:
+        with open(args.save_metrics, "w", encoding="utf-8") as f:
+            f.write(metrics_text)
+    path = save_report("load", results, vars(args), args.output,
+                       env_prefixes=("OLLAMA_", "CHAT_CACHE", "INGEST_", "VECTOR_", "FACTCHECK_"))
+    print(f"Bericht: {path}")
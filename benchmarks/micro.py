@@ -0,0 +1,97 @@
+"""
+Micro-Benchmarks der Einzelschritte hinter /chat und /query, im Prozess ohne HTTP.
+
+- embed / embed_batch: `EmbeddingService.embed` (Cache umgangen) und `embed_many` mit 32 Texten
+- embed_cached: Cache-Treffer
+- vector_query: `query_vector_db` mit Zufalls-Queries gegen den vorhandenen Index
+- db_hydration: Antworten zu Treffer-IDs per IN (...) laden, wie in /query
+
+    python -m benchmarks.datagen --history 100000
+    python -m benchmarks.micro --repeat 200
+"""
+import argparse
+import random
+import time
+from typing import Callable, List
+
+import numpy as np
+
+from app.services import vector_db
+from app.services.db import ChatHistory, SessionLocal
+from app.services.embedding import embedding_service
+from app.services.embedding_cache import EmbeddingCache
+from benchmarks.datagen import EMBEDDING_DIM, _sentence
+from benchmarks.report import save_report, summarize
+
+
+def _measure(fn: Callable[[int], object], repeat: int, warmup: int) -> List[float]:
+    for i in range(warmup):
+        fn(i)
+    latencies = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        fn(warmup + i)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def run(repeat: int = 100, warmup: int = 5, n_results: int = 5, batch: int = 32, seed: int = 42) -> dict:
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    texts = [_sentence(rng, rng.randint(4, 16)) for _ in range(repeat + warmup)]
+    batches = [[_sentence(rng, rng.randint(4, 16)) for _ in range(batch)] for _ in range(repeat + warmup)]
+    results = {}
+
+    # Ohne Cache: sonst misst man nach dem ersten Durchlauf nur noch Dictionary-Zugriffe
+    cache = embedding_service.cache
+    embedding_service.cache = EmbeddingCache(max_size=0, path="")
+    try:
+        embedding_service.load()
+        results["embed"] = summarize(_measure(lambda i: embedding_service.embed(texts[i]), repeat, warmup))
+        batch_latencies = _measure(lambda i: embedding_service.embed_many(batches[i]), repeat, warmup)
+        results["embed_batch"] = summarize(batch_latencies)
+        results["embed_batch"]["texts_per_sec"] = batch * len(batch_latencies) / sum(batch_latencies)
+    finally:
+        embedding_service.cache = cache
+    embedding_service.embed(texts[0])
+    results["embed_cached"] = summarize(_measure(lambda i: embedding_service.embed(texts[0]), repeat, warmup))
+
+    queries = np_rng.standard_normal((repeat + warmup, EMBEDDING_DIM), dtype=np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    queries = queries.tolist()
+    results["vector_query"] = summarize(_measure(
+        lambda i: vector_db.query_vector_db(queries[i], n_results=n_results, score_threshold=-1.0), repeat, warmup))
+
+    db = SessionLocal()
+    try:
+        ids = [row.id for row in db.query(ChatHistory.id).limit(max(1000, n_results * 10))]
+        if ids:
+            samples = [rng.sample(ids, min(n_results, len(ids))) for _ in range(repeat + warmup)]
+
+            def hydrate(i):
+                rows = db.query(ChatHistory.id, ChatHistory.response).filter(ChatHistory.id.in_(samples[i]))
+                return {row.id: row.response for row in rows}
+
+            results["db_hydration"] = summarize(_measure(hydrate, repeat, warmup))
+    finally:
+        db.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-Benchmarks für Embedding, Vektor-Suche und DB-Hydration")
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--n-results", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=32, help="Texte pro embed_many")
+    parser.add_argument("--output", help="Pfad des JSON-Berichts (Standard: benchmarks/results/)")
+    args = parser.parse_args()
+    try:
+        results = run(args.repeat, args.warmup, args.n_results, args.batch)
+    finally:
+        vector_db.close()
+    for name, summary in results.items():
+        print(f"{name:<14} p50 {summary['p50_ms']:8.2f} ms  p95 {summary['p95_ms']:8.2f} ms  p99 {summary['p99_ms']:8.2f} ms")
+    path = save_report("micro", results, vars(args), args.output,
+                       env_prefixes=("VECTOR_", "IVF_", "EMBED", "DATABASE_URL"))
+    print(f"Bericht: {path}")
@@ -0,0 +1,128 @@
+"""
+JSON-Berichte der Benchmarks: Kennzahlen berechnen, speichern und vergleichen.
+
+    python -m benchmarks.report compare benchmarks/results/load-alt.json benchmarks/results/load-neu.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+RESULTS_DIR = os.getenv("BENCH_RESULTS_DIR", os.path.join(os.path.dirname(__file__), "results"))
+
+# Kennzahlen, bei denen ein höherer Wert besser ist (alles andere: Latenzen, Fehler)
+_HIGHER_IS_BETTER = {"rps", "docs_per_sec", "texts_per_sec"}
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Perzentil mit linearer Interpolation auf bereits sortierten Werten."""
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q
+    lower = int(pos)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (pos - lower)
+
+
+def summarize(latencies: List[float], elapsed: Optional[float] = None, errors: int = 0) -> Dict[str, float]:
+    """Latenzen in Sekunden -> Kennzahlen in Millisekunden (plus RPS, wenn die Laufzeit bekannt ist)."""
+    values = sorted(latencies)
+    summary = {
+        "count": len(values),
+        "errors": errors,
+        "mean_ms": sum(values) / len(values) * 1000 if values else 0.0,
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+        "max_ms": values[-1] * 1000 if values else 0.0,
+    }
+    if elapsed:
+        summary["rps"] = len(values) / elapsed
+    return summary
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def environment(prefixes: Sequence[str] = ()) -> dict:
+    """Metadaten für den Vergleich: Commit, Python, Plattform und relevante Umgebungsvariablen."""
+    return {
+        "git": _git_revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "env": {k: v for k, v in sorted(os.environ.items()) if prefixes and k.startswith(tuple(prefixes))},
+    }
+
+
+def save_report(kind: str, results: dict, config: dict, path: Optional[str] = None,
+                env_prefixes: Sequence[str] = ()) -> str:
+    report = {
+        "kind": kind,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "config": config,
+        "environment": environment(env_prefixes),
+        "results": results,
+    }
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def compare(old: dict, new: dict) -> List[tuple]:
+    """(Benchmark, Kennzahl, alt, neu, Änderung in %, schlechter?) für alle gemeinsamen Zahlen."""
+    rows = []
+    for name, new_metrics in new["results"].items():
+        old_metrics = old["results"].get(name)
+        if not isinstance(old_metrics, dict) or not isinstance(new_metrics, dict):
+            continue
+        for key, new_value in new_metrics.items():
+            old_value = old_metrics.get(key)
+            if not isinstance(new_value, (int, float)) or not isinstance(old_value, (int, float)) or key == "count":
+                continue
+            if old_value:
+                change = (new_value - old_value) / old_value * 100
+            else:
+                # z.B. errors: 0 -> 3 ist eine Verschlechterung, auch ohne sinnvollen Prozentwert
+                change = 100.0 if new_value else 0.0
+            worse = change < 0 if key in _HIGHER_IS_BETTER else change > 0
+            rows.append((name, key, old_value, new_value, change, worse))
+    return rows
+
+
+def _load(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark-Berichte vergleichen")
+    sub = parser.add_subparsers(dest="command", required=True)
+    cmp_parser = sub.add_parser("compare", help="Zwei Berichte gegenüberstellen")
+    cmp_parser.add_argument("old")
+    cmp_parser.add_argument("new")
+    cmp_parser.add_argument("--threshold", type=float, default=10.0,
+                            help="Verschlechterung in %%, ab der der Exit-Code 1 ist")
+    args = parser.parse_args()
+    rows = compare(_load(args.old), _load(args.new))
+    regressions = 0
+    for name, key, old_value, new_value, change, worse in rows:
+        flag = ""
+        if worse and abs(change) >= args.threshold:
+            flag = "  <-- schlechter"
+            regressions += 1
+        print(f"{name:<24} {key:<14} {old_value:>12.2f} {new_value:>12.2f} {change:>+8.1f}%{flag}")
+    sys.exit(1 if regressions else 0)
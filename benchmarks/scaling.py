@@ -0,0 +1,147 @@
+"""
+Durchsatz in Abhängigkeit von der Worker-Zahl, ohne (`local`) und mit Sidecar (`sidecar`).
+
+Startet für jede Kombination einen Server per `python -m app.main --workers N [--sidecar]`,
+wartet auf /ready, fährt ein Szenario aus benchmarks.load und beendet den Server wieder.
+Gemessen werden RPS, Latenz und der Speicher aller Server-Prozesse (RSS, nur Linux), damit
+sichtbar wird, was N Modellkopien im Modus `local` kosten.
+
+    python -m benchmarks.datagen --history 100000
+    python -m benchmarks.fake_upstreams ollama &        # nur für die Szenarien chat/chat_stream
+    python -m benchmarks.scaling --workers 1,2,4 --modes local,sidecar --scenario query --concurrency 32
+
+Im Modus `local` öffnet jeder Worker das Vektor-Backend selbst; für reine Lese-Szenarien wie
+`query` ist das als Vergleich brauchbar, für Schreiblast mit Chroma nicht.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from benchmarks.load import SCENARIOS, run_scenario
+from benchmarks.report import save_report
+
+
+def _rss_mb(root: int) -> Optional[float]:
+    """RSS des Prozesses und aller Nachfahren (aus /proc), None außerhalb von Linux."""
+    if not os.path.isdir("/proc"):
+        return None
+    children: Dict[int, list] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # Feld 4 ist die PPID; der Prozessname in Klammern kann Leerzeichen enthalten
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    total_kb, stack = 0, [root]
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, ()))
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return total_kb / 1024
+
+
+def _start(mode: str, workers: int, port: int, log) -> subprocess.Popen:
+    cmd = [sys.executable, "-m", "app.main", "--port", str(port), "--workers", str(workers)]
+    if mode == "sidecar":
+        cmd.append("--sidecar")
+    env = dict(os.environ, SIDECAR_MODE="off")
+    return subprocess.Popen(cmd, env=env, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+
+
+def _stop(process: subprocess.Popen, timeout: float = 60):
+    # SIGINT wie Strg+C: Supervisor beendet Worker und danach den Sidecar
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+def _wait_ready(url: str, process: subprocess.Popen, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server beendet (Exit-Code {process.returncode})")
+        try:
+            if httpx.get(f"{url}/ready", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"{url} nicht bereit nach {timeout:.0f} s")
+
+
+async def _load(url: str, args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=args.timeout) as client:
+        scenario = SCENARIOS[args.scenario]
+        if args.warmup:
+            await run_scenario(client, scenario, args.concurrency, args.warmup, None, args.seed + 1)
+        return await run_scenario(client, scenario, args.concurrency, args.duration, args.requests, args.seed)
+
+
+def run(args) -> dict:
+    results = {}
+    url = f"http://127.0.0.1:{args.port}"
+    os.makedirs(os.path.dirname(args.server_log) or ".", exist_ok=True)
+    with open(args.server_log, "a", encoding="utf-8") as log:
+        for mode in args.modes.split(","):
+            for workers in (int(w) for w in args.workers.split(",")):
+                name = f"{mode}_w{workers}"
+                print(f"{name}: Start ...", flush=True)
+                process = _start(mode, workers, args.port, log)
+                try:
+                    _wait_ready(url, process, args.startup_timeout)
+                    summary = asyncio.run(_load(url, args))
+                    summary.update(mode=mode, workers=workers, rss_mb=_rss_mb(process.pid))
+                finally:
+                    _stop(process)
+                baseline = results.get(f"{mode}_w1")
+                if baseline and baseline["rps"]:
+                    summary["speedup"] = summary["rps"] / baseline["rps"]
+                results[name] = summary
+                rss = f"{summary['rss_mb']:.0f} MB" if summary["rss_mb"] is not None else "-"
+                print(f"  {summary['rps']:.1f} req/s  p50 {summary['p50_ms']:.1f} ms  p95 {summary['p95_ms']:.1f} ms  "
+                      f"RSS {rss}  Fehler {summary['errors']}", flush=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Durchsatz über die Worker-Zahl, mit und ohne Sidecar")
+    parser.add_argument("--workers", default="1,2,4", help="Kommagetrennte Worker-Zahlen")
+    parser.add_argument("--modes", default="local,sidecar", help="local und/oder sidecar")
+    parser.add_argument("--scenario", default="query", help=f"Eines aus: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20, help="Sekunden pro Lauf")
+    parser.add_argument("--warmup", type=float, default=3, help="Sekunden Aufwärmen vor der Messung")
+    parser.add_argument("--requests", type=int, help="Max. Requests pro Lauf")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--startup-timeout", type=float, default=180)
+    parser.add_argument("--server-log", default="benchmarks/results/scaling-server.log")
+    parser.add_argument("--output", help="Pfad des JSON-Berichts (Standard: benchmarks/results/)")
+    args = parser.parse_args()
+    results = run(args)
+    path = save_report("scaling", results, vars(args), args.output,
+                       env_prefixes=("SIDECAR_", "VECTOR_", "EMBED", "IO_POOL", "DATABASE_URL"))
+    print(f"Bericht: {path}")
@@ -100,10 +100,16 @@ export default function ChatSidebar({ onSelectSession, selectedSessionId }) {
   };
   const [sessions, setSessions] = useState([]);
 
-  const fetchSessions = () => {
-    axios.get("/sessions").then(res => {
-      setSessions(res.data);
-    });
+  const fetchSessions = async () => {
+    // Seitenweise laden, solange der Server einen Cursor für die nächste Seite liefert
+    let all = [];
+    let cursor = null;
+    do {
+      const res = await axios.get("/sessions", { params: cursor ? { cursor } : {} });
+      all = all.concat(res.data);
+      cursor = res.headers['x-next-cursor'];
+    } while (cursor);
+    setSessions(all);
   };
 
   // Undo Snackbar State
@@ -110,7 +110,7 @@ export default function ChatWindow({ selectedSession }) {
       setMessages((msgs) => [...msgs, userRes.data]);
       setPrompt('');
       // Assistant Message (LLM)
-      const llmRes = await axios.post('/chat', { prompt, model: 'llama2' });
+      const llmRes = await axios.post('/chat', { prompt, model: 'llama2', session_id: selectedSession.id });
       const assistantRes = await axios.post(`/sessions/${selectedSession.id}/message`, { sender: 'assistant', text: llmRes.data.response });
       setMessages((msgs) => [...msgs, assistantRes.data]);
       setTimeout(() => {
@@ -0,0 +1,83 @@
+"""
+Gemeinsame Fixtures: temporäre SQLite-DB, NumPy-Vektor-Backend und ein deterministisches
+Hash-Embedding statt sentence_transformers. Die Umgebung muss vor dem Import von `app`
+stehen, weil die Module ihre Einstellungen beim Import lesen.
+"""
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+import numpy as np
+import pytest
+
+_TMP = tempfile.mkdtemp(prefix="app-tests-")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{_TMP}/app.db",
+    VECTOR_BACKEND="numpy",
+    VECTOR_INDEX_PATH=os.path.join(_TMP, "vector_index"),
+    INGEST_QUEUE_PATH=os.path.join(_TMP, "ingest_queue.db"),
+    EMBEDDING_CACHE_PATH="",
+    PREWARM_ON_STARTUP="0",
+    SIDECAR_MODE="off",
+    CHAT_CACHE_ENABLED="0",
+    LOG_FORMAT="text",
+)
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.services import vector_db  # noqa: E402
+from app.services.context_builder import context_builder  # noqa: E402
+from app.services.db import Base, ListVersion, engine, init_db  # noqa: E402
+from app.services.embedding import embedding_service  # noqa: E402
+from app.services.session_cache import session_exists_cache, session_list_version  # noqa: E402
+from app.services.vector_store import VECTOR_INDEX_PATH  # noqa: E402
+
+DIM = 384
+
+
+class HashModel:
+    """Bag-of-Words über gehashte Tokens: gleiche Wörter -> ähnliche Vektoren, ohne Modell-Download."""
+
+    def encode(self, texts):
+        matrix = np.zeros((len(texts), DIM), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for token in re.findall(r"\w+", text.lower()) or [text]:
+                matrix[i, int(hashlib.md5(token.encode("utf-8")).hexdigest(), 16) % DIM] += 1.0
+            matrix[i] /= np.linalg.norm(matrix[i])
+        return matrix
+
+
+@pytest.fixture(scope="session", autouse=True)
+def fake_model():
+    model_name = embedding_service.model_name
+    embedding_service.use_model(model_name, HashModel())
+    init_db()
+    yield
+    embedding_service.use_model(model_name)
+    vector_db.close()
+    shutil.rmtree(_TMP, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def clean_storage():
+    """Jeder Test startet mit leeren Tabellen und leerem Vektor-Index."""
+    vector_db.close()
+    shutil.rmtree(VECTOR_INDEX_PATH, ignore_errors=True)
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            if table is not ListVersion.__table__:
+                conn.execute(table.delete())
+    session_exists_cache.invalidate()
+    session_list_version.invalidate()
+    context_builder.invalidate()
+    yield
+
+
+@pytest.fixture
+def client():
+    from app.main import app
+
+    with TestClient(app) as c:
+        yield c
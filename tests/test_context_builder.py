@@ -0,0 +1,131 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services import context_builder as context_module
+from app.services import llm_client
+from app.services.context_builder import ContextBuilder, estimate_tokens
+from app.services.db import ChatMessage, ChatSession, SessionLocal
+from app.services.llm_client import GenerationScheduler
+
+SESSION = "s1"
+
+
+class FakeLLM:
+    """Ersetzt `_stream_upstream`: antwortet mit einer festen Zusammenfassung oder einem Fehler."""
+
+    def __init__(self):
+        self.prompts = []
+        self.error = None
+
+    async def __call__(self, prompt, model):
+        self.prompts.append(prompt)
+        if self.error:
+            raise self.error
+        yield f"Zusammenfassung {len(self.prompts)}"
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    fake = FakeLLM()
+    monkeypatch.setattr(llm_client, "_stream_upstream", fake)
+    monkeypatch.setattr(llm_client, "scheduler", GenerationScheduler(max_concurrency=1, max_queue=0))
+    return fake
+
+
+def _messages(count, length=20):
+    db = SessionLocal()
+    try:
+        db.add(ChatSession(id=SESSION, title="kontext"))
+        start = datetime(2025, 1, 1)
+        for i in range(count):
+            db.add(ChatMessage(id=f"m{i:03d}", session_id=SESSION, sender="user" if i % 2 == 0 else "assistant",
+                               text=f"nachricht {i:03d} " + "x" * length, timestamp=start + timedelta(minutes=i)))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _build(builder, prompt="neue frage"):
+    async def main():
+        built = await builder.build("System", SESSION, prompt, "m")
+        task = builder._refreshing.get(SESSION)
+        if task is not None:
+            await task
+        return built
+    return asyncio.run(main())
+
+
+def test_recent_messages_are_trimmed_to_the_budget(llm, monkeypatch):
+    monkeypatch.setattr(context_module, "CONTEXT_SUMMARY_ENABLED", False)
+    _messages(10)
+    builder = ContextBuilder(max_tokens=60, recent_messages=8, relevant_k=0)
+    built = _build(builder)
+    assert built.tokens <= 60
+    assert 0 < built.recent < 8
+    lines = built.prompt.split("Bisheriger Verlauf:\n")[1].split("\n\n")[0].splitlines()
+    # Die neuesten Nachrichten bleiben, in chronologischer Reihenfolge
+    assert [line.split()[2] for line in lines] == [f"{i:03d}" for i in range(10 - built.recent, 10)]
+    assert built.prompt.endswith("User: neue frage")
+
+
+def test_current_prompt_is_not_repeated(llm, monkeypatch):
+    monkeypatch.setattr(context_module, "CONTEXT_SUMMARY_ENABLED", False)
+    _messages(3)
+    builder = ContextBuilder(max_tokens=1000, recent_messages=8, relevant_k=0)
+    built = _build(builder, prompt="nachricht 002 " + "x" * 20)
+    assert built.recent == 2
+    assert built.prompt.count("nachricht 002") == 1
+
+
+def test_summary_is_built_in_background_and_reused(llm, monkeypatch):
+    monkeypatch.setattr(context_module, "CONTEXT_SUMMARY_MIN_NEW", 4)
+    _messages(12)
+    builder = ContextBuilder(max_tokens=1000, recent_messages=4, relevant_k=0)
+    first = _build(builder)
+    # Noch keine Zusammenfassung; sie entsteht im Hintergrund für die 8 älteren Nachrichten
+    assert not first.summary
+    assert len(llm.prompts) == 1 and "nachricht 007" in llm.prompts[0] and "nachricht 008" not in llm.prompts[0]
+    second = _build(builder)
+    assert second.summary and "Zusammenfassung 1" in second.prompt
+    # Keine neuen älteren Nachrichten: kein weiterer Aufruf
+    assert len(llm.prompts) == 1
+    assert estimate_tokens(second.prompt) == second.tokens
+
+
+def test_failed_summary_backs_off(llm, monkeypatch):
+    monkeypatch.setattr(context_module, "CONTEXT_SUMMARY_MIN_NEW", 1)
+    _messages(6)
+    builder = ContextBuilder(max_tokens=1000, recent_messages=2, relevant_k=0)
+    llm.error = RuntimeError("Ollama nicht erreichbar")
+    assert not _build(builder).summary
+    assert not _build(builder).summary
+    assert len(llm.prompts) == 1
+    # Nach Ablauf der Wartezeit wird es erneut versucht
+    llm.error = None
+    monkeypatch.setattr(context_module, "CONTEXT_SUMMARY_RETRY_AFTER", 0)
+    _build(builder)
+    assert len(llm.prompts) == 2
+    assert _build(builder).summary
+
+
+def test_background_generations_do_not_fill_the_request_queue(llm, monkeypatch):
+    async def main():
+        gate = asyncio.Event()
+
+        async def slow(prompt, model):
+            await gate.wait()
+            yield "fertig"
+
+        monkeypatch.setattr(llm_client, "_stream_upstream", slow)
+        scheduler = llm_client.scheduler
+        background = asyncio.ensure_future(scheduler.generate_background("zusammenfassen", "m"))
+        await asyncio.sleep(0)
+        # max_concurrency=1, max_queue=0: die Anfrage wird trotz laufender Zusammenfassung angenommen
+        stream = scheduler.stream("frage", "m")
+        gate.set()
+        answer = "".join([chunk async for chunk in stream])
+        return answer, await background
+
+    assert asyncio.run(main()) == ("fertig", "fertig")
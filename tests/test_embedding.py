@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from app.services.embedding import EmbeddingService, MicroBatcher
+from app.services.embedding_cache import EmbeddingCache
+
+
+class CountingModel:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def test_concurrent_requests_share_one_encode():
+    batches = []
+
+    def encode_many(texts):
+        batches.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    async def main():
+        batcher = MicroBatcher(encode_many, max_size=3, max_wait_ms=50)
+        return await asyncio.gather(*(batcher.submit("x" * n) for n in range(1, 6)))
+
+    # Volle Batches sofort, der Rest nach der Wartezeit; jeder Aufrufer bekommt seine Zeile
+    assert asyncio.run(main()) == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+    assert batches == [["x", "xx", "xxx"], ["xxxx", "xxxxx"]]
+
+
+def test_encode_error_reaches_every_caller():
+    def encode_many(texts):
+        raise RuntimeError("Modell nicht geladen")
+
+    async def main():
+        batcher = MicroBatcher(encode_many, max_size=10, max_wait_ms=1)
+        return await asyncio.gather(batcher.submit("a"), batcher.submit("b"), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert [type(r) for r in results] == [RuntimeError, RuntimeError]
+
+
+def test_aembed_batches_and_answers_memory_hits_directly():
+    model = CountingModel()
+    service = EmbeddingService("test-model", cache=EmbeddingCache(max_size=10, path=""))
+    service.use_model("test-model", model)
+
+    async def main():
+        first = await asyncio.gather(service.aembed("eins"), service.aembed("zwei"), service.aembed("eins"))
+        again = await service.aembed("eins")
+        return first, again
+
+    first, again = asyncio.run(main())
+    assert first == [[4.0, 1.0], [4.0, 1.0], [4.0, 1.0]]
+    assert again == [4.0, 1.0]
+    # Ein encode() für den Batch, doppelte Texte nur einmal, der Treffer danach ohne Modell
+    assert model.calls == [["eins", "zwei"]]
+
+
+@pytest.mark.parametrize("max_size", [1, 2])
+def test_batcher_respects_max_size(max_size):
+    batches = []
+
+    def encode_many(texts):
+        batches.append(len(texts))
+        return [[0.0] for _ in texts]
+
+    async def main():
+        batcher = MicroBatcher(encode_many, max_size=max_size, max_wait_ms=10)
+        await asyncio.gather(*(batcher.submit(str(i)) for i in range(4)))
+
+    asyncio.run(main())
+    assert max(batches) <= max_size and sum(batches) == 4
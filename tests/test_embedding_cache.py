@@ -0,0 +1,51 @@
+import numpy as np
+
+from app.services.embedding import EmbeddingService
+from app.services.embedding_cache import EmbeddingCache, cache_key
+
+
+class CountingModel:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts):
+        self.calls.append(list(texts))
+        return np.asarray([[float(len(text)), 0.5] for text in texts], dtype=np.float32)
+
+
+def test_key_normalizes_whitespace_and_includes_model():
+    assert cache_key("m", "hallo  welt\n") == cache_key("m", " hallo welt")
+    assert cache_key("m", "hallo welt") != cache_key("n", "hallo welt")
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = EmbeddingCache(max_size=2, path="")
+    cache.put_many({"a": [1.0], "b": [2.0]})
+    assert cache.get_memory("a") == [1.0]
+    cache.put_many({"c": [3.0]})
+    assert set(cache.get_many(["a", "b", "c"])) == {"a", "c"}
+
+
+def test_disk_tier_survives_restart_and_fills_memory(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    EmbeddingCache(max_size=10, path=path).put_many({"k": [0.25, 0.5]})
+    cache = EmbeddingCache(max_size=10, path=path)
+    assert cache.get_memory("k") is None
+    assert cache.get_many(["k", "fehlt"]) == {"k": [0.25, 0.5]}
+    # Platten-Treffer liegt jetzt auch im Speicher
+    assert cache.get_memory("k") == [0.25, 0.5]
+
+
+def test_embed_many_encodes_only_missing_texts():
+    model = CountingModel()
+    service = EmbeddingService("test-model", cache=EmbeddingCache(max_size=10, path=""))
+    service.use_model("test-model", model)
+    first = service.embed_many(["a", "bb", "a"])
+    second = service.embed_many(["bb", " a ", "ccc"])
+    assert first == [[1.0, 0.5], [2.0, 0.5], [1.0, 0.5]]
+    assert second == [[2.0, 0.5], [1.0, 0.5], [3.0, 0.5]]
+    assert model.calls == [["a", "bb"], ["ccc"]]
+    # Anderes Modell: eigene Schlüssel, also neu berechnet
+    service.use_model("anderes-modell", model)
+    service.embed_many(["a"])
+    assert model.calls[-1] == ["a"]
@@ -0,0 +1,135 @@
+import asyncio
+import json
+
+import pytest
+
+from app.api import factcheck as factcheck_api
+from app.services.factcheck import FactCheckBackend, LookupResult
+from app.services.factcheck.fts_backend import FTSBackend
+from app.services.factcheck.stub_backend import StubBackend
+from app.services.fact_checker import RATE_LIMITED, FactCheckCache, FactChecker, TokenBucket, cache_key
+
+
+class FailingBackend(FactCheckBackend):
+    name = "failing"
+    remote = True
+
+    def __init__(self):
+        self.calls = 0
+
+    async def lookup(self, statement, language):
+        self.calls += 1
+        raise TimeoutError("Wikipedia antwortet nicht")
+
+
+@pytest.fixture
+def stub(tmp_path):
+    path = tmp_path / "fixtures.json"
+    path.write_text(json.dumps({"Berlin ist die Hauptstadt von Deutschland": {"summary": "Berlin", "url": "u"}}))
+    return StubBackend(str(path))
+
+
+def _checker(backend, **bucket):
+    return FactChecker(backend, FactCheckCache(max_size=100, path=""), TokenBucket(**bucket) if bucket else TokenBucket(0))
+
+
+def test_token_bucket_allows_burst_then_waits_or_rejects():
+    async def main():
+        bucket = TokenBucket(rate=20, burst=2)
+        burst = [await bucket.acquire(max_wait=0) for _ in range(2)]
+        rejected = await bucket.acquire(max_wait=0)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        waited = await bucket.acquire(max_wait=1)
+        return burst, rejected, waited, loop.time() - started
+
+    burst, rejected, waited, elapsed = asyncio.run(main())
+    assert burst == [True, True] and rejected is False
+    assert waited is True and elapsed >= 0.03
+
+
+def test_results_are_cached_by_normalized_statement(stub):
+    checker = _checker(stub)
+
+    async def main():
+        first = await checker.check("Berlin ist die Hauptstadt von Deutschland", "de")
+        again = await checker.check("  berlin ist die hauptstadt von deutschland. ", "de")
+        missing = [await checker.check("Der Mond ist aus Käse", "de") for _ in range(2)]
+        return first, again, missing
+
+    first, again, missing = asyncio.run(main())
+    assert first == again == LookupResult(True, "Berlin", "u")
+    assert missing == [LookupResult(False)] * 2
+    # "Nicht gefunden" wird ebenfalls gecacht
+    assert stub.calls == 2
+
+
+def test_check_many_deduplicates_statements(stub):
+    results = asyncio.run(_checker(stub).check_many(["Berlin ist die Hauptstadt von Deutschland", "unbekannt",
+                                                     "BERLIN ist die Hauptstadt von Deutschland!"], "de"))
+    assert [r.found for r in results] == [True, False, True]
+    assert stub.calls == 2
+
+
+def test_errors_are_not_cached():
+    backend = FailingBackend()
+    checker = _checker(backend)
+    for _ in range(2):
+        result = asyncio.run(checker.check("Aussage", "de"))
+        assert not result.found and result.summary.startswith("Fehler:")
+    assert backend.calls == 2
+
+
+def test_rate_limited_lookup_is_not_sent(stub):
+    # Das nächste Token käme erst nach weit mehr als FACTCHECK_MAX_WAIT
+    checker = _checker(stub, rate=0.001, burst=1)
+
+    async def main():
+        return [await checker.bucket.acquire(max_wait=0), await checker.check("unbekannt", "de")]
+
+    acquired, result = asyncio.run(main())
+    assert acquired is True
+    assert result == RATE_LIMITED and stub.calls == 0
+
+
+def test_disk_cache_survives_restart_and_expires(tmp_path):
+    path = str(tmp_path / "factcheck.db")
+    key = cache_key("stub", "de", "aussage")
+
+    async def main():
+        await FactCheckCache(path=path).put(key, LookupResult(True, "s", "u"), ttl=60)
+        await FactCheckCache(path=path).put("abgelaufen", LookupResult(False), ttl=-1)
+        cache = FactCheckCache(path=path)
+        return await cache.get(key), cache.get_memory(key), await cache.get("abgelaufen")
+
+    found, promoted, expired = asyncio.run(main())
+    assert found == promoted == LookupResult(True, "s", "u")
+    assert expired is None
+
+
+def test_fts_backend_matches_all_terms_and_language(tmp_path):
+    backend = FTSBackend(str(tmp_path / "corpus.db"))
+    try:
+        assert backend.add_documents([
+            {"title": "Berlin", "text": "Berlin ist die Hauptstadt von Deutschland.", "url": "https://de/berlin"},
+            {"title": "Paris", "text": "Paris ist die Hauptstadt von Frankreich.", "language": "en"},
+        ], language="de") == 2
+        result = backend.search("Hauptstadt Deutschland", "de")
+        assert result.found and result.url == "https://de/berlin" and "searchmatch" in result.summary
+        # Alle Begriffe müssen vorkommen, die Sprache muss passen
+        assert not backend.search("Hauptstadt Spanien", "de").found
+        assert not backend.search("Hauptstadt Frankreich", "de").found
+        assert backend.search("Hauptstadt Frankreich", "en").found
+        # FTS-Syntax im Text wird nicht ausgewertet
+        assert not backend.search('Berlin" OR "Paris', "de").found
+        assert not backend.search("?!", "de").found
+    finally:
+        backend.close()
+
+
+def test_factcheck_endpoint_splits_sentences(client, stub, monkeypatch):
+    monkeypatch.setattr(factcheck_api, "fact_checker", _checker(stub))
+    body = {"text": "Berlin ist die Hauptstadt von Deutschland. Der Mond ist aus Käse!", "language": "de"}
+    results = client.post("/factcheck", json=body).json()["results"]
+    assert [(r["statement"], r["found"]) for r in results] == [
+        ("Berlin ist die Hauptstadt von Deutschland", True), ("Der Mond ist aus Käse", False)]
@@ -0,0 +1,178 @@
+import asyncio
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from app.services import ingest_queue as ingest_module
+from app.services import vector_db
+from app.services.db import ChatHistory, SessionLocal
+from app.services.ingest_queue import IngestQueue
+
+
+def _enqueue(queue, chat_ids):
+    async def main():
+        for chat_id in chat_ids:
+            await queue.enqueue(chat_id, f"frage {chat_id}", f"antwort {chat_id}", datetime(2025, 1, 1, 12))
+    asyncio.run(main())
+
+
+def _stored_ids():
+    db = SessionLocal()
+    try:
+        return {row.id for row in db.query(ChatHistory.id)}
+    finally:
+        db.close()
+
+
+def _rows(path, table):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f"SELECT chat_id, attempts FROM {table} ORDER BY seq").fetchall()
+    finally:
+        conn.close()
+
+
+def _update(path, sql):
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute(sql)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def queue_path(tmp_path):
+    return str(tmp_path / "queue.db")
+
+
+@pytest.fixture
+def failing_chat(monkeypatch):
+    """Vektor-DB lehnt jeden Batch ab, der die Chats aus `failing_chat` enthält."""
+    bad = set()
+    add_many = vector_db.add_many
+
+    def flaky_add_many(texts, embeddings, metadatas):
+        if bad & {m["id"] for m in metadatas}:
+            raise RuntimeError("Vektor-DB nicht erreichbar")
+        return add_many(texts, embeddings, metadatas)
+
+    monkeypatch.setattr(vector_db, "add_many", flaky_add_many)
+    monkeypatch.setattr(ingest_module, "INGEST_MAX_BACKOFF", 0)
+    return bad
+
+
+def test_batch_is_embedded_and_stored(queue_path):
+    queue = IngestQueue(queue_path, batch_size=10)
+    _enqueue(queue, ["c1", "c2", "c3"])
+    assert asyncio.run(queue.process_batch()) == 3
+    assert _stored_ids() == {"c1", "c2", "c3"}
+    assert set(vector_db.get_embeddings(["c1", "c2", "c3"])) == {"c1", "c2", "c3"}
+    assert _rows(queue_path, "pending") == []
+
+
+def test_failing_record_is_isolated_and_retried(queue_path, failing_chat):
+    queue = IngestQueue(queue_path, batch_size=10)
+    _enqueue(queue, [f"c{i}" for i in range(8)])
+    failing_chat.add("c5")
+    # Die übrigen sieben werden trotz des fehlerhaften Datensatzes gespeichert
+    assert asyncio.run(queue.process_batch()) == 7
+    assert _stored_ids() == {f"c{i}" for i in range(8)} - {"c5"}
+    assert _rows(queue_path, "pending") == [("c5", 1)]
+    # Die Ursache ist behoben: der nächste Versuch gelingt
+    failing_chat.clear()
+    assert asyncio.run(queue.process_batch()) == 1
+    assert "c5" in _stored_ids()
+    assert _rows(queue_path, "pending") == []
+
+
+def test_record_is_dead_lettered_after_max_attempts_and_replayed(queue_path, failing_chat, monkeypatch):
+    monkeypatch.setattr(ingest_module, "INGEST_MAX_ATTEMPTS", 2)
+    queue = IngestQueue(queue_path, batch_size=10)
+    failing_chat.add("bad")
+    # Jeder Batch enthält auch gute Datensätze: der Fehler liegt also am Datensatz
+    _enqueue(queue, ["bad", "ok1"])
+    assert asyncio.run(queue.process_batch()) == 1
+    _enqueue(queue, ["ok2"])
+    assert asyncio.run(queue.process_batch()) == 1
+    assert _rows(queue_path, "pending") == []
+    assert _rows(queue_path, "dead_letter") == [("bad", 2)]
+    assert [e["chat_id"] for e in asyncio.run(queue.dead_letters())] == ["bad"]
+
+    failing_chat.clear()
+    assert asyncio.run(queue.replay_dead_letters()) == 1
+    assert _rows(queue_path, "dead_letter") == []
+    assert _rows(queue_path, "pending") == [("bad", 0)]
+    assert asyncio.run(queue.process_batch()) == 1
+    assert "bad" in _stored_ids()
+
+
+def test_outage_pauses_queue_without_counting_attempts(queue_path, monkeypatch):
+    calls = []
+
+    def down(texts, embeddings, metadatas):
+        calls.append(len(texts))
+        raise RuntimeError("Vektor-DB nicht erreichbar")
+
+    monkeypatch.setattr(ingest_module, "INGEST_MAX_ATTEMPTS", 1)
+    queue = IngestQueue(queue_path, batch_size=64)
+    _enqueue(queue, [f"c{i}" for i in range(64)])
+    with monkeypatch.context() as patch:
+        patch.setattr(vector_db, "add_many", down)
+        assert asyncio.run(queue.process_batch()) == 0
+    # Ganzer Batch und beide Hälften, keine weitere Halbierung
+    assert calls == [64, 32, 32]
+    assert _rows(queue_path, "dead_letter") == []
+    assert {attempts for _, attempts in _rows(queue_path, "pending")} == {0}
+    # Pausiert: kein Zugriff, bis der Backoff abgelaufen ist
+    assert asyncio.run(queue.process_batch()) == 0
+    _update(queue_path, "UPDATE pending SET next_attempt = 0")
+    queue._paused_until = 0.0
+    assert asyncio.run(queue.process_batch()) == 64
+    assert len(_stored_ids()) == 64
+
+
+def test_workers_claim_disjoint_batches(queue_path):
+    first, second = IngestQueue(queue_path), IngestQueue(queue_path)
+    _enqueue(first, ["a", "b", "c"])
+    claimed = first._queue_file().claim(2, first.owner, 60)
+    assert [row[1] for row in claimed] == ["a", "b"]
+    # Der zweite Worker bekommt nur, was nicht beansprucht ist
+    assert asyncio.run(second.process_batch()) == 1
+    assert _stored_ids() == {"c"}
+    # Abgelaufene Lease: der Batch eines abgestürzten Workers wird übernommen
+    _update(queue_path, "UPDATE pending SET claimed_until = 0")
+    assert asyncio.run(second.process_batch()) == 2
+    assert _stored_ids() == {"a", "b", "c"}
+
+
+def test_pending_records_survive_a_restart(queue_path):
+    # Erster Prozess: Einträge stehen in der Datei, der Worker kommt nicht mehr dazu
+    _enqueue(IngestQueue(queue_path), ["r1", "r2"])
+    assert _stored_ids() == set()
+
+    async def restart():
+        queue = IngestQueue(queue_path)
+        queue.start()
+        await queue.stop(timeout=5)
+
+    asyncio.run(restart())
+    assert _stored_ids() == {"r1", "r2"}
+    assert _rows(queue_path, "pending") == []
+
+
+def test_queue_file_of_older_version_gets_lease_columns(queue_path):
+    _update(queue_path,
+            "CREATE TABLE pending (seq INTEGER PRIMARY KEY AUTOINCREMENT, chat_id TEXT NOT NULL UNIQUE, "
+            "prompt TEXT NOT NULL, response TEXT NOT NULL, timestamp TEXT NOT NULL, embedding BLOB, "
+            "enqueued_at REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "next_attempt REAL NOT NULL DEFAULT 0, last_error TEXT)")
+    queue = IngestQueue(queue_path)
+    _enqueue(queue, ["alt"])
+    assert asyncio.run(queue.process_batch()) == 1
+
+
+def test_dead_letter_admin_endpoints(client):
+    assert client.get("/admin/ingest/dead-letters").json() == []
+    assert client.post("/admin/ingest/dead-letters/replay", json={"chat_ids": ["x"]}).json() == {"replayed": 0}
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from app.services import vector_db
+from app.services.vector_store import numpy_store
+from app.services.vector_store.ivf import IVFIndex
+from app.services.vector_store.numpy_store import NumpyVectorStore, normalize_rows
+
+DIM = 16
+
+
+def _clustered(n, clusters=8, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, DIM))
+    points = centers[rng.integers(0, clusters, n)] + 0.1 * rng.standard_normal((n, DIM))
+    return normalize_rows(points.astype(np.float32))
+
+
+def test_every_row_is_in_the_list_of_its_own_centroid():
+    matrix = _clustered(300)
+    ivf = IVFIndex.train(matrix, len(matrix), np.ones(len(matrix), dtype=bool), nlist=8, file_generation=0)
+    assert ivf.nlist == 8 and ivf.n_rows == 300
+    for row in (0, 17, 299):
+        assert row in ivf.candidates(matrix[row], nprobe=1)
+    # Alle Listen zusammen ergeben jede Zeile genau einmal
+    assert sorted(ivf.candidates(matrix[0], nprobe=8).tolist()) == list(range(300))
+
+
+def test_extended_rows_are_found_and_lists_are_rebuilt(tmp_path):
+    matrix = _clustered(400)
+    ivf = IVFIndex.train(matrix, 300, np.ones(300, dtype=bool), nlist=8, file_generation=3)
+    extended = ivf.extended(matrix, 350, tail_limit=100)
+    assert (extended.base, extended.n_rows) == (300, 350)
+    assert 320 in extended.candidates(matrix[320], nprobe=1)
+    rebuilt = extended.extended(matrix, 400, tail_limit=50)
+    assert rebuilt.base == rebuilt.n_rows == 400
+    assert 399 in rebuilt.candidates(matrix[399], nprobe=1)
+
+    path = str(tmp_path / "ivf.npz")
+    rebuilt.save(path)
+    loaded = IVFIndex.load(path)
+    assert (loaded.file_generation, loaded.trained_rows, loaded.n_rows) == (3, 300, 400)
+    assert np.array_equal(loaded.assign, rebuilt.assign)
+
+
+@pytest.fixture
+def ivf_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(numpy_store, "IVF_MIN_ROWS", 100)
+    store = NumpyVectorStore(str(tmp_path / "index"), index_mode="ivf")
+    matrix = _clustered(400)
+    ids = [f"d{i}" for i in range(len(matrix))]
+    store.add(ids, ids, matrix.tolist(), [{"id": id_} for id_ in ids])
+    store.rebuild(wait=True)
+    yield store, matrix, ids
+    store.close()
+
+
+def test_ivf_search_finds_each_vector(ivf_store):
+    store, matrix, ids = ivf_store
+    result = store.query(matrix[:50].tolist(), 1, search_params={"nprobe": 2})
+    assert [found[0] for found in result["ids"]] == ids[:50]
+    # Gelöschte Zeilen tauchen auch über den IVF-Index nicht mehr auf
+    store.delete(["d3"])
+    result = store.query(matrix[3:4].tolist(), 1, search_params={"nprobe": 8})
+    assert result["ids"][0] != ["d3"]
+
+
+def test_recall_report_reaches_full_recall_with_all_lists(ivf_store):
+    store, _, _ = ivf_store
+    nlist = store._ivf.nlist
+    report = store.recall_report(sample=20, k=5, nprobes=(1, nlist))
+    assert report["mode"] == "ivf" and report["rows"] == 400 and report["nlist"] == nlist
+    assert [entry["nprobe"] for entry in report["nprobe"]] == [1, nlist]
+    assert report["nprobe"][-1]["recall"] == pytest.approx(1.0)
+    assert 0 < report["nprobe"][0]["recall"] <= 1.0
+
+
+def test_recall_endpoint_reports_exact_mode(client):
+    assert client.get("/admin/vector/recall").json() == {"rows": 0, "error": "Index ist leer"}
+    texts = ["eins", "zwei", "drei"]
+    vector_db.add_many(texts, _clustered(3).tolist(), [{"id": t} for t in texts])
+    report = client.get("/admin/vector/recall", params={"sample": 3, "k": 2}).json()
+    assert (report["mode"], report["rows"], report["nprobe"]) == ("exact", 3, [])
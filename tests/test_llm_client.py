@@ -0,0 +1,90 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.services import llm_client
+from app.services.llm_client import GenerationQueueFull, GenerationScheduler
+
+
+class FakeUpstream:
+    """Ersetzt `_stream_upstream`; jede Generierung wartet, bis `release` gesetzt ist."""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+
+    async def __call__(self, prompt, model):
+        self.calls.append(prompt)
+        while not self.release.is_set():
+            await asyncio.sleep(0.005)
+        for word in prompt.split():
+            yield word + " "
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    fake = FakeUpstream()
+    monkeypatch.setattr(llm_client, "_stream_upstream", fake)
+    return fake
+
+
+async def _collect(stream):
+    return "".join([chunk async for chunk in stream])
+
+
+def test_identical_prompts_share_one_generation(upstream):
+    async def main():
+        scheduler = GenerationScheduler(max_concurrency=1, max_queue=0)
+        first = scheduler.stream("hallo welt", "m")
+        second = scheduler.stream("hallo welt", "m")
+        readers = asyncio.gather(_collect(first), _collect(second))
+        await asyncio.sleep(0.02)
+        upstream.release.set()
+        return await readers
+
+    assert asyncio.run(main()) == ["hallo welt ", "hallo welt "]
+    assert upstream.calls == ["hallo welt"]
+
+
+def test_full_queue_rejects_new_prompts(upstream):
+    async def main():
+        scheduler = GenerationScheduler(max_concurrency=1, max_queue=1)
+        running = scheduler.stream("a", "m")
+        queued = scheduler.stream("b", "m")
+        with pytest.raises(GenerationQueueFull) as rejected:
+            scheduler.stream("c", "m")
+        # Gleicher Prompt hängt sich an die laufende Generierung, belegt also keinen Platz
+        coalesced = scheduler.stream("a", "m")
+        # Andere Modelle haben eine eigene Queue
+        other = scheduler.stream("c", "other")
+        readers = asyncio.gather(*(_collect(s) for s in (running, queued, coalesced, other)))
+        upstream.release.set()
+        results = await readers
+        # Nach dem Abarbeiten ist wieder Platz
+        assert await _collect(scheduler.stream("c", "m")) == "c "
+        return rejected.value, results
+
+    error, results = asyncio.run(main())
+    assert error.model == "m" and error.retry_after == llm_client.OLLAMA_RETRY_AFTER
+    assert results == ["a ", "b ", "a ", "c "]
+    assert sorted(upstream.calls) == ["a", "b", "c", "c"]
+
+
+def test_chat_answers_429_when_queue_is_full(client, upstream, monkeypatch):
+    monkeypatch.setattr(llm_client, "scheduler", GenerationScheduler(max_concurrency=1, max_queue=0))
+    first = {}
+    worker = threading.Thread(target=lambda: first.update(r=client.post("/chat", json={"prompt": "eins"})))
+    worker.start()
+    deadline = time.monotonic() + 5
+    while not upstream.calls and time.monotonic() < deadline:
+        time.sleep(0.01)
+    try:
+        busy = client.post("/chat", json={"prompt": "zwei"})
+    finally:
+        upstream.release.set()
+        worker.join(5)
+    assert busy.status_code == 429
+    assert busy.headers["Retry-After"] == str(llm_client.OLLAMA_RETRY_AFTER)
+    assert first["r"].status_code == 200
@@ -0,0 +1,51 @@
+import threading
+
+from sqlalchemy import create_engine, event, inspect, select
+
+from app.services import migrations
+from app.services.db import Base, _set_sqlite_pragmas
+
+
+def _engine(path):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 30})
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    return engine
+
+
+def test_fresh_database_reaches_the_current_models(tmp_path):
+    engine = _engine(tmp_path / "frisch.db")
+    assert migrations.run_migrations(engine) == migrations.MIGRATIONS[-1][0]
+    schema = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        columns = {c["name"] for c in schema.get_columns(table.name)}
+        assert columns == set(table.c.keys()), table.name
+    # Zweiter Lauf: nichts mehr zu tun
+    assert migrations.run_migrations(engine) == migrations.MIGRATIONS[-1][0]
+
+
+def test_base_schema_is_frozen():
+    # Migration 1 legt nur die ursprünglichen Tabellen an, nicht die heutigen Modelle
+    assert set(migrations._baseline.tables) == {"chat_sessions", "chat_messages", "chat_history"}
+    assert "message_count" not in migrations._baseline.tables["chat_sessions"].c
+
+
+def test_concurrent_workers_apply_each_migration_once(tmp_path):
+    engine = _engine(tmp_path / "parallel.db")
+    results, errors = [], []
+
+    def worker():
+        try:
+            results.append(migrations.run_migrations(engine))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert results == [migrations.MIGRATIONS[-1][0]] * 4
+    with engine.connect() as conn:
+        versions = conn.execute(select(migrations.schema_migrations.c.version)).scalars().all()
+    assert sorted(versions) == [number for number, _, _ in migrations.MIGRATIONS]
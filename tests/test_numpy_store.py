@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+
+from app.services.vector_store.numpy_store import NumpyVectorStore
+
+DIM = 16
+
+
+def _vectors(n, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = NumpyVectorStore(str(tmp_path / "index"), index_mode="exact")
+    yield store
+    store.close()
+
+
+def _fill(store, n):
+    vectors = _vectors(n)
+    ids = [f"d{i}" for i in range(n)]
+    store.add(ids, [f"doc {i}" for i in range(n)], vectors.tolist(),
+              [{"id": id_, "session_id": "a" if i % 2 else "b"} for i, id_ in enumerate(ids)])
+    return ids, vectors
+
+
+def _nearest(store, vectors, **kwargs):
+    result = store.query(vectors.tolist(), 1, **kwargs)
+    return [ids[0] if ids else None for ids in result["ids"]], result
+
+
+def test_every_vector_finds_itself(store):
+    ids, vectors = _fill(store, 50)
+    found, result = _nearest(store, vectors)
+    assert found == ids
+    assert result["documents"][7] == ["doc 7"]
+    assert result["distances"][7][0] == pytest.approx(0.0, abs=1e-5)
+    assert store.count() == 50
+
+
+def test_deleted_and_replaced_ids(store):
+    ids, vectors = _fill(store, 20)
+    store.delete(["d3", "d4"])
+    found, _ = _nearest(store, vectors[[3, 4]], max_distance=0.01)
+    assert found == [None, None]
+    # Erneutes add derselben ID ersetzt Dokument und Vektor
+    replacement = _vectors(1, seed=99)
+    store.add(["d5"], ["neu"], replacement.tolist(), [{"id": "d5"}])
+    found, result = _nearest(store, replacement)
+    assert found == ["d5"] and result["documents"][0] == ["neu"]
+    assert store.count() == 18
+
+
+def test_compact_keeps_ids_and_vectors(store):
+    ids, vectors = _fill(store, 30)
+    deleted = {f"d{i}" for i in range(0, 30, 3)}
+    store.delete(sorted(deleted))
+    store.compact()
+    alive = [i for i, id_ in enumerate(ids) if id_ not in deleted]
+    found, result = _nearest(store, vectors[alive])
+    assert found == [ids[i] for i in alive]
+    assert all(meta[0]["id"] == id_ for meta, id_ in zip(result["metadatas"], found))
+    stored = store.get_embeddings([ids[i] for i in alive])
+    expected = vectors[alive] / np.linalg.norm(vectors[alive], axis=1, keepdims=True)
+    assert np.allclose(np.array([stored[ids[i]] for i in alive]), expected, atol=1e-6)
+    # Filter laufen über die umnummerierten Zeilen
+    found, _ = _nearest(store, vectors[alive], where={"session_id": "a"})
+    assert all(f is None or int(f[1:]) % 2 for f in found)
+
+
+def test_reader_detects_compaction_by_another_instance(store, monkeypatch):
+    ids, vectors = _fill(store, 30)
+    other = NumpyVectorStore(store.path, index_mode="exact")
+    try:
+        # Zwischen Suche und Metadaten-Lookup kompaktiert ein anderer Prozess
+        lookup = NumpyVectorStore._lookup
+        calls = []
+
+        def compact_first(self, rows, file_generation):
+            if not calls:
+                calls.append(file_generation)
+                other.delete(ids[:10])
+                other.compact()
+            return lookup(self, rows, file_generation)
+
+        monkeypatch.setattr(NumpyVectorStore, "_lookup", compact_first)
+        found, _ = _nearest(store, vectors[10:])
+        assert found == ids[10:]
+        assert calls
+    finally:
+        other.close()
+
+
+def test_add_rejects_other_dimension(store):
+    _fill(store, 3)
+    with pytest.raises(ValueError):
+        store.add(["x"], ["x"], [[1.0] * (DIM + 1)], [{"id": "x"}])
+    assert store.count() == 3
+
+
+def test_reader_follows_writes_of_another_instance_incrementally(store):
+    ids, vectors = _fill(store, 20)
+    other = NumpyVectorStore(store.path, index_mode="exact")
+    statements = []
+    try:
+        store._db.set_trace_callback(statements.append)
+        other.delete(["d1", "d2"])
+        other.add(["d3", "neu"], ["ersetzt", "neu"], _vectors(2, seed=7).tolist(), [{"id": "d3"}, {"id": "neu"}])
+        other.delete(["neu"])
+        assert store.count() == 18
+        assert not any("FROM rows WHERE deleted = 0" in s for s in statements)
+        assert np.array_equal(store._alive, other._alive)
+        # Nach einer Kompaktierung wird die Maske neu gelesen
+        other.compact()
+        assert store.count() == 18
+        assert any("FROM rows WHERE deleted = 0" in s for s in statements)
+        found, _ = _nearest(store, vectors[4:])
+        assert found == ids[4:]
+    finally:
+        store._db.set_trace_callback(None)
+        other.close()
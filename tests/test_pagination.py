@@ -0,0 +1,92 @@
+import time
+from datetime import datetime, timedelta
+
+from app.services import session_cache
+from app.services.db import ChatHistory, ChatSession, ListVersion, SessionLocal
+
+
+def _add(*rows):
+    db = SessionLocal()
+    try:
+        db.add_all(rows)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _pages(client, url, limit):
+    seen, cursor = [], None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = client.get(url, params=params)
+        assert response.status_code == 200
+        seen.append([item["id"] for item in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return seen
+
+
+def test_sessions_keyset_pages(client):
+    base = datetime(2025, 1, 1)
+    # Drei Sessions mit identischem Zeitstempel: die ID entscheidet die Reihenfolge
+    _add(*[ChatSession(id=f"s{i}", title=str(i), created_at=base + timedelta(minutes=i // 3 * 3)) for i in range(7)])
+    pages = _pages(client, "/sessions", 3)
+    assert pages == [["s6", "s5", "s4"], ["s3", "s2", "s1"], ["s0"]]
+    assert client.get("/sessions", params={"cursor": "kaputt"}).status_code == 400
+
+
+def test_sessions_etag_changes_with_every_write(client):
+    first = client.get("/sessions")
+    etag = first.headers["ETag"]
+    assert client.get("/sessions", headers={"If-None-Match": etag}).status_code == 304
+
+    session_id = client.post("/sessions", json={"title": "neu"}).json()["id"]
+    changed = client.get("/sessions", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+    assert [s["id"] for s in changed.json()] == [session_id]
+
+    etag = changed.headers["ETag"]
+    client.post(f"/sessions/{session_id}/message", json={"sender": "user", "text": "hallo"})
+    after_message = client.get("/sessions", headers={"If-None-Match": etag})
+    assert after_message.status_code == 200
+    assert after_message.json()[0]["message_count"] == 1
+
+    etag = after_message.headers["ETag"]
+    client.delete(f"/sessions/{session_id}")
+    assert client.get("/sessions", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_sessions_etag_of_other_workers_within_ttl(client, monkeypatch):
+    monkeypatch.setattr(session_cache.session_list_version, "ttl", 0.2)
+    etag = client.get("/sessions").headers["ETag"]
+    # Ein anderer Worker (direkt in der DB): bis zum Ablauf der TTL gilt das gehaltene ETag
+    _add(ChatSession(id="fremd", title="anderer worker", created_at=datetime(2025, 1, 1)))
+    assert client.get("/sessions", headers={"If-None-Match": etag}).status_code == 304
+    time.sleep(0.25)
+    changed = client.get("/sessions", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and [s["id"] for s in changed.json()] == ["fremd"]
+
+
+def test_session_writes_do_not_update_a_shared_row(client):
+    def version():
+        db = SessionLocal()
+        try:
+            return db.query(ListVersion.version).filter_by(name="sessions").scalar()
+        finally:
+            db.close()
+
+    before = version()
+    session_id = client.post("/sessions", json={"title": "neu"}).json()["id"]
+    client.post(f"/sessions/{session_id}/message", json={"sender": "user", "text": "hallo"})
+    assert version() == before
+
+
+def test_chats_keyset_pages(client):
+    base = datetime(2025, 1, 1)
+    _add(*[ChatHistory(id=f"c{i}", prompt=f"p{i}", response=f"r{i}", timestamp=base + timedelta(seconds=i // 2))
+           for i in range(5)])
+    assert _pages(client, "/chats", 2) == [["c4", "c3"], ["c2", "c1"], ["c0"]]
+    # NDJSON-Export ab einem Cursor liefert den Rest ohne Seitengrenzen
+    cursor = client.get("/chats", params={"limit": 2}).headers["X-Next-Cursor"]
+    lines = client.get("/chats", params={"format": "ndjson", "cursor": cursor}).text.splitlines()
+    assert len(lines) == 3
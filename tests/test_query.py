@@ -0,0 +1,132 @@
+from datetime import datetime
+
+import pytest
+
+from app.api import query as query_api
+from app.api.query import QUERY_RRF_K, _fuse
+from app.core.utils import to_epoch
+from app.services import vector_db
+from app.services.db import ChatHistory, ChatSession, SessionLocal
+from app.services.embedding import embedding_service
+
+HISTORY = {
+    "h1": "Fehlercode E1234 beim Start",
+    "h2": "Die Datenbank startet nicht",
+    "h3": "Katzen und Hunde",
+}
+
+
+def _hit(id_, score):
+    return (f"doc {id_}", {"id": id_}, score)
+
+
+def test_fuse_sums_reciprocal_ranks():
+    vector = [_hit("a", 0.9), _hit("b", 0.8), _hit("c", 0.7)]
+    lexical = [_hit("c", 12.0), _hit("d", 3.0)]
+    fused = _fuse([vector, lexical], 3)
+    assert [meta["id"] for _, meta, _ in fused] == ["c", "a", "b"]
+    doc, meta, score = fused[0]
+    assert meta["ranks"] == {"vector": 3, "lexical": 1}
+    assert score == pytest.approx(1 / (QUERY_RRF_K + 3) + 1 / (QUERY_RRF_K + 1))
+    # Die Eingabe-Metadaten bleiben unverändert
+    assert "ranks" not in vector[2][1]
+
+
+def test_fuse_uses_document_without_id():
+    fused = _fuse([[("gleich", {}, 1.0)], [("gleich", {}, 5.0)]], 5)
+    assert len(fused) == 1 and fused[0][1]["ranks"] == {"vector": 1, "lexical": 1}
+
+
+@pytest.fixture
+def history():
+    db = SessionLocal()
+    try:
+        for id_, prompt in HISTORY.items():
+            db.add(ChatHistory(id=id_, prompt=prompt, response=f"Antwort {id_}", timestamp=datetime(2025, 1, 1)))
+        db.commit()
+    finally:
+        db.close()
+    texts = list(HISTORY.values())
+    vector_db.add_many(texts, embedding_service.embed_many(texts), [{"id": id_} for id_ in HISTORY])
+
+
+def test_hybrid_query_fuses_both_legs(client, history):
+    body = {"query": "E1234 Start Datenbank", "mode": "hybrid", "score_threshold": 0.1, "n_results": 3}
+    result = client.post("/query", json=body).json()
+    ids = [item["id"] for item in result["results"]]
+    assert ids[0] == "h1"
+    assert result["results"][0]["metadata"]["ranks"] == {"vector": 1, "lexical": 1}
+    assert result["results"][0]["response"] == "Antwort h1"
+    assert "h3" not in ids
+    assert set(result["timings"]) == {"embed", "vector", "lexical"}
+
+
+def test_hybrid_falls_back_to_vector_without_fts(client, history, monkeypatch):
+    monkeypatch.setattr(query_api.lexical, "is_available", lambda: False)
+    body = {"query": "E1234 Start", "mode": "hybrid", "score_threshold": 0.1}
+    result = client.post("/query", json=body).json()
+    assert result["results"][0]["id"] == "h1"
+    assert "ranks" not in result["results"][0]["metadata"]
+    body["mode"] = "lexical"
+    assert client.post("/query", json=body).status_code == 400
+
+
+def test_build_where_combines_filters():
+    assert vector_db.build_where() is None
+    assert vector_db.build_where(session_id="s1") == {"session_id": "s1"}
+    where = vector_db.build_where("s1", "user", datetime(2025, 1, 1), datetime(2025, 1, 2))
+    assert where["$and"][:2] == [{"session_id": "s1"}, {"sender": "user"}]
+    assert where["$and"][2]["ts"]["$gte"] < where["$and"][3]["ts"]["$lte"]
+
+
+@pytest.fixture
+def messages():
+    db = SessionLocal()
+    try:
+        db.add_all([ChatSession(id="s1", title="eins"), ChatSession(id="s2", title="zwei")])
+        db.commit()
+    finally:
+        db.close()
+    # Viele sehr ähnliche Treffer in s2, ein schwächerer in s1; "ghost" hat keine Session mehr
+    rows = [(f"s2-{i}", "s2", "user", f"fehler E1234 datenbank start {i}", 1) for i in range(10)]
+    rows += [("s1-0", "s1", "assistant", "fehler in der datenbank", 2), ("ghost-0", "ghost", "user", "fehler E1234 datenbank start", 3)]
+    texts = [r[3] for r in rows]
+    metadatas = [{"id": id_, "session_id": session, "sender": sender, "ts": to_epoch(datetime(2025, 1, day))}
+                 for id_, session, sender, _, day in rows]
+    vector_db.add_many(texts, embedding_service.embed_many(texts), metadatas)
+
+
+def test_filters_are_applied_before_top_k(client, messages):
+    body = {"query": "fehler E1234 datenbank start", "n_results": 2, "score_threshold": 0.1}
+    unfiltered = [r["id"] for r in client.post("/query", json=body).json()["results"]]
+    assert len(unfiltered) == 2 and all(id_.startswith("s2-") for id_ in unfiltered)
+    # Der Treffer aus s1 liegt weit hinter den Top 2 und wird trotzdem gefunden
+    only_s1 = client.post("/query", json=dict(body, session_id="s1")).json()["results"]
+    assert [r["id"] for r in only_s1] == ["s1-0"]
+    by_sender = client.post("/query", json=dict(body, sender="assistant")).json()["results"]
+    assert [r["id"] for r in by_sender] == ["s1-0"]
+    by_time = client.post("/query", json=dict(body, since="2025-01-02T00:00:00", until="2025-01-02T12:00:00")).json()
+    assert [r["id"] for r in by_time["results"]] == ["s1-0"]
+
+
+def test_hits_of_deleted_sessions_are_dropped(client, messages):
+    body = {"query": "fehler E1234 datenbank start", "n_results": 12, "score_threshold": 0.0}
+    ids = [r["id"] for r in client.post("/query", json=body).json()["results"]]
+    assert "ghost-0" not in ids and len(ids) == 11
+
+
+def test_batch_query_embeds_once_and_keeps_order(client, messages, monkeypatch):
+    calls = []
+    embed_many = embedding_service.embed_many
+
+    def counting(texts):
+        calls.append(list(texts))
+        return embed_many(texts)
+
+    monkeypatch.setattr(embedding_service, "embed_many", counting)
+    body = {"queries": ["fehler in der datenbank", "fehler E1234 datenbank start 3"], "n_results": 1,
+            "score_threshold": 0.1}
+    results = client.post("/query/batch", json=body).json()["results"]
+    assert [r["results"][0]["id"] for r in results] == ["s1-0", "s2-3"]
+    assert calls == [body["queries"]]
+    assert client.post("/query/batch", json={"queries": []}).status_code == 422
@@ -0,0 +1,118 @@
+from datetime import datetime
+
+import pytest
+
+from app.services import db as db_module
+from app.services import reindex as reindex_module
+from app.services import vector_db
+from app.services.db import ChatHistory, ReindexChange, ReindexJob, SessionLocal
+from app.services.embedding import embedding_service
+from app.services.reindex import Reindexer
+
+IDS = ["h1", "h2", "h3", "h4", "h5"]
+
+
+def _add(ids):
+    texts = [f"frage {id_}" for id_ in ids]
+    vector_db.add_many(texts, embedding_service.embed_many(texts), [{"id": id_} for id_ in ids])
+
+
+def _count(model):
+    db = SessionLocal()
+    try:
+        return db.query(model).count()
+    finally:
+        db.close()
+
+
+def _job(job_id):
+    db = SessionLocal()
+    try:
+        return db.get(ReindexJob, job_id)
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def history(monkeypatch):
+    monkeypatch.setattr(vector_db, "VECTOR_ACTIVE_CHECK_INTERVAL", 0)
+    monkeypatch.setattr(reindex_module, "REINDEX_CHUNK_SIZE", 2)
+    db = SessionLocal()
+    try:
+        for id_ in IDS:
+            db.add(ChatHistory(id=id_, prompt=f"frage {id_}", response="antwort", timestamp=datetime(2025, 1, 1)))
+        db.commit()
+    finally:
+        db.close()
+    _add(IDS)
+
+
+def test_writes_during_run_reach_new_collection(history):
+    reindexer = Reindexer()
+    job_id = reindexer.prepare()
+    calls = []
+
+    def during_run(status):
+        calls.append(status["processed"])
+        if len(calls) == 1:
+            # Hinter dem Cursor (alter Zeitstempel/ID), eine schon übernommene Löschung, eine voraus
+            _add(["h0"])
+            vector_db.delete_many(["h1", "h4"])
+            db = SessionLocal()
+            try:
+                db.query(ChatHistory).filter_by(id="h4").delete()
+                db.commit()
+            finally:
+                db.close()
+
+    result = reindexer.run(job_id, progress=during_run)
+    assert result["status"] == "done"
+    assert vector_db._store_collection == result["collection"]
+    assert set(vector_db.get_embeddings(["h0"] + IDS)) == {"h0", "h2", "h3", "h5"}
+    assert vector_db.get_store().count() == 4
+    assert _count(ReindexChange) == 0
+
+
+def test_paused_job_keeps_journal_and_resumes(history):
+    reindexer = Reindexer()
+    job_id = reindexer.prepare()
+    result = reindexer.run(job_id, progress=lambda status: reindexer.cancel())
+    assert (result["status"], result["processed"]) == ("paused", 2)
+    _add(["spaet"])
+    assert _count(ReindexChange) == 1
+
+    reindexer._cancel.clear()
+    assert reindexer.prepare() == job_id
+    result = reindexer.run(job_id)
+    assert (result["status"], result["processed"]) == ("done", 5)
+    assert set(vector_db.get_embeddings(["spaet"] + IDS)) == {"spaet"} | set(IDS)
+
+
+def test_failed_job_stops_journaling_and_is_restarted(history):
+    reindexer = Reindexer()
+    job_id = reindexer.prepare()
+
+    def fail(status):
+        raise RuntimeError("Embedding-Modell weg")
+
+    with pytest.raises(RuntimeError):
+        reindexer.run(job_id, progress=fail)
+    assert _job(job_id).status == "failed"
+    _add(["danach"])
+    assert _count(ReindexChange) == 0
+    # Ohne --restart neu begonnen statt fortgesetzt
+    new_id = reindexer.prepare()
+    assert new_id != job_id
+    assert _job(job_id).status == "abandoned"
+
+
+def test_writes_without_job_skip_the_database(monkeypatch):
+    vector_db.get_store()
+
+    def no_db():
+        raise AssertionError("DB-Zugriff beim Schreiben")
+
+    monkeypatch.setattr(db_module, "SessionLocal", no_db)
+    _add(["a", "b"])
+    vector_db.delete_many(["a"])
+    assert set(vector_db.get_embeddings(["a", "b"])) == {"b"}
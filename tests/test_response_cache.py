@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from app.services import response_cache as cache_module
+from app.services.response_cache import SemanticResponseCache
+
+DIM = 8
+
+
+def _vector(i, noise=0.0):
+    vector = np.zeros(DIM, dtype=np.float32)
+    vector[i % DIM] = 1.0
+    vector[(i + 1) % DIM] = noise
+    return vector.tolist()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    return now
+
+
+def test_similar_prompt_hits_and_buckets_are_separate():
+    cache = SemanticResponseCache(threshold=0.95, ttl=60, max_entries=10)
+    cache.store("m", "v1", _vector(0), "antwort")
+    response, score = cache.lookup("m", "v1", _vector(0, noise=0.1))
+    assert response == "antwort" and score == pytest.approx(1 / np.sqrt(1.01), rel=1e-5)
+    assert cache.lookup("m", "v1", _vector(0, noise=1.0)) is None
+    assert cache.lookup("m", "v2", _vector(0)) is None
+    assert cache.lookup("anderes", "v1", _vector(0)) is None
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = SemanticResponseCache(threshold=0.9, ttl=60, max_entries=10)
+    cache.store("m", "v", _vector(0), "alt")
+    clock[0] += 30
+    cache.store("m", "v", _vector(1), "neu")
+    clock[0] += 40
+    assert cache.lookup("m", "v", _vector(0)) is None
+    assert cache.lookup("m", "v", _vector(1))[0] == "neu"
+    assert cache._size == 1
+
+
+def test_oldest_entry_is_evicted_across_buckets(clock):
+    cache = SemanticResponseCache(threshold=0.9, ttl=600, max_entries=2)
+    for i, (model, response) in enumerate([("a", "erste"), ("b", "zweite"), ("a", "dritte")]):
+        clock[0] += 1
+        cache.store(model, "v", _vector(i), response)
+    assert cache.lookup("a", "v", _vector(0)) is None
+    assert cache.lookup("b", "v", _vector(1))[0] == "zweite"
+    assert cache.lookup("a", "v", _vector(2))[0] == "dritte"
+
+
+def test_store_writes_into_the_preallocated_matrix(clock):
+    cache = SemanticResponseCache(threshold=0.9, ttl=100, max_entries=1000)
+    cache.store("m", "v", _vector(0), "0")
+    bucket = cache._buckets[("m", "v")]
+    rows = bucket._rows
+    for i in range(1, 10):
+        cache.store("m", "v", _vector(i), str(i))
+    # Innerhalb der Kapazität kein Neuaufbau, die Matrix ist eine Sicht auf dasselbe Array
+    assert bucket._rows is rows and np.shares_memory(bucket.matrix(), rows)
+    assert bucket.matrix().shape == (10, DIM)
+
+
+def test_matrix_stays_aligned_with_responses_through_growth_and_expiry(clock):
+    cache = SemanticResponseCache(threshold=0.99, ttl=50, max_entries=1000)
+    for i in range(100):
+        clock[0] += 1
+        vector = np.zeros(100, dtype=np.float32)
+        vector[i] = 1.0
+        cache.store("m", "v", vector, f"antwort {i}")
+    bucket = cache._buckets[("m", "v")]
+    # Nur die Einträge der letzten 50 Sekunden sind noch gültig, der Offset überspringt die verfallenen Zeilen
+    assert len(bucket) == 51 and bucket.matrix().shape == (51, 100)
+    for i in (48, 49, 75, 99):
+        query = np.zeros(100, dtype=np.float32)
+        query[i] = 1.0
+        hit = cache.lookup("m", "v", query)
+        assert (hit[0] if hit else None) == (f"antwort {i}" if i >= 49 else None)
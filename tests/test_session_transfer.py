@@ -0,0 +1,84 @@
+import json
+
+import numpy as np
+import pytest
+
+from app.services import vector_db
+from app.services.db import ChatMessage, ChatSession, SessionLocal
+
+
+def _create_sessions(client):
+    ids = []
+    for title, texts in (("erste", ["hallo welt", "wie geht es"]), ("zweite", ["fehler E1234 im log"])):
+        session_id = client.post("/sessions", json={"title": title}).json()["id"]
+        for i, text in enumerate(texts):
+            sender = "user" if i % 2 == 0 else "assistant"
+            assert client.post(f"/sessions/{session_id}/message", json={"sender": sender, "text": text}).status_code == 200
+        ids.append(session_id)
+    return ids
+
+
+def _snapshot():
+    db = SessionLocal()
+    try:
+        sessions = {s.id: (s.title, s.created_at, s.message_count, s.last_message_at)
+                    for s in db.query(ChatSession)}
+        messages = {m.id: (m.session_id, m.sender, m.text, m.timestamp) for m in db.query(ChatMessage)}
+    finally:
+        db.close()
+    return sessions, messages
+
+
+def _vectors(message_ids):
+    # Nachrichten werden per BackgroundTasks eingebettet; der TestClient wartet auf sie
+    vectors = vector_db.get_embeddings(message_ids)
+    assert set(vectors) == set(message_ids)
+    return {k: np.asarray(v) for k, v in vectors.items()}
+
+
+@pytest.mark.parametrize("fmt", ["ndjson", "columnar"])
+def test_export_import_round_trip(client, fmt):
+    session_ids = _create_sessions(client)
+    sessions, messages = _snapshot()
+    vectors = _vectors(list(messages))
+
+    export = client.get("/sessions/export", params={"format": fmt})
+    assert export.status_code == 200
+    for session_id in session_ids:
+        client.delete(f"/sessions/{session_id}")
+    assert _snapshot() == ({}, {})
+    assert vector_db.get_embeddings(list(messages)) == {}
+
+    # embed=false: nur die mitgelieferten Embeddings, nichts wird neu berechnet
+    imported = client.post("/sessions/import", params={"format": fmt, "embed": "false"}, content=export.content)
+    assert imported.json() == {"success": True, "sessions": 2, "messages": 3, "skipped_sessions": 0,
+                               "skipped_messages": 0, "vectors": 3, "embedded": 0}
+    assert _snapshot() == (sessions, messages)
+    restored = vector_db.get_embeddings(list(messages))
+    assert all(np.allclose(restored[k], v) for k, v in vectors.items())
+
+    # Zweiter Import: vorhandene Sessions bleiben unverändert
+    again = client.post("/sessions/import", params={"format": fmt}, content=export.content).json()
+    assert (again["sessions"], again["skipped_sessions"], again["skipped_messages"]) == (0, 2, 3)
+
+
+def test_ndjson_zero_vectors_are_recomputed(client):
+    lines = [
+        {"type": "session", "id": "s1", "title": "alt", "created_at": "2025-03-01T00:00:00+02:00"},
+        {"type": "message", "id": "m1", "session_id": "s1", "sender": "user", "text": "hallo welt",
+         "timestamp": "2025-03-01T00:00:00+02:00", "embedding": [0.0] * 384},
+    ]
+    body = "\n".join(json.dumps(line) for line in lines).encode("utf-8")
+    result = client.post("/sessions/import", content=body).json()
+    assert result["success"] and result["embedded"] == 1
+    assert np.any(vector_db.get_embeddings(["m1"])["m1"])
+    sessions, messages = _snapshot()
+    # Zeitzonen werden in naive UTC umgerechnet
+    assert sessions["s1"][1].isoformat() == "2025-02-28T22:00:00"
+    assert messages["m1"][3].isoformat() == "2025-02-28T22:00:00"
+
+
+def test_columnar_rejects_foreign_data(client):
+    response = client.post("/sessions/import", params={"format": "columnar"}, content=b"kein export")
+    assert response.status_code == 400
+    assert response.json()["error"] == "Kein Export im Spaltenformat"
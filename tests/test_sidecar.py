@@ -0,0 +1,112 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pytest
+
+from app.services import sidecar
+from app.services.embedding import embedding_service
+from app.services.sidecar import SidecarClient, SidecarServer, _Coalescer, wait_ready
+from app.services.vector_store.remote_store import RemoteVectorStore
+
+COLLECTION = "sidecar_test"
+
+
+@contextmanager
+def _running(path):
+    server = SidecarServer(path)
+    thread = threading.Thread(target=asyncio.run, args=(server.serve(),), daemon=True)
+    thread.start()
+    wait_ready(path, timeout=10)
+    try:
+        yield server
+    finally:
+        server.stop()
+        thread.join(10)
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    return str(tmp_path / "sidecar.sock")
+
+
+@pytest.fixture
+def sidecar_client(socket_path):
+    client = SidecarClient(socket_path, timeout=10, pool_size=4)
+    yield client
+    client.close()
+
+
+def test_embed_and_store_round_trip(socket_path, sidecar_client):
+    texts = ["hallo welt", "fehler E1234"]
+    with _running(socket_path) as server:
+        vectors = sidecar_client.embed(embedding_service.model_name, texts)
+        assert np.allclose(vectors, embedding_service.embed_many(texts), atol=1e-6)
+
+        store = RemoteVectorStore(sidecar_client, COLLECTION)
+        store.add(["a", "b"], texts, vectors, [{"id": "a", "session_id": "s1"}, {"id": "b", "session_id": "s2"}])
+        assert store.count() == 2
+        result = store.query(vectors, 1, where={"session_id": "s2"})
+        assert result["ids"] == [["b"], ["b"]]
+        assert result["documents"][1] == ["fehler E1234"]
+        assert set(store.get_embeddings(["a", "x"])) == {"a"}
+        store.delete(["a"])
+        assert store.count() == 1
+        # Query-Coalescer je Filter werden nach dem Aufruf wieder entfernt
+        assert server._queries == {}
+
+
+def test_errors_are_reported_to_the_client(socket_path, sidecar_client):
+    with _running(socket_path):
+        with pytest.raises(sidecar.SidecarError, match="Unbekannte Operation"):
+            sidecar_client.call("gibt_es_nicht", collection=COLLECTION)
+        # Die Verbindung bleibt danach nutzbar
+        assert sidecar_client.ping()["ok"]
+
+
+def test_reconnects_after_sidecar_restart(socket_path, sidecar_client):
+    with _running(socket_path):
+        # Mehrere Verbindungen im Pool, die mit dem Sidecar sterben
+        for _ in range(3):
+            sidecar_client._idle.put_nowait(sidecar_client._connect())
+        first = sidecar_client.ping()["pid"]
+    with _running(socket_path):
+        assert sidecar_client.ping()["pid"] == first
+        assert sidecar_client.embed(embedding_service.model_name, ["nach neustart"])
+
+
+def test_coalescer_batches_requests_while_busy():
+    calls = []
+
+    async def main():
+        gate = asyncio.Event()
+        idle = []
+
+        async def run(items):
+            calls.append(items)
+            await gate.wait()
+            return [item * 10 for item in items]
+
+        coalescer = _Coalescer(run, max_inflight=1, max_items=10, on_idle=lambda: idle.append(True))
+        first = asyncio.ensure_future(coalescer.submit(1, 1))
+        await asyncio.sleep(0)
+        rest = [asyncio.ensure_future(coalescer.submit(i, 1)) for i in (2, 3, 4)]
+        await asyncio.sleep(0)
+        gate.set()
+        results = await asyncio.gather(first, *rest)
+        return results, idle
+
+    results, idle = asyncio.run(main())
+    assert results == [10, 20, 30, 40]
+    assert calls == [[1], [2, 3, 4]]
+    assert idle == [True]
+
+
+def test_model_limit_includes_default_model(socket_path):
+    server = SidecarServer(socket_path)
+    default = embedding_service.model_name
+    for name in ("modell-a", "modell-b", "modell-c"):
+        server._service(name)
+        assert len(server._services) <= server.MAX_MODELS
+    assert list(server._services) == [default, "modell-c"]